@@ -0,0 +1,404 @@
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Iterable, Iterator, Tuple
+from dataclasses import dataclass
+from enum import Enum
+
+from agents.mimic_human import RealTimeWearableData
+from agents.fleet import TRANSITION_INDEX
+
+
+class EpisodeType(Enum):
+    """Emergency episodes that can be injected into a wearable stream"""
+    CARDIAC_ARREST = "cardiac_arrest"
+    ARRHYTHMIA = "arrhythmia"
+    SYNCOPE_FALL = "syncope_fall"
+    RESPIRATORY_DISTRESS = "respiratory_distress"
+
+
+@dataclass
+class Episode:
+    """A scheduled emergency episode with its ground-truth onset"""
+    episode_id: str
+    user_id: str
+    episode_type: EpisodeType
+    onset: datetime
+    duration_seconds: float = 180.0
+    severity: float = 1.0       # 0-1, scales how far vitals move from normal
+    ramp_seconds: float = 15.0  # time for vitals to reach episode values
+
+    @property
+    def end(self) -> datetime:
+        return self.onset + timedelta(seconds=self.duration_seconds)
+
+    def to_label(self) -> Dict[str, Any]:
+        return {
+            "episode_id": self.episode_id,
+            "user_id": self.user_id,
+            "episode": self.episode_type.value,
+            "onset": self.onset.isoformat(),
+            "end": self.end.isoformat(),
+            "severity": self.severity,
+        }
+
+
+def _blend(value: float, target: float, weight: float) -> float:
+    return value + (target - value) * weight
+
+
+def _apply_cardiac_arrest(metrics: Dict[str, Any], weight: float, elapsed: float,
+                          rng: random.Random) -> None:
+    # Pulse is lost: optical HR collapses, BP and breathing stop, SpO2 falls steadily
+    metrics['heart_rate'] = round(_blend(metrics['heart_rate'], rng.uniform(0, 8), weight))
+    metrics['hrv'] = round(_blend(metrics['hrv'], 0, weight), 1)
+    metrics['systolic_bp'] = round(_blend(metrics['systolic_bp'], rng.uniform(0, 30), weight))
+    metrics['diastolic_bp'] = round(_blend(metrics['diastolic_bp'], rng.uniform(0, 15), weight))
+    metrics['respiratory_rate'] = round(_blend(metrics['respiratory_rate'], rng.uniform(0, 4), weight))
+    spo2_floor = max(60.0, 98.0 - 0.25 * elapsed)
+    metrics['blood_oxygen'] = round(_blend(metrics['blood_oxygen'], spo2_floor, weight), 1)
+
+
+def _apply_arrhythmia(metrics: Dict[str, Any], weight: float, elapsed: float,
+                      rng: random.Random) -> None:
+    # Irregular, fast ventricular response with very high beat-to-beat variability
+    metrics['heart_rate'] = round(_blend(metrics['heart_rate'], rng.uniform(110, 190), weight))
+    metrics['hrv'] = round(_blend(metrics['hrv'], rng.uniform(110, 180), weight), 1)
+    metrics['systolic_bp'] = round(_blend(metrics['systolic_bp'], rng.uniform(90, 150), weight))
+    metrics['blood_oxygen'] = round(_blend(metrics['blood_oxygen'], rng.uniform(93, 96), weight), 1)
+
+
+def _apply_syncope_fall(metrics: Dict[str, Any], weight: float, elapsed: float,
+                        rng: random.Random) -> None:
+    # Vasovagal drop in HR and BP, then slow recovery while lying still
+    recovery = min(1.0, elapsed / 120.0)
+    metrics['heart_rate'] = round(_blend(metrics['heart_rate'], rng.uniform(35, 45) + 25 * recovery, weight))
+    metrics['systolic_bp'] = round(_blend(metrics['systolic_bp'], rng.uniform(70, 85) + 20 * recovery, weight))
+    metrics['diastolic_bp'] = round(_blend(metrics['diastolic_bp'], rng.uniform(40, 50) + 15 * recovery, weight))
+    metrics['blood_oxygen'] = round(_blend(metrics['blood_oxygen'], rng.uniform(94, 97), weight), 1)
+    metrics['respiratory_rate'] = round(_blend(metrics['respiratory_rate'], rng.uniform(8, 12), weight))
+
+
+def _apply_respiratory_distress(metrics: Dict[str, Any], weight: float, elapsed: float,
+                                rng: random.Random) -> None:
+    # Rapid shallow breathing, desaturation and compensatory tachycardia
+    metrics['respiratory_rate'] = round(_blend(metrics['respiratory_rate'], rng.uniform(30, 42), weight))
+    metrics['blood_oxygen'] = round(_blend(metrics['blood_oxygen'], rng.uniform(82, 89), weight), 1)
+    metrics['heart_rate'] = round(_blend(metrics['heart_rate'], rng.uniform(115, 140), weight))
+    metrics['hrv'] = round(_blend(metrics['hrv'], rng.uniform(10, 20), weight), 1)
+    metrics['stress_level'] = round(_blend(metrics['stress_level'], rng.uniform(80, 100), weight))
+
+
+EPISODE_EFFECTS = {
+    EpisodeType.CARDIAC_ARREST: _apply_cardiac_arrest,
+    EpisodeType.ARRHYTHMIA: _apply_arrhythmia,
+    EpisodeType.SYNCOPE_FALL: _apply_syncope_fall,
+    EpisodeType.RESPIRATORY_DISTRESS: _apply_respiratory_distress,
+}
+
+# Metrics written back into the generator so the episode persists between
+# ticks and recovery afterwards follows the normal smooth transitions
+_STATE_METRICS = (
+    'heart_rate', 'hrv', 'blood_oxygen', 'stress_level',
+    'systolic_bp', 'diastolic_bp', 'respiratory_rate'
+)
+
+
+def random_episodes(rng: random.Random, rate_per_hour: float, horizon_seconds: float,
+                    types: List[EpisodeType], duration_range: Tuple[float, float],
+                    severity_range: Tuple[float, float]) -> Iterator[Tuple[float, EpisodeType, float, float]]:
+    """Poisson-distributed, non-overlapping (seconds from now, type, duration, severity)"""
+    if rate_per_hour <= 0:
+        return
+    offset = 0.0
+    while True:
+        offset += rng.expovariate(rate_per_hour / 3600.0)
+        if offset >= horizon_seconds:
+            return
+        episode_type = rng.choice(types)
+        duration = rng.uniform(*duration_range)
+        yield offset, episode_type, duration, rng.uniform(*severity_range)
+        # Episodes don't overlap
+        offset += duration
+
+
+def overlay_episode(data: Dict[str, Any], episode: Episode, now: datetime,
+                    rng: random.Random, max_hr: float) -> None:
+    """Pull a data point's vitals towards the episode pattern and label it"""
+    elapsed = (now - episode.onset).total_seconds()
+    weight = episode.severity * min(1.0, elapsed / episode.ramp_seconds if episode.ramp_seconds else 1.0)
+    metrics = data["physiological_metrics"]
+    EPISODE_EFFECTS[episode.episode_type](metrics, weight, elapsed, rng)
+    metrics['exertion_level'] = round(max(0.0, min(100.0, metrics['heart_rate'] / max_hr * 100)), 1)
+    data["ground_truth"] = {
+        "episode_id": episode.episode_id,
+        "episode": episode.episode_type.value,
+        "onset": episode.onset.isoformat(),
+        "seconds_since_onset": round(elapsed, 3),
+    }
+
+
+class EpisodeInjector:
+    """
+    Injects labeled emergency episodes into a RealTimeWearableData stream.
+
+    Wraps an existing generator: normal data comes from the generator, and
+    while an episode is active its vitals are pulled towards the episode's
+    pattern. Every data point carries a "ground_truth" block with the active
+    episode and its true onset, using the generator's clock.
+    """
+
+    def __init__(self, generator: RealTimeWearableData, seed: Optional[int] = None):
+        self.generator = generator
+        self.rng = random.Random(seed)
+        self.episodes: List[Episode] = []
+        # schedule_random arguments and the end of its current horizon, to roll it forward
+        self._random: Optional[Dict[str, Any]] = None
+        self._scheduled_until: Optional[datetime] = None
+
+    @property
+    def user_id(self) -> str:
+        return self.generator.user_profile.user_id
+
+    def schedule(self, episode_type: EpisodeType,
+                 onset: Optional[datetime] = None,
+                 after_seconds: float = 0.0,
+                 duration_seconds: float = 180.0,
+                 severity: float = 1.0,
+                 ramp_seconds: float = 15.0) -> Episode:
+        """
+        Schedule an episode.
+
+        Args:
+            episode_type: Kind of emergency to inject
+            onset: Absolute onset time (defaults to now + after_seconds on the generator clock)
+            after_seconds: Delay from now when onset is not given
+            duration_seconds: How long the episode lasts
+            severity: 0-1 scale of the deviation from normal vitals
+            ramp_seconds: Time for vitals to reach the episode pattern
+
+        Returns:
+            The scheduled Episode (its onset is the ground-truth label)
+        """
+        if onset is None:
+            onset = self.generator.clock.now() + timedelta(seconds=after_seconds)
+        episode = Episode(
+            episode_id=f"{self.user_id}-{len(self.episodes) + 1}",
+            user_id=self.user_id,
+            episode_type=episode_type,
+            onset=onset,
+            duration_seconds=duration_seconds,
+            severity=max(0.0, min(1.0, severity)),
+            ramp_seconds=ramp_seconds,
+        )
+        self.episodes.append(episode)
+        self.episodes.sort(key=lambda e: e.onset)
+        return episode
+
+    def schedule_random(self, rate_per_hour: float, horizon_seconds: float,
+                        types: Optional[Iterable[EpisodeType]] = None,
+                        duration_range: Tuple[float, float] = (60.0, 300.0),
+                        severity_range: Tuple[float, float] = (0.6, 1.0),
+                        start: Optional[datetime] = None) -> List[Episode]:
+        """
+        Schedule Poisson-distributed episodes over the horizon_seconds from
+        start (default: now), and again over every following horizon once the
+        stream reaches its end.
+        """
+        if start is None:
+            start = self.generator.clock.now()
+        types = list(types) if types is not None else list(EpisodeType)
+        self._random = {"rate_per_hour": rate_per_hour, "horizon_seconds": horizon_seconds, "types": types,
+                        "duration_range": duration_range, "severity_range": severity_range}
+        self._scheduled_until = start + timedelta(seconds=horizon_seconds)
+        return [
+            self.schedule(episode_type, onset=start + timedelta(seconds=offset),
+                          duration_seconds=duration, severity=severity)
+            for offset, episode_type, duration, severity in random_episodes(
+                self.rng, rate_per_hour, horizon_seconds, types, duration_range, severity_range)
+        ]
+
+    def _extend_schedule(self, now: datetime) -> None:
+        """Schedule the next random horizon once now has reached the end of the current one"""
+        if self._scheduled_until is None or now < self._scheduled_until:
+            return
+        # Not before the last episode ends, so episodes never overlap
+        start = max([self._scheduled_until] + [episode.end for episode in self.episodes[-1:]])
+        self.schedule_random(start=start, **self._random)
+
+    def active_episode(self, now: datetime) -> Optional[Episode]:
+        for episode in self.episodes:
+            if episode.onset > now:
+                break
+            if now < episode.end:
+                return episode
+        return None
+
+    def generate_realtime_data(self, activity: str = None,
+                               duration_seconds: int = 1) -> Dict[str, Any]:
+        """Generate a data point like RealTimeWearableData, with episode overlay and ground truth"""
+        data = self.generator.generate_realtime_data(activity, duration_seconds)
+        now = datetime.fromisoformat(data["timestamp"])
+        self._extend_schedule(now)
+        episode = self.active_episode(now)
+
+        if episode is None:
+            data["ground_truth"] = {"episode": None}
+            return data
+
+        overlay_episode(data, episode, now, self.rng, self.generator.params.max_hr_estimate)
+        metrics = data["physiological_metrics"]
+        state = self.generator.current_state
+        for metric in _STATE_METRICS:
+            setattr(state, metric, metrics[metric])
+        return data
+
+    def labels(self) -> List[Dict[str, Any]]:
+        """Ground-truth labels for every scheduled episode"""
+        return [episode.to_label() for episode in self.episodes]
+
+
+class FleetEpisodeInjector:
+    """
+    EpisodeInjector for a WearableFleet (sharded mode): every user added gets
+    random episodes over horizon_seconds, rolled forward one horizon at a time
+    as the stream reaches its end, and apply() overlays them on the fleet's
+    payloads and writes the vitals back into the fleet state. Labels of newly
+    scheduled episodes collect in new_labels until the shard reports them.
+    """
+
+    def __init__(self, fleet: Any, rate_per_hour: float, horizon_seconds: float,
+                 seed: Optional[int] = None,
+                 types: Optional[Iterable[EpisodeType]] = None,
+                 duration_range: Tuple[float, float] = (60.0, 300.0),
+                 severity_range: Tuple[float, float] = (0.6, 1.0)):
+        self.fleet = fleet
+        self.rate_per_hour = rate_per_hour
+        self.horizon_seconds = horizon_seconds
+        self.rng = random.Random(seed)
+        self.types = list(types) if types is not None else list(EpisodeType)
+        self.duration_range = duration_range
+        self.severity_range = severity_range
+        self._state_columns = [(metric, TRANSITION_INDEX[metric]) for metric in _STATE_METRICS]
+        self.pending: Dict[str, List[Episode]] = {}    # user_id -> episodes not over yet, by onset
+        self.until: Dict[str, datetime] = {}           # user_id -> end of the scheduled horizon
+        self._numbers: Dict[str, int] = {}             # user_id -> episodes scheduled so far (ids stay unique)
+        self.new_labels: List[Dict[str, Any]] = []     # labels not reported to the parent yet
+        self.scheduled = 0
+
+    def _schedule(self, user_id: str, start: datetime) -> None:
+        episodes = self.pending.setdefault(user_id, [])
+        if episodes:
+            # Not before the last episode ends, so episodes never overlap
+            start = max(start, episodes[-1].end)
+        number = self._numbers.get(user_id, 0)
+        for offset, episode_type, duration, severity in random_episodes(
+                self.rng, self.rate_per_hour, self.horizon_seconds, self.types,
+                self.duration_range, self.severity_range):
+            number += 1
+            episode = Episode(episode_id=f"{user_id}-{number}", user_id=user_id, episode_type=episode_type,
+                              onset=start + timedelta(seconds=offset), duration_seconds=duration,
+                              severity=severity)
+            episodes.append(episode)
+            self.new_labels.append(episode.to_label())
+        self.scheduled += number - self._numbers.get(user_id, 0)
+        self._numbers[user_id] = number
+        self.until[user_id] = start + timedelta(seconds=self.horizon_seconds)
+
+    def add_users(self, user_ids: Iterable[str]) -> None:
+        now = self.fleet.clock.now()
+        for user_id in user_ids:
+            self._schedule(user_id, now)
+
+    def remove_users(self, user_ids: Iterable[str]) -> None:
+        for user_id in user_ids:
+            self.pending.pop(user_id, None)
+            self.until.pop(user_id, None)
+
+    def apply(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Add ground truth to a fleet payload, and the episode overlay while one is active"""
+        user_id = data["user_id"]
+        until = self.until.get(user_id)
+        if until is None:
+            data["ground_truth"] = {"episode": None}
+            return data
+        now = datetime.fromisoformat(data["timestamp"])
+        if now >= until:
+            self._schedule(user_id, until)
+        episodes = self.pending[user_id]
+        while episodes and now >= episodes[0].end:
+            episodes.pop(0)
+        if not episodes or episodes[0].onset > now:
+            data["ground_truth"] = {"episode": None}
+            return data
+
+        row = self.fleet.user_index[user_id]
+        overlay_episode(data, episodes[0], now, self.rng, float(self.fleet.max_hr[row]))
+        metrics = data["physiological_metrics"]
+        for metric, column in self._state_columns:
+            self.fleet.state[row, column] = metrics[metric]
+        return data
+
+
+def evaluate_detections(episodes: Iterable[Episode],
+                        alerts: Iterable[Tuple[str, datetime]],
+                        max_latency_seconds: float = 60.0) -> Dict[str, Any]:
+    """
+    Score alerts against ground-truth episodes.
+
+    Args:
+        episodes: Injected episodes
+        alerts: (user_id, alert time) pairs raised by the pipeline
+        max_latency_seconds: Alerts later than this after onset count as misses
+
+    Returns:
+        Detection rate, time-to-alert statistics and false-alarm count
+    """
+    by_user: Dict[str, List[Episode]] = {}
+    for episode in episodes:
+        by_user.setdefault(episode.user_id, []).append(episode)
+
+    latencies: Dict[str, float] = {}
+    false_alarms = 0
+    for user_id, alert_time in sorted(alerts, key=lambda alert: alert[1]):
+        matched = False
+        for episode in by_user.get(user_id, []):
+            window_end = episode.onset + timedelta(seconds=max(episode.duration_seconds, max_latency_seconds))
+            if episode.onset <= alert_time <= window_end:
+                matched = True
+                latency = (alert_time - episode.onset).total_seconds()
+                if latency <= max_latency_seconds and episode.episode_id not in latencies:
+                    latencies[episode.episode_id] = latency
+                break
+        if not matched:
+            false_alarms += 1
+
+    total = sum(len(user_episodes) for user_episodes in by_user.values())
+    values = sorted(latencies.values())
+    return {
+        "episodes": total,
+        "detected": len(values),
+        "detection_rate": round(len(values) / total, 3) if total else None,
+        "mean_time_to_alert": round(sum(values) / len(values), 3) if values else None,
+        "p95_time_to_alert": values[min(len(values) - 1, int(0.95 * len(values)))] if values else None,
+        "false_alarms": false_alarms,
+        "latencies": latencies,
+    }
+
+
+# Example usage
+if __name__ == "__main__":
+    from agents.mimic_human import UserProfile, AcceleratedClock, Activity
+
+    clock = AcceleratedClock(speed=60)
+    generator = RealTimeWearableData(UserProfile(user_id="EPISODE_001", age=62), clock=clock)
+    injector = EpisodeInjector(generator, seed=1)
+    injector.schedule(EpisodeType.CARDIAC_ARREST, after_seconds=30, duration_seconds=120)
+
+    print("🚑 Cardiac arrest scheduled:", injector.labels())
+    import time
+    for _ in range(8):
+        point = injector.generate_realtime_data(Activity.RESTING.value)
+        vitals = point["physiological_metrics"]
+        print(f"   {point['timestamp']} HR={vitals['heart_rate']} SpO2={vitals['blood_oxygen']} "
+              f"RR={vitals['respiratory_rate']} truth={point['ground_truth'].get('episode')}")
+        time.sleep(0.25)
@@ -1,9 +1,11 @@
 import time
 import random
+from abc import ABC, abstractmethod
 import numpy as np
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
+from functools import lru_cache
 from enum import Enum
 import json
 
@@ -30,140 +32,341 @@ class UserProfile:
     fitness_level: str = "average"  # low, average, high
 
 
+# Activity-specific physiological ranges shared by every generator.
+# Calorie burn is expressed as a multiple of the user's BMR per second.
+ACTIVITY_RANGES: Dict[str, Dict[str, Any]] = {
+    Activity.RESTING.value: {
+        'heart_rate': (58, 76),
+        'steps_per_second': 0,
+        'bmr_multiplier': 1.1,
+        'stress_range': (15, 35),
+        'temperature_range': (36.3, 36.8),
+        'respiratory_range': (12, 16),
+        'blood_pressure': ((108, 122), (68, 82)),
+        'blood_oxygen_range': (97.5, 100),
+        'hrv_range': (40, 60)
+    },
+    Activity.WALKING.value: {
+        'heart_rate': (88, 112),
+        'steps_per_second': 1.8,
+        'bmr_multiplier': 3.5,
+        'stress_range': (22, 42),
+        'temperature_range': (36.6, 37.1),
+        'respiratory_range': (16, 22),
+        'blood_pressure': ((112, 128), (72, 86)),
+        'blood_oxygen_range': (96.5, 99.5),
+        'hrv_range': (35, 55)
+    },
+    Activity.RUNNING.value: {
+        'heart_rate': (135, 175),
+        'steps_per_second': 4.2,
+        'bmr_multiplier': 8.5,
+        'stress_range': (45, 75),
+        'temperature_range': (36.9, 37.6),
+        'respiratory_range': (28, 48),
+        'blood_pressure': ((125, 155), (78, 98)),
+        'blood_oxygen_range': (94.5, 98.5),
+        'hrv_range': (25, 45)
+    },
+    Activity.EXERCISING.value: {
+        'heart_rate': (125, 165),
+        'steps_per_second': 2.8,
+        'bmr_multiplier': 7.0,
+        'stress_range': (55, 85),
+        'temperature_range': (37.0, 37.7),
+        'respiratory_range': (24, 42),
+        'blood_pressure': ((120, 145), (75, 92)),
+        'blood_oxygen_range': (95.5, 99),
+        'hrv_range': (30, 50)
+    },
+    Activity.SLEEPING.value: {
+        'heart_rate': (48, 62),
+        'steps_per_second': 0,
+        'bmr_multiplier': 0.95,
+        'stress_range': (8, 22),
+        'temperature_range': (36.1, 36.4),
+        'respiratory_range': (9, 13),
+        'blood_pressure': ((102, 115), (62, 72)),
+        'blood_oxygen_range': (98, 100),
+        'hrv_range': (50, 70)
+    },
+    Activity.STRESSED.value: {
+        'heart_rate': (82, 108),
+        'steps_per_second': 0.3,
+        'bmr_multiplier': 2.2,
+        'stress_range': (65, 95),
+        'temperature_range': (36.7, 37.3),
+        'respiratory_range': (18, 26),
+        'blood_pressure': ((122, 142), (80, 95)),
+        'blood_oxygen_range': (97, 99.5),
+        'hrv_range': (20, 40)
+    },
+    Activity.MEDITATION.value: {
+        'heart_rate': (52, 68),
+        'steps_per_second': 0,
+        'bmr_multiplier': 1.05,
+        'stress_range': (3, 18),
+        'temperature_range': (36.2, 36.5),
+        'respiratory_range': (7, 11),
+        'blood_pressure': ((105, 118), (65, 75)),
+        'blood_oxygen_range': (98.5, 100),
+        'hrv_range': (55, 75)
+    }
+}
+
+
+def calculate_bmr(user_profile: UserProfile) -> float:
+    """Calculate Basal Metabolic Rate using Harris-Benedict equation"""
+    if user_profile.gender.upper() == "M":
+        bmr = 88.362 + (13.397 * user_profile.weight_kg) + \
+              (4.799 * user_profile.height_cm) - (5.677 * user_profile.age)
+    else:
+        bmr = 447.593 + (9.247 * user_profile.weight_kg) + \
+              (3.098 * user_profile.height_cm) - (4.330 * user_profile.age)
+    return bmr
+
+
+def personalization_adjustments(user_profile: UserProfile) -> Dict[str, Dict[str, float]]:
+    """Age, gender, and fitness level offsets per metric and activity"""
+    age_factor = user_profile.age / 30
+    high_fitness = user_profile.fitness_level == "high"
+    return {
+        'heart_rate': {
+            Activity.RESTING.value: -0.25 * age_factor,
+            Activity.WALKING.value: -0.15 * age_factor - (5 if high_fitness else 0),
+            Activity.RUNNING.value: -0.1 * age_factor - (8 if high_fitness else 0)
+        },
+        'systolic_bp': {
+            Activity.RESTING.value: 0.4 * age_factor,
+            Activity.STRESSED.value: 0.6 * age_factor,
+            Activity.EXERCISING.value: 0.3 * age_factor
+        }
+    }
+
+
+def circadian_adjustment(metric: str, hour_of_day: float) -> float:
+    """Circadian offset for a metric at a given (fractional) hour of day"""
+    if metric == 'heart_rate':
+        # Lower at night, peaks in afternoon
+        return -4 * np.cos((hour_of_day - 14) * np.pi / 12)
+    elif metric == 'temperature':
+        # Lowest at 4 AM, highest at 6 PM
+        return 0.25 * np.cos((hour_of_day - 18) * np.pi / 12)
+    elif metric == 'stress_level':
+        # Higher during work hours (8 AM - 6 PM)
+        return 8 * (0.5 + 0.5 * np.sin((hour_of_day - 14) * np.pi / 8))
+    return 0
+
+
+# Per-minute circadian offsets, built once and shared by every generator.
+# The formulas use hour + minute / 60, so a minute table is exact.
+MINUTES_PER_DAY = 1440
+CIRCADIAN_TABLES: Dict[str, np.ndarray] = {
+    metric: circadian_adjustment(metric, np.arange(MINUTES_PER_DAY) / 60.0)
+    for metric in ('heart_rate', 'temperature', 'stress_level')
+}
+# Plain-list copies for scalar lookups in the per-user path
+_CIRCADIAN_LISTS: Dict[str, List[float]] = {
+    metric: table.tolist() for metric, table in CIRCADIAN_TABLES.items()
+}
+
+
+def minute_of_day(moment: datetime) -> int:
+    """Index into CIRCADIAN_TABLES for a point in time"""
+    return moment.hour * 60 + moment.minute
+
+
+class Clock(ABC):
+    """Source of (possibly simulated) wall-clock time for generators"""
+
+    @abstractmethod
+    def now(self) -> datetime:
+        ...
+
+
+class RealClock(Clock):
+    """Local wall-clock time, timezone-aware so timestamps carry their UTC offset"""
+
+    def now(self) -> datetime:
+        return datetime.now().astimezone()
+
+
+class OffsetClock(Clock):
+    """Wall-clock time shifted by a fixed offset (e.g. to simulate night time)"""
+
+    def __init__(self, offset: timedelta):
+        self.offset = offset
+
+    def now(self) -> datetime:
+        return datetime.now().astimezone() + self.offset
+
+
+class AcceleratedClock(Clock):
+    """
+    Virtual time running `speed` times faster than real time.
+
+    Starts at `start` (defaults to now) and advances with the monotonic clock,
+    so a 24h circadian cycle replays in 86400 / speed seconds.
+    """
+
+    def __init__(self, speed: float, start: Optional[datetime] = None):
+        self.speed = speed
+        self.start = start if start is not None else datetime.now().astimezone()
+        self._origin = time.monotonic()
+
+    def now(self) -> datetime:
+        elapsed = (time.monotonic() - self._origin) * self.speed
+        return self.start + timedelta(seconds=elapsed)
+
+
+REAL_CLOCK = RealClock()
+
+
+@dataclass(frozen=True)
+class ProfileParameters:
+    """Precomputed per-profile tables shared by every generator with that profile"""
+    activity_profiles: Dict[str, Dict]
+    personalization: Dict[Tuple[str, str], float]  # (metric, activity) -> offset
+    initial_state: Tuple[float, ...]               # PhysiologicalState field order
+    bmr: float
+    bmr_kcal_day: float
+    max_hr_estimate: int
+
+
+@lru_cache(maxsize=65536)
+def _build_profile_parameters(age: int, gender: str, weight_kg: float,
+                              height_cm: float, fitness_level: str) -> ProfileParameters:
+    profile = UserProfile(age=age, gender=gender, weight_kg=weight_kg,
+                          height_cm=height_cm, fitness_level=fitness_level)
+    bmr = calculate_bmr(profile)
+    bmr_per_second = bmr / 86400
+
+    activity_profiles = {}
+    for activity, ranges in ACTIVITY_RANGES.items():
+        activity_profile = {}
+        for key, value in ranges.items():
+            if key == 'bmr_multiplier':
+                activity_profile['calories_per_second'] = bmr_per_second * value
+            else:
+                activity_profile[key] = value
+        activity_profiles[activity] = activity_profile
+
+    personalization = {
+        (metric, activity): adjustment
+        for metric, per_activity in personalization_adjustments(profile).items()
+        for activity, adjustment in per_activity.items()
+    }
+
+    age_adjustment = max(0, (age - 30) * 0.3)
+    gender_hr_adjust = -3 if gender == "F" else 2
+    initial_state = (
+        72 + gender_hr_adjust - age_adjustment,  # heart_rate
+        0,                                       # steps
+        0.0,                                     # calories
+        98.5,                                    # blood_oxygen
+        36.7,                                    # temperature
+        25.0,                                    # stress_level
+        85.0,                                    # sleep_quality
+        118 + (age * 0.2),                       # systolic_bp
+        78,                                      # diastolic_bp
+        15.5,                                    # respiratory_rate
+        45.0,                                    # hrv (Heart Rate Variability)
+        0.8,                                     # recovery_rate
+    )
+
+    return ProfileParameters(
+        activity_profiles=activity_profiles,
+        personalization=personalization,
+        initial_state=initial_state,
+        bmr=bmr,
+        bmr_kcal_day=round(bmr, 1),
+        max_hr_estimate=220 - age,
+    )
+
+
+def get_profile_parameters(user_profile: UserProfile) -> ProfileParameters:
+    """
+    Interned parameters for a profile.
+
+    Generators whose profiles share (age, gender, weight, height, fitness_level)
+    share one ProfileParameters instance; treat it as read-only.
+    """
+    return _build_profile_parameters(
+        user_profile.age, user_profile.gender, user_profile.weight_kg,
+        user_profile.height_cm, user_profile.fitness_level
+    )
+
+
+class PhysiologicalState:
+    """Current physiological state of one simulated user, used for smooth transitions"""
+    __slots__ = (
+        'heart_rate', 'steps', 'calories', 'blood_oxygen', 'temperature',
+        'stress_level', 'sleep_quality', 'systolic_bp', 'diastolic_bp',
+        'respiratory_rate', 'hrv', 'recovery_rate'
+    )
+
+    def __init__(self, heart_rate: float, steps: float, calories: float,
+                 blood_oxygen: float, temperature: float, stress_level: float,
+                 sleep_quality: float, systolic_bp: float, diastolic_bp: float,
+                 respiratory_rate: float, hrv: float, recovery_rate: float):
+        self.heart_rate = heart_rate
+        self.steps = steps
+        self.calories = calories
+        self.blood_oxygen = blood_oxygen
+        self.temperature = temperature
+        self.stress_level = stress_level
+        self.sleep_quality = sleep_quality
+        self.systolic_bp = systolic_bp
+        self.diastolic_bp = diastolic_bp
+        self.respiratory_rate = respiratory_rate
+        self.hrv = hrv
+        self.recovery_rate = recovery_rate
+
+    def __getitem__(self, metric: str) -> float:
+        return getattr(self, metric)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
 class RealTimeWearableData:
     """
     Real-time wearable data generator that returns JSON data on demand.
     No file I/O, pure function-based data generation for immediate use.
     """
     
-    def __init__(self, user_profile: UserProfile = None):
+    __slots__ = (
+        'user_profile', 'params', 'clock', 'start_time', 'current_activity',
+        'current_state', 'total_steps', 'total_calories'
+    )
+    
+    def __init__(self, user_profile: UserProfile = None, clock: Optional[Clock] = None):
         if user_profile is None:
             user_profile = UserProfile()
         self.user_profile = user_profile
-        self.start_time = datetime.now()
+        # Shared activity ranges, personalization offsets and BMR for this profile
+        self.params = get_profile_parameters(user_profile)
+        self.clock = clock if clock is not None else REAL_CLOCK
+        self.start_time = self.clock.now()
         self.current_activity = Activity.RESTING.value
         
         # Current physiological state for smooth transitions
         self.current_state = self._initialize_state()
         self.total_steps = 0
         self.total_calories = 0.0
-        
-        # Activity-specific physiological ranges
-        self.activity_profiles = self._setup_activity_profiles()
     
-    def _initialize_state(self) -> Dict[str, float]:
-        """Initialize baseline physiological state"""
-        age_adjustment = max(0, (self.user_profile.age - 30) * 0.3)
-        gender_hr_adjust = -3 if self.user_profile.gender == "F" else 2
-        
-        return {
-            'heart_rate': 72 + gender_hr_adjust - age_adjustment,
-            'steps': 0,
-            'calories': 0.0,
-            'blood_oxygen': 98.5,
-            'temperature': 36.7,
-            'stress_level': 25.0,
-            'sleep_quality': 85.0,
-            'systolic_bp': 118 + (self.user_profile.age * 0.2),
-            'diastolic_bp': 78,
-            'respiratory_rate': 15.5,
-            'hrv': 45.0,  # Heart Rate Variability
-            'recovery_rate': 0.8
-        }
+    @property
+    def activity_profiles(self) -> Dict[str, Dict]:
+        """Activity-specific physiological ranges (shared, read-only)"""
+        return self.params.activity_profiles
     
-    def _setup_activity_profiles(self) -> Dict[str, Dict]:
-        """Setup realistic physiological ranges for each activity"""
-        bmr_per_second = self._calculate_bmr() / 86400
-        
-        return {
-            Activity.RESTING.value: {
-                'heart_rate': (58, 76),
-                'steps_per_second': 0,
-                'calories_per_second': bmr_per_second * 1.1,
-                'stress_range': (15, 35),
-                'temperature_range': (36.3, 36.8),
-                'respiratory_range': (12, 16),
-                'blood_pressure': ((108, 122), (68, 82)),
-                'blood_oxygen_range': (97.5, 100),
-                'hrv_range': (40, 60)
-            },
-            Activity.WALKING.value: {
-                'heart_rate': (88, 112),
-                'steps_per_second': 1.8,
-                'calories_per_second': bmr_per_second * 3.5,
-                'stress_range': (22, 42),
-                'temperature_range': (36.6, 37.1),
-                'respiratory_range': (16, 22),
-                'blood_pressure': ((112, 128), (72, 86)),
-                'blood_oxygen_range': (96.5, 99.5),
-                'hrv_range': (35, 55)
-            },
-            Activity.RUNNING.value: {
-                'heart_rate': (135, 175),
-                'steps_per_second': 4.2,
-                'calories_per_second': bmr_per_second * 8.5,
-                'stress_range': (45, 75),
-                'temperature_range': (36.9, 37.6),
-                'respiratory_range': (28, 48),
-                'blood_pressure': ((125, 155), (78, 98)),
-                'blood_oxygen_range': (94.5, 98.5),
-                'hrv_range': (25, 45)
-            },
-            Activity.EXERCISING.value: {
-                'heart_rate': (125, 165),
-                'steps_per_second': 2.8,
-                'calories_per_second': bmr_per_second * 7.0,
-                'stress_range': (55, 85),
-                'temperature_range': (37.0, 37.7),
-                'respiratory_range': (24, 42),
-                'blood_pressure': ((120, 145), (75, 92)),
-                'blood_oxygen_range': (95.5, 99),
-                'hrv_range': (30, 50)
-            },
-            Activity.SLEEPING.value: {
-                'heart_rate': (48, 62),
-                'steps_per_second': 0,
-                'calories_per_second': bmr_per_second * 0.95,
-                'stress_range': (8, 22),
-                'temperature_range': (36.1, 36.4),
-                'respiratory_range': (9, 13),
-                'blood_pressure': ((102, 115), (62, 72)),
-                'blood_oxygen_range': (98, 100),
-                'hrv_range': (50, 70)
-            },
-            Activity.STRESSED.value: {
-                'heart_rate': (82, 108),
-                'steps_per_second': 0.3,
-                'calories_per_second': bmr_per_second * 2.2,
-                'stress_range': (65, 95),
-                'temperature_range': (36.7, 37.3),
-                'respiratory_range': (18, 26),
-                'blood_pressure': ((122, 142), (80, 95)),
-                'blood_oxygen_range': (97, 99.5),
-                'hrv_range': (20, 40)
-            },
-            Activity.MEDITATION.value: {
-                'heart_rate': (52, 68),
-                'steps_per_second': 0,
-                'calories_per_second': bmr_per_second * 1.05,
-                'stress_range': (3, 18),
-                'temperature_range': (36.2, 36.5),
-                'respiratory_range': (7, 11),
-                'blood_pressure': ((105, 118), (65, 75)),
-                'blood_oxygen_range': (98.5, 100),
-                'hrv_range': (55, 75)
-            }
-        }
+    def _initialize_state(self) -> PhysiologicalState:
+        """Initialize baseline physiological state"""
+        return PhysiologicalState(*self.params.initial_state)
     
     def _calculate_bmr(self) -> float:
         """Calculate Basal Metabolic Rate using Harris-Benedict equation"""
-        if self.user_profile.gender.upper() == "M":
-            bmr = 88.362 + (13.397 * self.user_profile.weight_kg) + \
-                  (4.799 * self.user_profile.height_cm) - (5.677 * self.user_profile.age)
-        else:
-            bmr = 447.593 + (9.247 * self.user_profile.weight_kg) + \
-                  (3.098 * self.user_profile.height_cm) - (4.330 * self.user_profile.age)
-        return bmr
+        return self.params.bmr
     
     def _generate_smooth_transition(self, current: float, target: float, 
                                   variance: float, smoothness: float = 0.15) -> float:
@@ -175,45 +378,19 @@ class RealTimeWearableData:
         change = diff * smoothness + random.uniform(-variance, variance)
         return max(0, current + change)
     
-    def _apply_circadian_rhythm(self, base_value: float, metric: str) -> float:
+    def _apply_circadian_rhythm(self, base_value: float, metric: str,
+                                minute: Optional[int] = None) -> float:
         """Apply circadian rhythm patterns to metrics"""
-        now = datetime.now()
-        hour_of_day = now.hour + now.minute / 60.0
-        
-        if metric == 'heart_rate':
-            # Lower at night, peaks in afternoon
-            adjustment = -4 * np.cos((hour_of_day - 14) * np.pi / 12)
-        elif metric == 'temperature':
-            # Lowest at 4 AM, highest at 6 PM
-            adjustment = 0.25 * np.cos((hour_of_day - 18) * np.pi / 12)
-        elif metric == 'stress_level':
-            # Higher during work hours (8 AM - 6 PM)
-            adjustment = 8 * (0.5 + 0.5 * np.sin((hour_of_day - 14) * np.pi / 8))
-        else:
-            adjustment = 0
-        
-        return base_value + adjustment
+        if minute is None:
+            minute = minute_of_day(self.clock.now())
+        table = _CIRCADIAN_LISTS.get(metric)
+        if table is None:
+            return base_value
+        return base_value + table[minute]
     
     def _apply_personalization(self, value: float, metric: str, activity: str) -> float:
         """Apply age, gender, and fitness level adjustments"""
-        adjustments = {
-            'heart_rate': {
-                Activity.RESTING.value: -0.25 * self.user_profile.age / 30,
-                Activity.WALKING.value: -0.15 * self.user_profile.age / 30 - (5 if self.user_profile.fitness_level == "high" else 0),
-                Activity.RUNNING.value: -0.1 * self.user_profile.age / 30 - (8 if self.user_profile.fitness_level == "high" else 0)
-            },
-            'systolic_bp': {
-                Activity.RESTING.value: 0.4 * self.user_profile.age / 30,
-                Activity.STRESSED.value: 0.6 * self.user_profile.age / 30,
-                Activity.EXERCISING.value: 0.3 * self.user_profile.age / 30
-            }
-        }
-        
-        if metric in adjustments and activity in adjustments[metric]:
-            adjustment = adjustments[metric][activity]
-            return value + adjustment
-        
-        return value
+        return value + self.params.personalization.get((metric, activity), 0)
     
     def generate_realtime_data(self, activity: str = None, 
                              duration_seconds: int = 1) -> Dict[str, Any]:
@@ -233,19 +410,21 @@ class RealTimeWearableData:
             activity = self.current_activity
         
         profile = self.activity_profiles[self.current_activity]
-        timestamp = datetime.now().isoformat()
+        now = self.clock.now()
+        timestamp = now.isoformat()
+        minute = minute_of_day(now)
         
         # Generate physiological metrics with smooth transitions
         metrics = {}
         
         # Heart Rate with circadian and personalization adjustments
         target_hr = random.uniform(*profile['heart_rate'])
-        target_hr = self._apply_circadian_rhythm(target_hr, 'heart_rate')
+        target_hr = self._apply_circadian_rhythm(target_hr, 'heart_rate', minute)
         target_hr = self._apply_personalization(target_hr, 'heart_rate', activity)
         
         metrics['heart_rate'] = round(
             self._generate_smooth_transition(
-                self.current_state['heart_rate'], 
+                self.current_state.heart_rate, 
                 target_hr, 
                 variance=2.5
             )
@@ -260,7 +439,7 @@ class RealTimeWearableData:
         
         metrics['hrv'] = round(
             self._generate_smooth_transition(
-                self.current_state['hrv'], 
+                self.current_state.hrv, 
                 target_hrv, 
                 variance=3.0
             ), 1
@@ -286,7 +465,7 @@ class RealTimeWearableData:
         metrics['blood_oxygen'] = round(
             np.clip(
                 self._generate_smooth_transition(
-                    self.current_state['blood_oxygen'], 
+                    self.current_state.blood_oxygen, 
                     target_o2, 
                     variance=0.4
                 ), 
@@ -296,11 +475,11 @@ class RealTimeWearableData:
         
         # Body Temperature with circadian rhythm
         target_temp = random.uniform(*profile['temperature_range'])
-        target_temp = self._apply_circadian_rhythm(target_temp, 'temperature')
+        target_temp = self._apply_circadian_rhythm(target_temp, 'temperature', minute)
         
         metrics['temperature'] = round(
             self._generate_smooth_transition(
-                self.current_state['temperature'], 
+                self.current_state.temperature, 
                 target_temp, 
                 variance=0.08
             ), 2
@@ -308,7 +487,7 @@ class RealTimeWearableData:
         
         # Stress Level with circadian influence
         target_stress = random.uniform(*profile['stress_range'])
-        target_stress = self._apply_circadian_rhythm(target_stress, 'stress_level')
+        target_stress = self._apply_circadian_rhythm(target_stress, 'stress_level', minute)
         
         # Stress increases with exercise intensity, decreases with meditation
         if activity in [Activity.RUNNING.value, Activity.EXERCISING.value]:
@@ -319,7 +498,7 @@ class RealTimeWearableData:
         metrics['stress_level'] = round(
             np.clip(
                 self._generate_smooth_transition(
-                    self.current_state['stress_level'], 
+                    self.current_state.stress_level, 
                     target_stress, 
                     variance=4.0
                 ), 
@@ -330,14 +509,14 @@ class RealTimeWearableData:
         # Sleep Quality (only meaningful during sleep, otherwise shows readiness)
         if activity == Activity.SLEEPING.value:
             sleep_improvement = random.uniform(0.4, 1.2)
-            sleep_value = min(100, self.current_state['sleep_quality'] + sleep_improvement)
+            sleep_value = min(100, self.current_state.sleep_quality + sleep_improvement)
         else:
             sleep_decay = random.uniform(-0.2, -0.05)
-            sleep_value = max(50, self.current_state['sleep_quality'] + sleep_decay)
+            sleep_value = max(50, self.current_state.sleep_quality + sleep_decay)
             # Convert to sleep readiness score when awake
             sleep_value = min(100, sleep_value + (100 - metrics['stress_level']) * 0.3)
         
-        metrics['sleep_quality'] = round(np.clip(sleep_value, 0, 100), 1)
+        metrics['sleep_quality'] = round(float(np.clip(sleep_value, 0, 100)), 1)
         
         # Blood Pressure with age adjustments
         sys_range, dia_range = profile['blood_pressure']
@@ -347,14 +526,14 @@ class RealTimeWearableData:
         
         metrics['systolic_bp'] = round(
             self._generate_smooth_transition(
-                self.current_state['systolic_bp'], 
+                self.current_state.systolic_bp, 
                 target_sys, 
                 variance=1.8
             )
         )
         metrics['diastolic_bp'] = round(
             self._generate_smooth_transition(
-                self.current_state['diastolic_bp'], 
+                self.current_state.diastolic_bp, 
                 target_dia, 
                 variance=1.5
             )
@@ -369,7 +548,7 @@ class RealTimeWearableData:
         
         metrics['respiratory_rate'] = round(
             self._generate_smooth_transition(
-                self.current_state['respiratory_rate'], 
+                self.current_state.respiratory_rate, 
                 target_rr, 
                 variance=1.2
             )
@@ -383,14 +562,13 @@ class RealTimeWearableData:
         
         metrics['recovery_rate'] = round(
             np.clip(
-                self.current_state['recovery_rate'] + recovery_change, 
+                self.current_state.recovery_rate + recovery_change, 
                 0, 1
             ), 2
         )
         
         # Calculate exertion level based on heart rate relative to max HR
-        max_hr_estimate = 220 - self.user_profile.age
-        exertion_percentage = (metrics['heart_rate'] / max_hr_estimate) * 100
+        exertion_percentage = (metrics['heart_rate'] / self.params.max_hr_estimate) * 100
         metrics['exertion_level'] = round(np.clip(exertion_percentage, 0, 100), 1)
         
         # VO2 Max estimate (simplified)
@@ -421,7 +599,7 @@ class RealTimeWearableData:
             "current_activity": self.current_activity,
             "duration_seconds": duration_seconds,
             "physiological_metrics": metrics,
-            "bmr_kcal_day": round(self._calculate_bmr(), 1),
+            "bmr_kcal_day": self.params.bmr_kcal_day,
             "fitness_level": self.user_profile.fitness_level,
             "session_totals": {
                 "total_steps": metrics['steps'],
@@ -435,18 +613,17 @@ class RealTimeWearableData:
         }
         
         # Update state for next call
-        self.current_state.update({
-            'heart_rate': metrics['heart_rate'],
-            'hrv': metrics['hrv'],
-            'blood_oxygen': metrics['blood_oxygen'],
-            'temperature': metrics['temperature'],
-            'stress_level': metrics['stress_level'],
-            'sleep_quality': metrics['sleep_quality'],
-            'systolic_bp': metrics['systolic_bp'],
-            'diastolic_bp': metrics['diastolic_bp'],
-            'respiratory_rate': metrics['respiratory_rate'],
-            'recovery_rate': metrics['recovery_rate']
-        })
+        state = self.current_state
+        state.heart_rate = metrics['heart_rate']
+        state.hrv = metrics['hrv']
+        state.blood_oxygen = metrics['blood_oxygen']
+        state.temperature = metrics['temperature']
+        state.stress_level = metrics['stress_level']
+        state.sleep_quality = metrics['sleep_quality']
+        state.systolic_bp = metrics['systolic_bp']
+        state.diastolic_bp = metrics['diastolic_bp']
+        state.respiratory_rate = metrics['respiratory_rate']
+        state.recovery_rate = metrics['recovery_rate']
         
         return realtime_data
     
@@ -489,24 +666,26 @@ class RealTimeWearableData:
     def set_user_profile(self, user_profile: UserProfile) -> None:
         """Update user profile and reset physiological state"""
         self.user_profile = user_profile
+        self.params = get_profile_parameters(user_profile)
         self.current_state = self._initialize_state()
         self.total_steps = 0
         self.total_calories = 0.0
         self.current_activity = Activity.RESTING.value
-        self.start_time = datetime.now()
+        self.start_time = self.clock.now()
     
     def get_current_status(self) -> Dict[str, Any]:
         """Get current status without generating new data"""
-        elapsed = (datetime.now() - self.start_time).total_seconds()
+        now = self.clock.now()
+        elapsed = (now - self.start_time).total_seconds()
         return {
             "user_id": self.user_profile.user_id,
             "current_activity": self.current_activity,
             "session_duration_seconds": round(elapsed),
             "total_steps": int(self.total_steps),
             "total_calories": round(self.total_calories, 2),
-            "current_heart_rate": round(self.current_state['heart_rate']),
-            "current_stress": round(self.current_state['stress_level']),
-            "timestamp": datetime.now().isoformat()
+            "current_heart_rate": round(self.current_state.heart_rate),
+            "current_stress": round(self.current_state.stress_level),
+            "timestamp": now.isoformat()
         }
 
 
@@ -553,12 +732,17 @@ def get_live_monitoring_json(user_profile: UserProfile,
     """
     generator = RealTimeWearableData(user_profile)
     all_data = []
+    heart_rates = np.empty(len(activity_sequence))
+    stress_levels = np.empty(len(activity_sequence))
     
-    for activity in activity_sequence:
+    # Data points are generated back to back; use generate_series for
+    # long clock-free runs
+    for i, activity in enumerate(activity_sequence):
         generator.set_activity(activity)
         data_point = generator.generate_realtime_data(activity, duration_per_activity)
         all_data.append(data_point)
-        time.sleep(0.1)  # Small delay for realism
+        heart_rates[i] = data_point["physiological_metrics"]["heart_rate"]
+        stress_levels[i] = data_point["physiological_metrics"]["stress_level"]
     
     monitoring_data = {
         "user_id": user_profile.user_id,
@@ -566,10 +750,10 @@ def get_live_monitoring_json(user_profile: UserProfile,
         "start_time": generator.start_time.isoformat(),
         "data_points": all_data,
         "session_summary": {
-            "total_duration": sum(dp["duration_seconds"] for dp in all_data),
-            "activities_covered": list(dict.fromkeys([dp["current_activity"] for dp in all_data])),
-            "avg_heart_rate": round(np.mean([dp["physiological_metrics"]["heart_rate"] for dp in all_data]), 1),
-            "max_stress": max(dp["physiological_metrics"]["stress_level"] for dp in all_data),
+            "total_duration": duration_per_activity * len(all_data),
+            "activities_covered": list(dict.fromkeys(dp["current_activity"] for dp in all_data)),
+            "avg_heart_rate": round(float(heart_rates.mean()), 1),
+            "max_stress": int(stress_levels.max()),
             "total_calories": all_data[-1]["session_totals"]["total_calories"]
         }
     }
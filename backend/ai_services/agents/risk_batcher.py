@@ -0,0 +1,149 @@
+# agents/risk_batcher.py
+# Micro-batched risk scoring: many users per LLM call.
+#
+# RiskBatcher.assess(user_id, sample) parks the caller and adds the snapshot
+# to the open batch. A batch is sent as one prompt when it holds max_users
+# users or max_delay seconds after its first snapshot, through the shared
+# RiskAssessmentClient (same concurrency limit, rate limit, deadline and
+# hedging as single calls). The answer is one JSON list of per-user results
+# (constrained to BATCH_RESPONSE_SCHEMA), parsed by the client's
+# RiskResponseParser and demultiplexed back to the waiting callers. A result
+# that is missing or malformed fails only its own user's call; a batch with no
+# usable result at all counts as a failed attempt and is asked again.
+import asyncio
+import json
+import os
+from functools import partial
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from agents.risk_client import RiskAssessment, RiskAssessmentClient, RiskAssessmentError
+from agents.risk_response import BATCH_RESPONSE_SCHEMA, RiskResponseError
+
+RISK_BATCH_MAX_USERS = int(os.getenv("RISK_BATCH_MAX_USERS", "25"))
+RISK_BATCH_MAX_DELAY_SECONDS = float(os.getenv("RISK_BATCH_MAX_DELAY_SECONDS", "0.2"))
+
+BATCH_PROMPT = """
+You are an expert Health Analyst.
+For every user in the health data below provide the risk score of cardiac arrest on a scale of 0-1 where 0 means no risk and 1 means high risk.
+Return a JSON with one key "results": a list with one object per user, each with three keys "user_id", "risk" and "short_report".
+"user_id" must be the user's key in the health data.
+"risk" must be a float number between 0 and 1.
+"short_report" must be a brief (2-3 sentences) explanation of the risk assessment.
+Assess every user independently.
+
+Users Health Data:
+{samples}
+"""
+
+
+def _compact(sample: str) -> str:
+    # The snapshots are indented JSON; whitespace is prompt tokens
+    try:
+        return json.dumps(json.loads(sample), separators=(",", ":"))
+    except ValueError:
+        return json.dumps(sample)
+
+
+def batch_prompt(samples: Dict[str, str]) -> str:
+    """One prompt for {user_id: health snapshot}"""
+    body = ",\n".join(f"{json.dumps(user_id)}:{_compact(sample)}" for user_id, sample in samples.items())
+    return BATCH_PROMPT.format(samples="{\n" + body + "\n}")
+
+
+class RiskBatcher:
+    """Collects snapshots of many users into one risk prompt; see the module header"""
+
+    def __init__(self, client: RiskAssessmentClient,
+                 max_users: int = RISK_BATCH_MAX_USERS,
+                 max_delay: float = RISK_BATCH_MAX_DELAY_SECONDS,
+                 timeout: Optional[float] = None):
+        self.client = client
+        self.max_users = max_users
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # user_id -> (newest snapshot, callers waiting for that user)
+        self._pending: Dict[str, Tuple[str, List[asyncio.Future]]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sending: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.users = 0
+        self.requests = 0
+        self.user_failures = 0
+        self.batch_failures = 0
+
+    async def assess(self, user_id: str, sample: str) -> RiskAssessment:
+        """
+        Score one user's snapshot as part of the next batch.
+
+        A user already waiting in the open batch is scored once, on the newest
+        snapshot, and every waiting caller gets that result. Raises
+        RiskAssessmentError (or RiskTimeout) when this user's result failed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests += 1
+        entry = self._pending.get(user_id)
+        self._pending[user_id] = (sample, (entry[1] if entry else []) + [future])
+        if len(self._pending) >= self.max_users:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """Send the open batch now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: Dict[str, Tuple[str, List[asyncio.Future]]]) -> None:
+        user_ids = list(batch)
+        self.batches += 1
+        self.users += len(user_ids)
+        try:
+            results, attempts, latency = await self.client.complete(
+                batch_prompt({user_id: sample for user_id, (sample, _) in batch.items()}),
+                partial(self.client.parser.parse_batch, user_ids=user_ids),
+                self.timeout, BATCH_RESPONSE_SCHEMA)
+        except Exception as e:
+            self.batch_failures += 1
+            self.user_failures += len(user_ids)
+            for _, futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for user_id, (_, futures) in batch.items():
+            result = results[user_id]
+            if isinstance(result, RiskResponseError):
+                self.user_failures += 1
+            for future in futures:
+                if future.done():
+                    continue    # caller gave up
+                if isinstance(result, RiskResponseError):
+                    future.set_exception(RiskAssessmentError(f"Unparseable risk result: {result}"))
+                else:
+                    future.set_result(RiskAssessment(result["risk"], result["short_report"], latency, attempts))
+
+    async def close(self) -> None:
+        """Send the open batch and wait for every batch in flight"""
+        self.flush()
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "users_per_batch": round(self.users / self.batches, 1) if self.batches else 0,
+            "open_batch": len(self._pending),
+            "user_failures": self.user_failures,
+            "batch_failures": self.batch_failures,
+        }
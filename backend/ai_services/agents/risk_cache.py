@@ -0,0 +1,258 @@
+# agents/risk_cache.py
+# Risk cache in front of the LLM, keyed by quantized physiology.
+#
+# At 1 Hz a stable user's snapshots differ only in noise, so the cache key is
+# the snapshot with its vitals binned (RISK_CACHE_BINS), plus activity and an
+# age band: a user whose key did not change gets the earlier answer in
+# microseconds, and only a materially changed state (a vital crossing a bin)
+# reaches the model. Entries expire after ttl seconds and the least recently
+# used are evicted past max_entries. Callers asking for a key that is already
+# being scored wait for that call instead of sending another one.
+#
+# RISK_CACHE_BACKEND=redis shares answers across workers: every worker keeps
+# its local cache and falls back to Redis (SET EX ttl) on a local miss.
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from agents.risk_client import RiskAssessment
+
+RISK_CACHE_BACKEND = os.getenv("RISK_CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+RISK_CACHE_MAX_ENTRIES = int(os.getenv("RISK_CACHE_MAX_ENTRIES", "100000"))
+RISK_CACHE_TTL_SECONDS = float(os.getenv("RISK_CACHE_TTL_SECONDS", "60"))
+RISK_CACHE_KEY_PREFIX = "lifelink:risk:"
+
+# Bin width per vital; values in the same bin are the same state to the model
+RISK_CACHE_BINS = {
+    "heart_rate": 5,
+    "blood_oxygen": 1.0,
+    "systolic_bp": 10,
+    "diastolic_bp": 10,
+    "respiratory_rate": 2,
+    "temperature": 0.5,
+}
+AGE_BAND_YEARS = 10
+
+RiskKey = Tuple[Any, ...]
+
+
+def _vitals(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    # Instant health snapshot ({"vital_signs": {..., "blood_pressure": "120/80"}})
+    # or wearable reading ({"physiological_metrics": {..., "systolic_bp": 120}})
+    vitals = dict(snapshot.get("vital_signs") or snapshot.get("physiological_metrics") or snapshot)
+    pressure = vitals.get("blood_pressure")
+    if isinstance(pressure, str) and "/" in pressure:
+        systolic, diastolic = pressure.split("/", 1)
+        vitals["systolic_bp"], vitals["diastolic_bp"] = float(systolic), float(diastolic)
+    return vitals
+
+
+def risk_key(snapshot: Union[str, Dict[str, Any]], age: Optional[int] = None) -> RiskKey:
+    """Quantized (vitals..., activity, age band) of a snapshot"""
+    if isinstance(snapshot, str):
+        snapshot = json.loads(snapshot)
+    vitals = _vitals(snapshot)
+    key = []
+    for metric, width in RISK_CACHE_BINS.items():
+        value = vitals.get(metric)
+        key.append(None if value is None else int(float(value) // width))
+    key.append(snapshot.get("activity") or snapshot.get("current_activity"))
+    key.append(None if age is None else age // AGE_BAND_YEARS)
+    return tuple(key)
+
+
+class RiskCache:
+    """LRU + TTL map of risk keys to {"risk", "short_report"}"""
+
+    def __init__(self, max_entries: int = RISK_CACHE_MAX_ENTRIES,
+                 ttl: float = RISK_CACHE_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[RiskKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: RiskKey) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+            self.expired += 1
+        self.misses += 1
+        return None
+
+    def put(self, key: RiskKey, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        self._entries[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+class RedisRiskStore:
+    """Risk answers shared by every worker, expiring in Redis after ttl"""
+
+    def __init__(self, url: str, ttl: float = RISK_CACHE_TTL_SECONDS):
+        import redis.asyncio as redis
+        from redis.exceptions import RedisError
+
+        self.redis = redis.from_url(url)
+        self.ttl = ttl
+        self._errors = RedisError
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def _name(key: RiskKey) -> str:
+        return RISK_CACHE_KEY_PREFIX + json.dumps(key, separators=(",", ":"))
+
+    async def get(self, key: RiskKey) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """(seconds left to live, value) or None; Redis being down is a miss"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(self._name(key))
+                pipe.pttl(self._name(key))
+                value, pttl = await pipe.execute()
+        except self._errors as e:
+            self.errors += 1
+            if self.errors == 1:
+                print(f"⚠️ Shared risk cache unavailable: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return max(0.0, pttl / 1000), json.loads(value)
+
+    async def put(self, key: RiskKey, value: Dict[str, Any]) -> None:
+        try:
+            await self.redis.set(self._name(key), json.dumps(value), px=int(self.ttl * 1000))
+        except self._errors:
+            self.errors += 1
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+class CachedRiskScorer:
+    """
+    Risk scoring through the cache.
+
+    score is the scorer behind the cache, called as score(user_id, sample):
+    RiskBatcher.assess, or a wrapper around RiskAssessmentClient.assess.
+    """
+
+    def __init__(self, score: Callable[[str, str], Awaitable[RiskAssessment]],
+                 cache: Optional[RiskCache] = None,
+                 shared: Optional[RedisRiskStore] = None):
+        self.score = score
+        self.cache = cache if cache is not None else RiskCache()
+        self.shared = shared
+        self._inflight: Dict[RiskKey, asyncio.Future] = {}
+        self.lookups = 0
+        self.coalesced = 0
+        self.hit_seconds_total = 0.0    # local and shared hits, not coalesced waits
+
+    def _hit(self, value: Dict[str, Any], started: float, lookup: bool = True) -> RiskAssessment:
+        latency = time.perf_counter() - started
+        if lookup:
+            self.hit_seconds_total += latency
+        return RiskAssessment(value["risk"], value["short_report"], latency, 0, cached=True)
+
+    async def assess(self, user_id: str, sample: str, age: Optional[int] = None) -> RiskAssessment:
+        """Cached answer for the snapshot's state, or a fresh one from the scorer"""
+        started = time.perf_counter()
+        self.lookups += 1
+        key = risk_key(sample, age)
+        value = self.cache.get(key)
+        if value is not None:
+            return self._hit(value, started)
+
+        waiting = self._inflight.get(key)
+        if waiting is not None:
+            self.coalesced += 1
+            try:
+                return self._hit(await asyncio.shield(waiting), started, lookup=False)
+            except asyncio.CancelledError:
+                if not waiting.cancelled():
+                    raise
+                # The caller scoring this state was cancelled, not us
+                return await self.assess(user_id, sample, age)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self.shared is not None:
+                found = await self.shared.get(key)
+                if found is not None:
+                    ttl, value = found
+                    self.cache.put(key, value, ttl)
+                    future.set_result(value)
+                    return self._hit(value, started)
+            assessment = await self.score(user_id, sample)
+            value = {"risk": assessment.risk, "short_report": assessment.short_report}
+            self.cache.put(key, value)
+            if self.shared is not None:
+                await self.shared.put(key, value)
+            future.set_result(value)
+            return assessment
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            # Waiting callers fail with the scorer; the next caller tries again
+            if not future.done():
+                future.set_exception(e)
+                future.exception()      # retrieved, even when nobody was waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def close(self) -> None:
+        if self.shared is not None:
+            await self.shared.close()
+
+    def stats(self) -> Dict[str, Any]:
+        shared_hits = self.shared.hits if self.shared is not None else 0
+        hits = self.cache.hits + shared_hits
+        return {
+            **self.cache.stats(),
+            "shared_hits": shared_hits,
+            "shared_errors": self.shared.errors if self.shared is not None else 0,
+            "coalesced": self.coalesced,
+            "scored": self.lookups - hits - self.coalesced,
+            "hit_lookup_us_avg": round(self.hit_seconds_total / hits * 1e6, 1) if hits else 0,
+        }
+
+
+def create_risk_scorer(score: Callable[[str, str], Awaitable[RiskAssessment]],
+                       backend: str = RISK_CACHE_BACKEND, url: str = REDIS_URL) -> CachedRiskScorer:
+    shared = RedisRiskStore(url) if backend == "redis" else None
+    return CachedRiskScorer(score, RiskCache(), shared)
@@ -0,0 +1,513 @@
+# agents/risk_client.py
+# Long-lived async client for cardiac-arrest risk scoring by an LLM.
+#
+# One RiskAssessmentClient is created per process and shared by every caller.
+# It keeps a single pooled HTTP client to Gemini (GeminiBackend), so hundreds
+# of concurrent assessments reuse warm connections instead of building a new
+# model client per call, and it never blocks the event loop. Per call:
+#   - a semaphore bounds the requests in flight to the backend
+#   - a token bucket keeps the request rate under the API quota
+#   - the whole call has a deadline (attempts, hedges and rate-limit waits)
+#   - a request that has not answered hedge_after seconds after it was sent
+#     gets a hedge (a second identical request, first answer wins) if a
+#     concurrency slot is free; a failed attempt is retried while attempts
+#     and time remain
+# Requests ask for schema-constrained JSON (agents/risk_response.py), and
+# answers go through its tolerant RiskResponseParser; an answer it cannot use
+# counts as a failed attempt. assess(on_risk=...) streams the answer and
+# reports the risk as soon as it arrives, before the short report is written.
+# FakeLLMBackend answers locally with a configurable latency, tail and error
+# rate, for tests and load experiments without an API key.
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from agents.risk_response import RISK_RESPONSE_SCHEMA, RiskResponseError, RiskResponseParser
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+RISK_MAX_CONCURRENCY = int(os.getenv("RISK_MAX_CONCURRENCY", "64"))
+RISK_MAX_CONNECTIONS = int(os.getenv("RISK_MAX_CONNECTIONS", "64"))
+RISK_TIMEOUT_SECONDS = float(os.getenv("RISK_TIMEOUT_SECONDS", "10"))
+RISK_HEDGE_AFTER_SECONDS = float(os.getenv("RISK_HEDGE_AFTER_SECONDS", "3"))
+RISK_MAX_ATTEMPTS = int(os.getenv("RISK_MAX_ATTEMPTS", "3"))
+RISK_RETRY_BACKOFF_SECONDS = 0.2
+# Requests per second and burst allowed by the API quota
+RISK_RATE_PER_SECOND = float(os.getenv("RISK_RATE_PER_SECOND", "25"))
+RISK_RATE_BURST = int(os.getenv("RISK_RATE_BURST", "50"))
+# Fake streamed answers: share of the latency before the first chunk, and chunks per answer
+FAKE_FIRST_CHUNK_SHARE = 0.25
+FAKE_STREAM_CHUNKS = 8
+
+RISK_PROMPT = """
+You are an expert Health Analyst.
+Based on the following user health data provide the risk score of cardiac arrest on a scale of 0-1 where 0 means no risk and 1 means high risk.
+Return a JSON with two keys: "risk" and "short_report".
+"risk" must be a float number between 0 and 1.
+"short_report" must be a brief (2-3 sentences) explanation of the risk assessment.
+
+User Health Data:
+{sample}
+"""
+
+
+def risk_prompt(sample: str) -> str:
+    return RISK_PROMPT.format(sample=sample)
+
+
+class RiskAssessmentError(Exception):
+    """An assessment failed; retryable errors are worth another attempt"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class RiskTimeout(RiskAssessmentError):
+    """No attempt answered before the deadline"""
+
+    def __init__(self, message: str):
+        super().__init__(message, retryable=False)
+
+
+@dataclass
+class RiskAssessment:
+    risk: float
+    short_report: str
+    latency: float          # seconds, including retries and hedges
+    attempts: int           # requests sent for this assessment
+    cached: bool = False    # answered from the risk cache (agents/risk_cache.py)
+
+
+# -------------------------------
+# Rate limiting
+# -------------------------------
+class TokenBucket:
+    """rate tokens per second, at most burst saved up; waiters are served in order"""
+
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+        self.waits = 0
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                self.waits += 1
+                while self._tokens < 1:
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+                    self._refill()
+            self._tokens -= 1
+
+
+# -------------------------------
+# Backends
+# -------------------------------
+class LLMBackend(ABC):
+    """
+    Text in, text out; implementations must be safe to call concurrently.
+
+    schema, when given, is the JSON schema the answer must follow
+    (agents/risk_response.py).
+    """
+
+    @abstractmethod
+    async def generate(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        ...
+
+    async def generate_stream(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """The answer in chunks as it is generated; by default all at once"""
+        yield await self.generate(prompt, schema)
+
+    async def close(self) -> None:
+        pass
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Gemini generateContent (streamGenerateContent for generate_stream) over one
+    pooled, keep-alive HTTP client. With a schema the answer is constrained
+    JSON (responseMimeType application/json + responseSchema).
+    """
+
+    def __init__(self, api_key: str, model: str = GEMINI_MODEL,
+                 max_connections: int = RISK_MAX_CONNECTIONS, temperature: float = 0.0):
+        self.model = model
+        self.temperature = temperature
+        self._client = httpx.AsyncClient(
+            base_url=GEMINI_API_URL,
+            headers={"x-goog-api-key": api_key},
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            # Deadlines are enforced by the caller; this only bounds a stuck socket
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+
+    def _body(self, prompt: str, schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        config: Dict[str, Any] = {"temperature": self.temperature}
+        if schema is not None:
+            config["responseMimeType"] = "application/json"
+            config["responseSchema"] = schema
+        return {"contents": [{"role": "user", "parts": [{"text": prompt}]}], "generationConfig": config}
+
+    @staticmethod
+    def _check(status_code: int, text: str) -> None:
+        if status_code != 200:
+            # Quota and server errors are transient; anything else (bad key, bad request) is not
+            retryable = status_code == 429 or status_code >= 500
+            raise RiskAssessmentError(f"Gemini returned {status_code}: {text[:200]}", retryable=retryable)
+
+    @staticmethod
+    def _text(payload: Dict[str, Any]) -> str:
+        try:
+            parts = payload["candidates"][0]["content"]["parts"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise RiskAssessmentError(f"Gemini response without content: {e!r}") from e
+        return "".join(part.get("text", "") for part in parts)
+
+    async def generate(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        try:
+            response = await self._client.post(f"/models/{self.model}:generateContent",
+                                               json=self._body(prompt, schema))
+        except httpx.TransportError as e:
+            raise RiskAssessmentError(f"Gemini request failed: {e!r}") from e
+        self._check(response.status_code, response.text)
+        try:
+            return self._text(response.json())
+        except ValueError as e:
+            raise RiskAssessmentError(f"Gemini response is not JSON: {e!r}") from e
+
+    async def generate_stream(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        try:
+            async with self._client.stream("POST", f"/models/{self.model}:streamGenerateContent",
+                                           params={"alt": "sse"}, json=self._body(prompt, schema)) as response:
+                if response.status_code != 200:
+                    self._check(response.status_code, (await response.aread()).decode(errors="replace"))
+                async for line in response.aiter_lines():
+                    # Server-sent events: one "data: {GenerateContentResponse}" per chunk
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        payload = json.loads(line[5:])
+                    except ValueError as e:
+                        raise RiskAssessmentError(f"Gemini stream chunk is not JSON: {e!r}") from e
+                    if payload.get("candidates"):
+                        yield self._text(payload)
+        except httpx.TransportError as e:
+            raise RiskAssessmentError(f"Gemini request failed: {e!r}") from e
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+_HEALTH_DATA = re.compile(r"User Health Data:\s*(\{.*\})", re.S)
+# Multi-user prompts of agents/risk_batcher.py
+_BATCH_HEALTH_DATA = re.compile(r"Users Health Data:\s*(\{.*\})", re.S)
+
+
+def fake_risk(snapshot: Dict[str, Any]) -> float:
+    """Rough risk from a health snapshot: distance of HR, SpO2 and breathing from normal"""
+    vitals = snapshot.get("vital_signs") or snapshot.get("physiological_metrics") or snapshot
+    heart_rate = float(vitals.get("heart_rate", 75))
+    spo2 = float(vitals.get("blood_oxygen", 98))
+    respiratory_rate = float(vitals.get("respiratory_rate", 15))
+    risk = (max(0.0, abs(heart_rate - 75) - 25) / 60
+            + max(0.0, 95 - spo2) / 15
+            + max(0.0, abs(respiratory_rate - 15) - 7) / 15)
+    return round(min(1.0, risk), 3)
+
+
+class FakeLLMBackend(LLMBackend):
+    """
+    Local stand-in for Gemini. Answers like the real model (fenced JSON with
+    risk and short_report, bare JSON when a schema is given) after latency +-
+    jitter seconds; slow_rate of the calls take slow_latency instead (the tail
+    hedging is for) and error_rate fail with a retryable error. Multi-user
+    prompts take per_user_latency longer per user, and truncate_rate of their
+    answers are cut off mid-way. Without a schema, malformed_rate of the
+    single-user answers deviate from the format (prose around the JSON, a
+    trailing comma, a quoted number, no closing brace), like free-form output does.
+    """
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05,
+                 slow_rate: float = 0.0, slow_latency: float = 5.0,
+                 error_rate: float = 0.0, per_user_latency: float = 0.0,
+                 truncate_rate: float = 0.0, malformed_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.per_user_latency = per_user_latency
+        self.truncate_rate = truncate_rate
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _malformed(self, text: str) -> str:
+        kind = self._rng.randrange(4)
+        if kind == 0:
+            return f"Here is the assessment:\n{text}\nLet me know if you need more detail."
+        if kind == 1:
+            return text.replace("}", ",}", 1)
+        if kind == 2:
+            return re.sub(r'"risk": ([\d.]+)', r'"risk": "\1"', text)
+        return text.replace("}", "", 1)
+
+    def answer(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        match = _BATCH_HEALTH_DATA.search(prompt)
+        if match:
+            results = []
+            for user_id, snapshot in json.loads(match.group(1)).items():
+                risk = fake_risk(snapshot)
+                results.append({"user_id": user_id, "risk": risk,
+                                "short_report": f"Simulated assessment: estimated cardiac arrest risk {risk:.2f}."})
+            text = json.dumps({"results": results})
+            if schema is None:
+                text = "```json\n" + text + "\n```"
+            if self._rng.random() < self.truncate_rate:
+                text = text[:self._rng.randrange(len(text))]
+            return text
+        match = _HEALTH_DATA.search(prompt)
+        risk = fake_risk(json.loads(match.group(1))) if match else 0.0
+        report = f"Simulated assessment: estimated cardiac arrest risk {risk:.2f}."
+        text = json.dumps({"risk": risk, "short_report": report})
+        if schema is not None:
+            return text
+        text = "```json\n" + text + "\n```"
+        return self._malformed(text) if self._rng.random() < self.malformed_rate else text
+
+    def _delay(self, prompt: str) -> float:
+        if self._rng.random() < self.slow_rate:
+            delay = self.slow_latency
+        else:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        match = _BATCH_HEALTH_DATA.search(prompt)
+        if match:
+            delay += self.per_user_latency * len(json.loads(match.group(1)))
+        return delay
+
+    async def generate(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self._delay(prompt))
+            if self._rng.random() < self.error_rate:
+                raise RiskAssessmentError("Fake backend error")
+            return self.answer(prompt, schema)
+        finally:
+            self.in_flight -= 1
+
+    async def generate_stream(self, prompt: str, schema: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """The answer in FAKE_STREAM_CHUNKS pieces spread over the latency"""
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = self._delay(prompt)
+            await asyncio.sleep(delay * FAKE_FIRST_CHUNK_SHARE)
+            if self._rng.random() < self.error_rate:
+                raise RiskAssessmentError("Fake backend error")
+            text = self.answer(prompt, schema)
+            size = -(-len(text) // FAKE_STREAM_CHUNKS)
+            for i in range(0, len(text), size):
+                yield text[i:i + size]
+                await asyncio.sleep(delay * (1 - FAKE_FIRST_CHUNK_SHARE) / FAKE_STREAM_CHUNKS)
+        finally:
+            self.in_flight -= 1
+
+
+# -------------------------------
+# Client
+# -------------------------------
+class RiskAssessmentClient:
+    """Shared async risk scorer; see the module header for the call policy"""
+
+    def __init__(self, backend: LLMBackend,
+                 max_concurrency: int = RISK_MAX_CONCURRENCY,
+                 timeout: float = RISK_TIMEOUT_SECONDS,
+                 hedge_after: Optional[float] = RISK_HEDGE_AFTER_SECONDS,
+                 max_attempts: int = RISK_MAX_ATTEMPTS,
+                 limiter: Optional[TokenBucket] = None):
+        self.backend = backend
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.max_attempts = max_attempts
+        self.limiter = limiter or TokenBucket(RISK_RATE_PER_SECOND, RISK_RATE_BURST)
+        self.parser = RiskResponseParser()
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+        self.calls = 0
+        self.succeeded = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.requests = 0
+        self.hedges = 0
+        self.retries = 0
+        self.latency_total = 0.0
+        self.early_risks = 0
+        self.early_seconds_total = 0.0      # call start to streamed risk
+
+    async def _attempt(self, prompt: str, parse: Callable[[str], Any], sent_at: List[float],
+                       schema: Optional[Dict[str, Any]],
+                       on_risk: Optional[Callable[[float], None]]) -> Any:
+        async with self._slots:
+            await self.limiter.acquire()
+            self.requests += 1
+            sent_at.append(time.monotonic())
+            if on_risk is None:
+                text = await self.backend.generate(prompt, schema)
+            else:
+                stream = self.parser.stream()
+                async for chunk in self.backend.generate_stream(prompt, schema):
+                    risk = stream.feed(chunk)
+                    if risk is not None:
+                        on_risk(risk)
+                text = stream.text
+        try:
+            return parse(text)
+        except RiskResponseError as e:
+            raise RiskAssessmentError(f"Unparseable risk response: {e}") from e
+
+    async def _race(self, prompt: str, parse: Callable[[str], Any], schema: Optional[Dict[str, Any]],
+                    on_risk: Optional[Callable[[float], None]]) -> Tuple[Any, int]:
+        """Run attempts (hedges and retries) until one answers; returns (answer, attempts)"""
+        pending: Set[asyncio.Task] = set()
+        sent_at: List[float] = []       # send times; queueing for a slot or a token does not count
+        started = 0
+        error: Optional[BaseException] = None
+        try:
+            while True:
+                if not pending:
+                    if started >= self.max_attempts:
+                        raise error
+                    if started:
+                        self.retries += 1
+                        await asyncio.sleep(RISK_RETRY_BACKOFF_SECONDS)
+                    pending.add(asyncio.create_task(self._attempt(prompt, parse, sent_at, schema, on_risk)))
+                    started += 1
+
+                timeout = None
+                if self.hedge_after is not None and started < self.max_attempts:
+                    timeout = self.hedge_after
+                    if len(sent_at) == started:
+                        timeout = max(0.0, sent_at[-1] + self.hedge_after - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Hedge a request that is slow once sent, and only with a slot to spare:
+                    # under saturation a hedge would just queue behind other callers
+                    if (len(sent_at) == started and time.monotonic() >= sent_at[-1] + self.hedge_after
+                            and not self._slots.locked()):
+                        self.hedges += 1
+                        pending.add(asyncio.create_task(self._attempt(prompt, parse, sent_at, schema, on_risk)))
+                        started += 1
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), started
+                    error = task.exception()
+                    if not getattr(error, "retryable", False):
+                        raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, prompt: str, parse: Callable[[str], Any],
+                       timeout: Optional[float] = None,
+                       schema: Optional[Dict[str, Any]] = None,
+                       on_risk: Optional[Callable[[float], None]] = None) -> Tuple[Any, int, float]:
+        """
+        Send a prompt under the call policy; a parse error (RiskResponseError)
+        counts as a failed attempt. With on_risk the answer is streamed and
+        on_risk gets each attempt's risk as soon as it arrives.
+
+        Returns:
+            (parse(answer), attempts, latency in seconds); raises RiskTimeout past
+            the deadline and RiskAssessmentError when every attempt failed
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        self.calls += 1
+        try:
+            async with asyncio.timeout(timeout):
+                answer, attempts = await self._race(prompt, parse, schema, on_risk)
+        except TimeoutError:
+            self.timeouts += 1
+            raise RiskTimeout(f"No risk assessment within {timeout}s")
+        except Exception:
+            self.failures += 1
+            raise
+        latency = time.monotonic() - started
+        self.succeeded += 1
+        self.latency_total += latency
+        return answer, attempts, latency
+
+    async def assess(self, sample: str, timeout: Optional[float] = None,
+                     on_risk: Optional[Callable[[float], None]] = None) -> RiskAssessment:
+        """
+        Score one health snapshot.
+
+        Args:
+            sample: JSON string or text with the user health data
+            timeout: deadline in seconds for the whole call (default: the client's)
+            on_risk: called once with the risk as soon as it is streamed in, before
+                the short report; the returned assessment is final (a provisional
+                risk is only reported if its answer later fails to parse)
+        """
+        first_risk = None
+        if on_risk is not None:
+            started = time.monotonic()
+            reported: List[float] = []
+
+            def first_risk(risk: float) -> None:
+                # Hedged attempts race; only the first risk to arrive is reported
+                if not reported:
+                    reported.append(risk)
+                    self.early_risks += 1
+                    self.early_seconds_total += time.monotonic() - started
+                    on_risk(risk)
+
+        answer, attempts, latency = await self.complete(risk_prompt(sample), self.parser.parse, timeout,
+                                                        RISK_RESPONSE_SCHEMA, first_risk)
+        return RiskAssessment(answer["risk"], answer["short_report"], latency, attempts)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "succeeded": self.succeeded,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "retries": self.retries,
+            "rate_limited": self.limiter.waits,
+            "latency_ms_avg": round(self.latency_total / self.succeeded * 1000, 1) if self.succeeded else 0,
+            "early_risks": self.early_risks,
+            "risk_first_ms_avg": round(self.early_seconds_total / self.early_risks * 1000, 1) if self.early_risks else 0,
+            **self.parser.stats(),
+        }
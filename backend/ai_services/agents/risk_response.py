@@ -0,0 +1,254 @@
+# agents/risk_response.py
+# Schema-enforced risk answers and a tolerant parser for them.
+#
+# Requests carry RISK_RESPONSE_SCHEMA (or BATCH_RESPONSE_SCHEMA) as Gemini's
+# responseSchema with responseMimeType application/json, so the model answers
+# with bare JSON and "risk" as the first key. Parsing still tolerates what a
+# model without JSON mode, or a truncated answer, sends: markdown fences,
+# prose around the object, trailing commas, a number quoted as a string, a
+# missing closing brace. An answer that is not valid JSON but still has a
+# usable risk is "salvaged" instead of failing the attempt, so a formatting
+# slip no longer costs a second request. Every result is validated into a
+# RiskReport (risk a number in [0, 1]).
+#
+# RiskStream parses a streamed answer as it arrives: feed it the chunks and it
+# returns the risk as soon as the number is complete, long before the
+# short_report has been generated.
+import json
+import math
+import re
+from typing import Any, Dict, List, Optional, TypedDict, Union
+
+
+class RiskResponseError(ValueError):
+    """An answer had no usable risk"""
+
+
+class RiskReport(TypedDict):
+    risk: float
+    short_report: str
+
+
+# OpenAPI subset understood by Gemini's responseSchema; propertyOrdering puts
+# risk first so it can be read off a streamed answer early
+_REPORT_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        "risk": {"type": "NUMBER", "minimum": 0, "maximum": 1},
+        "short_report": {"type": "STRING"},
+    },
+    "required": ["risk", "short_report"],
+    "propertyOrdering": ["risk", "short_report"],
+}
+
+RISK_RESPONSE_SCHEMA: Dict[str, Any] = _REPORT_SCHEMA
+
+BATCH_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        "results": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"user_id": {"type": "STRING"}, **_REPORT_SCHEMA["properties"]},
+                "required": ["user_id", "risk", "short_report"],
+                "propertyOrdering": ["user_id", "risk", "short_report"],
+            },
+        },
+    },
+    "required": ["results"],
+}
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S | re.I)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+# A complete risk number: followed by a delimiter, not cut off mid-digits
+_RISK_FIELD = re.compile(r'"risk"\s*:\s*"?(-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)"?\s*[,}\s"]')
+_REPORT_FIELD = re.compile(r'"short_report"\s*:\s*"((?:[^"\\]|\\.)*)("?)', re.S)
+# Flat JSON objects, for salvaging per-user results of a broken batch answer
+_OBJECT = re.compile(r"\{[^{}]*\}")
+
+
+def strip_fences(text: str) -> str:
+    """The JSON part of an answer: inside a ``` fence if there is one, from the first { or ["""
+    match = _FENCE.search(text)
+    if match:
+        text = match.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    return text[min(starts):].strip() if starts else text.strip()
+
+
+def _loads(text: str) -> Any:
+    """json.loads, retried without trailing commas and without text after the last }"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Never by closing a cut-off answer: {"risk": 0 may have been {"risk": 0.9
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    end = text.rfind("}")
+    for candidate in (text, text[:end + 1] if end != -1 else text):
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    raise RiskResponseError("Answer is not JSON")
+
+
+def validate_report(data: Any) -> RiskReport:
+    """RiskReport of a decoded answer object; raises RiskResponseError"""
+    if not isinstance(data, dict):
+        raise RiskResponseError(f"Expected an object, got {type(data).__name__}")
+    if "risk" not in data:
+        raise RiskResponseError("No risk in answer")
+    # float() would also take true/false and "nan"/"inf"
+    if isinstance(data["risk"], bool):
+        raise RiskResponseError(f"Risk is not a number: {data['risk']!r}")
+    try:
+        risk = float(data["risk"])
+    except (TypeError, ValueError):
+        raise RiskResponseError(f"Risk is not a number: {data['risk']!r}")
+    if not math.isfinite(risk):
+        raise RiskResponseError(f"Risk is not a number: {data['risk']!r}")
+    if not 0.0 <= risk <= 1.0:
+        raise RiskResponseError(f"Risk out of range: {risk}")
+    report = data.get("short_report", "")
+    return RiskReport(risk=risk, short_report=report if isinstance(report, str) else json.dumps(report))
+
+
+def _salvage(text: str) -> Optional[Dict[str, Any]]:
+    """risk (and whatever short_report there is) from an answer that is not JSON"""
+    # Only a risk followed by a delimiter: a number cut off at the end may be missing digits
+    match = _RISK_FIELD.search(text)
+    if match is None:
+        return None
+    data: Dict[str, Any] = {"risk": match.group(1)}
+    report = _REPORT_FIELD.search(text)
+    if report:
+        try:
+            data["short_report"] = json.loads(f'"{report.group(1)}"')
+        except ValueError:
+            data["short_report"] = report.group(1)
+    return data
+
+
+class RiskStream:
+    """
+    Incremental parse of one streamed answer.
+
+    feed returns the risk once, as soon as it is complete and in range;
+    text holds the answer so far for the final RiskResponseParser.parse.
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._scanned = 0
+        self.risk: Optional[float] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> Optional[float]:
+        self._chunks.append(chunk)
+        if self.risk is not None:
+            return None
+        text = self.text
+        # The field may straddle chunks: rescan a little before the new chunk
+        match = _RISK_FIELD.search(text, max(0, self._scanned - 32))
+        self._scanned = len(text)
+        if match is None:
+            return None
+        risk = float(match.group(1))
+        if not 0.0 <= risk <= 1.0:
+            return None
+        self.risk = risk
+        return risk
+
+
+class RiskResponseParser:
+    """Parses single and batch answers and counts how they went"""
+
+    def __init__(self):
+        self.parsed = 0
+        self.salvaged = 0       # not valid JSON, but a usable risk was recovered
+        self.failures = 0
+        self.results_failed = 0  # per-user results of batch answers that were unusable
+
+    def parse(self, text: str) -> RiskReport:
+        """RiskReport of a single-user answer; raises RiskResponseError"""
+        body = strip_fences(text)
+        try:
+            try:
+                report = validate_report(_loads(body))
+            except RiskResponseError:
+                data = _salvage(body)
+                if data is None:
+                    raise
+                report = validate_report(data)
+                self.salvaged += 1
+        except RiskResponseError:
+            self.failures += 1
+            raise
+        self.parsed += 1
+        return report
+
+    def _candidates(self, text: str) -> List[Any]:
+        body = strip_fences(text)
+        try:
+            data = _loads(body)
+            results = data.get("results") if isinstance(data, dict) else data
+            if isinstance(results, list):
+                return results
+        except RiskResponseError:
+            pass
+        # Truncated or otherwise broken answer: keep every complete per-user object
+        candidates = []
+        for match in _OBJECT.finditer(body):
+            try:
+                candidates.append(json.loads(_TRAILING_COMMA.sub(r"\1", match.group(0))))
+            except ValueError:
+                continue
+        if candidates:
+            self.salvaged += 1
+        return candidates
+
+    def parse_batch(self, text: str, user_ids: List[str]) -> Dict[str, Union[RiskReport, RiskResponseError]]:
+        """
+        Per-user results of a batch answer.
+
+        Returns:
+            {user_id: RiskReport or the RiskResponseError for that user};
+            raises RiskResponseError when no user got a valid result
+        """
+        wanted = set(user_ids)
+        results: Dict[str, Union[RiskReport, RiskResponseError]] = {}
+        for item in self._candidates(text):
+            if not isinstance(item, dict) or item.get("user_id") not in wanted:
+                continue
+            user_id = item["user_id"]
+            try:
+                results[user_id] = validate_report(item)
+            except RiskResponseError as e:
+                results.setdefault(user_id, RiskResponseError(f"{user_id}: {e}"))
+
+        if not any(isinstance(result, dict) for result in results.values()):
+            self.failures += 1
+            raise RiskResponseError(f"No usable result in batch answer of {len(user_ids)} users")
+        for user_id in user_ids:
+            results.setdefault(user_id, RiskResponseError(f"No result for {user_id} in batch answer"))
+        self.parsed += 1
+        self.results_failed += sum(isinstance(result, RiskResponseError) for result in results.values())
+        return results
+
+    def stream(self) -> RiskStream:
+        return RiskStream()
+
+    def stats(self) -> Dict[str, Any]:
+        answers = self.parsed + self.failures
+        return {
+            "parsed": self.parsed,
+            "salvaged": self.salvaged,
+            "parse_failures": self.failures,
+            "parse_failure_rate": round(self.failures / answers, 4) if answers else 0,
+            "batch_results_failed": self.results_failed,
+        }
@@ -0,0 +1,255 @@
+# agents/train_triage.py
+# Offline training of the main server's local triage model (backend/app/triage.py).
+#
+#   python -m agents.train_triage          (from backend/ai_services)
+#
+# Simulates users with RealTimeWearableData on a stepped clock, injects
+# emergency episodes (agents/episodes.py), and fits a logistic regression in
+# NumPy on hinge features of the vitals (how far a vital is past a clinical
+# limit, optionally ignored during exertion). Readings of a developed episode
+# are positives, normal readings negatives; readings while an episode ramps up
+# or while vitals recover after it are left out, they are what the uncertain
+# band is for.
+# Held-out users set the two thresholds of the model file:
+#   normal_below    at most MAX_MISSED_EPISODES of episodes have no reading at or
+#                   above it within EPISODE_WINDOW_SECONDS of being developed, and
+#                   at most MAX_ESCALATED_NORMAL of normal readings score above it
+#                   (the LLM budget)
+#   critical_above  at most MAX_FALSE_CRITICAL of normal readings score above it
+# Scores in between are escalated to the LLM by the main server.
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from agents.mimic_human import Activity, Clock, RealTimeWearableData, UserProfile
+from agents.episodes import EpisodeInjector
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "app", "triage_model.json")
+
+TRAIN_USERS = 160
+VALIDATION_USERS = 40
+SESSION_SECONDS = 1800
+EPISODES_PER_HOUR = 4.0
+RECOVERY_SECONDS = 120
+ACTIVITY_SEGMENT_SECONDS = (120, 600)
+TRAIN_STEPS = 600
+LEARNING_RATE = 0.05
+L2 = 1e-4
+MAX_MISSED_EPISODES = 0.005
+EPISODE_WINDOW_SECONDS = 60
+MAX_ESCALATED_NORMAL = 0.01
+MAX_FALSE_CRITICAL = 0.0005
+
+_EXERTION = ["running", "exercising"]
+
+# Feature spec written to the model file. Kinds:
+#   value   the vital itself
+#   below   max(0, at - vital)
+#   above   max(0, vital - at)
+#   activity  1 while the activity is in "in"
+# below/above are zero while the activity is in unless_activity, or not in
+# when_activity when that is given.
+TRIAGE_FEATURES: List[Dict[str, Any]] = [
+    {"metric": "heart_rate", "kind": "below", "at": 50},
+    {"metric": "heart_rate", "kind": "below", "at": 30},
+    {"metric": "heart_rate", "kind": "below", "at": 70, "when_activity": ["walking", "stressed"] + _EXERTION},
+    {"metric": "heart_rate", "kind": "above", "at": 120, "unless_activity": _EXERTION},
+    {"metric": "heart_rate", "kind": "above", "at": 175},
+    {"metric": "blood_oxygen", "kind": "below", "at": 95},
+    {"metric": "blood_oxygen", "kind": "below", "at": 90},
+    {"metric": "respiratory_rate", "kind": "below", "at": 10},
+    {"metric": "respiratory_rate", "kind": "above", "at": 24, "unless_activity": _EXERTION},
+    {"metric": "hrv", "kind": "above", "at": 90},
+    {"metric": "hrv", "kind": "below", "at": 15},
+    {"metric": "systolic_bp", "kind": "below", "at": 105},
+    {"metric": "systolic_bp", "kind": "below", "at": 90},
+    {"metric": "diastolic_bp", "kind": "below", "at": 62},
+    {"kind": "activity", "in": _EXERTION},
+    {"kind": "activity", "in": ["sleeping", "meditation"]},
+]
+
+
+class SteppedClock(Clock):
+    """Simulated time advanced explicitly, so sessions generate as fast as the CPU allows"""
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance(self, seconds: float) -> None:
+        self.current += timedelta(seconds=seconds)
+
+
+# -------------------------------
+# Data
+# -------------------------------
+def random_profile(user_id: str, rng: random.Random) -> UserProfile:
+    return UserProfile(user_id=user_id, age=rng.randint(18, 85), gender=rng.choice(["M", "F"]),
+                       weight_kg=round(rng.uniform(50, 110), 1), height_cm=round(rng.uniform(150, 195), 1),
+                       fitness_level=rng.choice(["low", "average", "high"]))
+
+
+def simulate_user(user_id: str, seconds: int, seed: int) -> List[Tuple[Dict[str, Any], str, float]]:
+    """
+    One session of 1 Hz readings with random activities and episodes.
+
+    Returns:
+        (reading, label, seconds since developed) per tick; label is "normal",
+        "ramp" (episode developing), "episode" (developed) or "recovery"
+        (RECOVERY_SECONDS after an episode)
+    """
+    rng = random.Random(seed)
+    clock = SteppedClock(datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(24 * 60)))
+    injector = EpisodeInjector(RealTimeWearableData(random_profile(user_id, rng), clock=clock), seed=seed)
+    injector.schedule_random(EPISODES_PER_HOUR, seconds)
+    activities = [activity.value for activity in Activity]
+    activity, segment_left = rng.choice(activities), 0
+    recovered_at = None
+
+    samples = []
+    for _ in range(seconds):
+        if segment_left <= 0:
+            activity, segment_left = rng.choice(activities), rng.randint(*ACTIVITY_SEGMENT_SECONDS)
+        segment_left -= 1
+        data = injector.generate_realtime_data(activity)
+        episode = injector.active_episode(clock.now())
+        if episode is not None:
+            recovered_at = episode.end + timedelta(seconds=RECOVERY_SECONDS)
+            developed = (clock.now() - episode.onset).total_seconds() - episode.ramp_seconds
+            samples.append((data, "episode" if developed >= 0 else "ramp", developed))
+        elif recovered_at is not None and clock.now() < recovered_at:
+            samples.append((data, "recovery", np.nan))
+        else:
+            samples.append((data, "normal", np.nan))
+        clock.advance(1)
+    return samples
+
+
+def feature_matrix(readings: Sequence[Dict[str, Any]], features: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Features of generate_realtime_data dicts; must match TriageModel.features in backend/app/triage.py"""
+    activity = np.array([reading["current_activity"] for reading in readings])
+    columns = []
+    for feature in features:
+        if feature["kind"] == "activity":
+            columns.append(np.isin(activity, feature["in"]).astype(float))
+            continue
+        values = np.array([float(reading["physiological_metrics"][feature["metric"]]) for reading in readings])
+        if feature["kind"] == "below":
+            values = np.maximum(0.0, feature["at"] - values)
+        elif feature["kind"] == "above":
+            values = np.maximum(0.0, values - feature["at"])
+        if feature.get("unless_activity"):
+            values = values * ~np.isin(activity, feature["unless_activity"])
+        if feature.get("when_activity"):
+            values = values * np.isin(activity, feature["when_activity"])
+        columns.append(values)
+    return np.stack(columns, axis=1)
+
+
+def build_dataset(users: int, seconds: int, first_seed: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Features, labels, episode ids ("" outside episodes) and seconds since developed of simulated sessions"""
+    readings: List[Dict[str, Any]] = []
+    labels: List[str] = []
+    developed: List[float] = []
+    for i in range(users):
+        for data, label, since in simulate_user(f"TRAIN_{first_seed + i}", seconds, first_seed + i):
+            readings.append(data)
+            labels.append(label)
+            developed.append(since)
+    episode_ids = np.array([data["ground_truth"].get("episode_id") or "" for data in readings])
+    return feature_matrix(readings, TRIAGE_FEATURES), np.array(labels), episode_ids, np.array(developed)
+
+
+# -------------------------------
+# Model
+# -------------------------------
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def fit_logistic(x: np.ndarray, y: np.ndarray, steps: int = TRAIN_STEPS,
+                 learning_rate: float = LEARNING_RATE, l2: float = L2) -> Tuple[np.ndarray, float]:
+    """Class-balanced logistic regression by full-batch Adam; returns (weights, bias)"""
+    n, f = x.shape
+    sample_weight = np.where(y == 1, 0.5 / max(1, y.sum()), 0.5 / max(1, n - y.sum()))
+    params = np.zeros(f + 1)
+    m = np.zeros_like(params)
+    v = np.zeros_like(params)
+    for step in range(1, steps + 1):
+        error = (_sigmoid(x @ params[:f] + params[f]) - y) * sample_weight
+        grad = np.append(x.T @ error + l2 * params[:f], error.sum())
+        m = 0.9 * m + 0.1 * grad
+        v = 0.999 * v + 0.001 * grad ** 2
+        params -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+    return params[:f], float(params[f])
+
+
+def roc_auc(scores: np.ndarray, y: np.ndarray) -> float:
+    ranks = np.empty(len(scores))
+    ranks[np.argsort(scores)] = np.arange(1, len(scores) + 1)
+    positives = y.sum()
+    return float((ranks[y == 1].sum() - positives * (positives + 1) / 2) / (positives * (len(y) - positives)))
+
+
+def train(train_users: int = TRAIN_USERS, validation_users: int = VALIDATION_USERS,
+          seconds: int = SESSION_SECONDS, seed: int = 0) -> Dict[str, Any]:
+    """Simulate, fit and calibrate; returns the model file contents"""
+    x, labels, _, _ = build_dataset(train_users, seconds, seed)
+    developed = labels == "episode"
+    keep = (labels == "normal") | developed
+    mean = x[keep].mean(axis=0)
+    scale = np.where(x[keep].std(axis=0) > 0, x[keep].std(axis=0), 1.0)
+    weights, bias = fit_logistic((x[keep] - mean) / scale, developed[keep].astype(float))
+
+    x_val, labels_val, episodes_val, since_val = build_dataset(validation_users, seconds, seed + 100_000)
+    scores = _sigmoid(((x_val - mean) / scale) @ weights + bias)
+    normal = labels_val == "normal"
+    developed_val = labels_val == "episode"
+    # Best score of every episode shortly after it developed
+    early = developed_val & (since_val < EPISODE_WINDOW_SECONDS)
+    episode_best = np.array([scores[early & (episodes_val == episode)].max()
+                             for episode in np.unique(episodes_val[early])])
+    normal_below = float(min(np.quantile(episode_best, MAX_MISSED_EPISODES),
+                             np.quantile(scores[normal], 1 - MAX_ESCALATED_NORMAL)))
+    critical_above = float(max(np.quantile(scores[normal], 1 - MAX_FALSE_CRITICAL), normal_below))
+
+    tiers = np.digitize(scores, [normal_below, critical_above])
+    evaluation = {
+        "train_readings": int(keep.sum()),
+        "validation_readings": len(scores),
+        "auc": round(roc_auc(scores[normal | developed_val], developed_val[normal | developed_val]), 4),
+        "resolved_locally": round(float(np.mean(tiers != 1)), 4),
+        "normal_readings_escalated": round(float(np.mean(tiers[normal] == 1)), 4),
+        "episode_readings_critical": round(float(np.mean(tiers[developed_val] == 2)), 4),
+        "episode_readings_missed": round(float(np.mean(tiers[developed_val] == 0)), 4),
+        "episodes": len(episode_best),
+        "episodes_missed": int(np.sum(episode_best < normal_below)),
+        "episodes_critical": round(float(np.mean(episode_best >= critical_above)), 4),
+        "ramp_readings_escalated_or_critical": round(float(np.mean(tiers[labels_val == "ramp"] >= 1)), 4),
+    }
+    return {
+        "version": 1,
+        "trained_at": datetime.now().isoformat(timespec="seconds"),
+        "features": TRIAGE_FEATURES,
+        "mean": mean.round(6).tolist(),
+        "scale": scale.round(6).tolist(),
+        "weights": weights.round(6).tolist(),
+        "bias": round(bias, 6),
+        "normal_below": round(normal_below, 6),
+        "critical_above": round(critical_above, 6),
+        "evaluation": evaluation,
+    }
+
+
+if __name__ == "__main__":
+    model = train()
+    with open(MODEL_PATH, "w") as f:
+        json.dump(model, f, indent=2)
+    print(f"✅ Triage model written to {os.path.normpath(MODEL_PATH)}")
+    print(json.dumps(model["evaluation"], indent=2))
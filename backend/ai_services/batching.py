@@ -0,0 +1,79 @@
+# batching.py
+# Size/latency-bounded batching of readings on the mimic -> main server link.
+#
+# Frame format (one WebSocket text message):
+#   {"type": "batch", "readings": [{"user_id": ..., "data": {...}}, ...]}
+# The main server still accepts the single-reading {"user_id", "data"} frame.
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+BATCH_MAX_READINGS = 500
+BATCH_MAX_BYTES = 512 * 1024
+BATCH_MAX_DELAY_SECONDS = 0.05
+
+_FRAME_PREFIX = '{"type":"batch","readings":['
+_FRAME_SUFFIX = ']}'
+
+
+class FrameBatcher:
+    """
+    Accumulates serialized readings and sends them as one batch frame.
+
+    A batch is flushed as soon as it holds max_readings readings or
+    max_bytes of JSON, or once its oldest reading has waited max_delay
+    seconds (checked by flush_if_due, which the send loop calls every tick).
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[Any]],
+                 max_readings: int = BATCH_MAX_READINGS,
+                 max_bytes: int = BATCH_MAX_BYTES,
+                 max_delay: float = BATCH_MAX_DELAY_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.send = send
+        self.max_readings = max_readings
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.clock = clock
+        self._parts: List[str] = []
+        self._bytes = 0
+        self._oldest = 0.0
+
+        self.frames_sent = 0
+        self.readings_sent = 0
+
+    def __len__(self) -> int:
+        return len(self._parts)
+
+    async def add(self, user_id: str, data: Dict[str, Any]) -> None:
+        part = json.dumps({"user_id": user_id, "data": data}, separators=(",", ":"))
+        if not self._parts:
+            self._oldest = self.clock()
+        elif self._bytes + len(part) > self.max_bytes:
+            await self.flush()
+            self._oldest = self.clock()
+        self._parts.append(part)
+        self._bytes += len(part) + 1
+        if len(self._parts) >= self.max_readings:
+            await self.flush()
+
+    async def flush_if_due(self) -> None:
+        if self._parts and self.clock() - self._oldest >= self.max_delay:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._parts:
+            return
+        parts = self._parts
+        self._parts = []
+        self._bytes = 0
+        await self.send(_FRAME_PREFIX + ",".join(parts) + _FRAME_SUFFIX)
+        self.frames_sent += 1
+        self.readings_sent += len(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frames_sent": self.frames_sent,
+            "readings_per_frame": round(self.readings_sent / self.frames_sent, 1) if self.frames_sent else 0,
+            "pending_readings": len(self._parts),
+        }
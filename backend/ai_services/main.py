@@ -1,85 +1,154 @@
 # mimic_server.py
 import asyncio
-import json
+import os
 import random
-from typing import Dict, List
+from typing import Dict, List, Optional, Union
 from fastapi import FastAPI
-import websockets
 import firebase_admin
 from firebase_admin import credentials, firestore
 from agents.mimic_human import UserProfile, RealTimeWearableData, Activity
+from agents.episodes import EpisodeInjector
+from sharding import EPISODE_HORIZON_SECONDS, ShardManager
+from scheduler import TickScheduler, clamp_rate
+from batching import FrameBatcher
+from stream_sink import StreamSink, open_upstream
+from user_source import UserSource, UserRecord, ChangeType, FakeUserCollection
 
 # -------------------------------
 # CONFIGURATION
 # -------------------------------
 MAIN_SERVER_WS = "ws://localhost:8000/ws/mimic_receive"  # main server WS
-MAX_USERS = 5
+# Cap on streamed users (0 = every user in the collection)
+MAX_USERS = int(os.getenv("MAX_USERS", "0"))
+# "firestore" (honours FIRESTORE_EMULATOR_HOST) or "fake" for an in-memory collection
+USER_SOURCE = os.getenv("USER_SOURCE", "firestore")
+FAKE_USERS = int(os.getenv("FAKE_USERS", "100"))
+USER_PAGE_SIZE = int(os.getenv("USER_PAGE_SIZE", "500"))
+# Number of worker processes in sharded mode (0 = single event loop)
+MIMIC_SHARDS = int(os.getenv("MIMIC_SHARDS", "0"))
+# Labeled emergency episodes injected per user per hour (0 disables injection)
+EPISODE_RATE_PER_HOUR = float(os.getenv("EPISODE_RATE_PER_HOUR", "0"))
 
 app = FastAPI(title="Mimic Wearable Data Server")
 
 # -------------------------------
 # Firebase setup
 # -------------------------------
-cred = credentials.Certificate("firebase-key.json")  # put your Firebase service account JSON here
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+if USER_SOURCE == "fake":
+    users_collection = FakeUserCollection.with_synthetic_users(FAKE_USERS)
+else:
+    cred = credentials.Certificate("firebase-key.json")  # put your Firebase service account JSON here
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+    users_collection = db.collection("users")
+user_source = UserSource(users_collection, page_size=USER_PAGE_SIZE, max_users=MAX_USERS or None)
 
 # -------------------------------
 # Data structures
 # -------------------------------
-user_generators: Dict[str, RealTimeWearableData] = {}  # user_id -> data generator
+user_profiles: Dict[str, UserProfile] = {}            # user_id -> profile of every streamed user
+user_generators: Dict[str, Union[RealTimeWearableData, EpisodeInjector]] = {}  # user_id -> data generator (created lazily)
 user_activities: Dict[str, str] = {}                   # user_id -> current activity
+user_rates: Dict[str, float] = {}                      # user_id -> sampling rate (Hz)
+scheduler = TickScheduler()
+shard_manager: Optional[ShardManager] = None           # set in sharded mode
+batcher: Optional[Union[FrameBatcher, StreamSink]] = None  # current upstream batcher
+sent_total = 0
 
 # -------------------------------
-# Fetch users from Firebase
-# -------------------------------
-def get_users_from_db(limit: int = MAX_USERS) -> List[UserProfile]:
-    users_ref = db.collection("users").limit(limit).stream()
-    profiles = []
-    for doc in users_ref:
-        data = doc.to_dict()
-        profiles.append(UserProfile(
-            user_id=data["user_id"],
-            age=data.get("age", 30),
-            gender=data.get("gender", "M"),
-            weight_kg=data.get("weight_kg", 70),
-            height_cm=data.get("height_cm", 170),
-            fitness_level=data.get("fitness_level", "average")
-        ))
-    return profiles
+# User membership
+# -------------------------------
+def get_generator(user_id: str) -> Union[RealTimeWearableData, EpisodeInjector]:
+    """Data generator of a user, created on its first sample"""
+    generator = user_generators.get(user_id)
+    if generator is None:
+        generator = RealTimeWearableData(user_profiles[user_id])
+        if EPISODE_RATE_PER_HOUR > 0:
+            generator = EpisodeInjector(generator)
+            generator.schedule_random(EPISODE_RATE_PER_HOUR, EPISODE_HORIZON_SECONDS)
+        user_generators[user_id] = generator
+    return generator
+
+def add_users(records: List[UserRecord]) -> int:
+    """Start streaming new users (known users only get their sampling rate updated)"""
+    new_records = []
+    for record in records:
+        user_id = record.user_id
+        if user_id in user_profiles:
+            if user_rates.get(user_id) != record.sampling_hz:
+                user_rates[user_id] = record.sampling_hz
+                if shard_manager is not None:
+                    shard_manager.set_rate(user_id, record.sampling_hz)
+                else:
+                    scheduler.set_rate(user_id, record.sampling_hz)
+            continue
+        if MAX_USERS and len(user_profiles) >= MAX_USERS:
+            continue
+        user_profiles[user_id] = record.profile
+        user_rates[user_id] = record.sampling_hz
+        new_records.append(record)
+
+    if shard_manager is not None:
+        shard_manager.add_users((r.profile for r in new_records), user_rates)
+    else:
+        for record in new_records:
+            user_activities[record.user_id] = Activity.RESTING.value
+            scheduler.add(record.user_id, record.sampling_hz)
+    return len(new_records)
+
+def remove_user(user_id: str) -> None:
+    if user_profiles.pop(user_id, None) is None:
+        return
+    user_rates.pop(user_id, None)
+    if shard_manager is not None:
+        shard_manager.remove_users([user_id])
+    else:
+        scheduler.remove(user_id)
+        user_generators.pop(user_id, None)
+        user_activities.pop(user_id, None)
+
+def on_user_change(change: ChangeType, payload) -> None:
+    """Snapshot listener callback (runs on the event loop)"""
+    if change == ChangeType.REMOVE:
+        remove_user(payload)
+        print(f"➖ User {payload} removed")
+    elif add_users([payload]):
+        print(f"➕ User {payload.user_id} added")
+
+async def load_users():
+    """Stream users in pages (sending starts with the first page), then follow changes"""
+    loaded = 0
+    async for page in user_source.stream_pages():
+        loaded += add_users(page)
+    print(f"✅ Loaded {loaded} users from {USER_SOURCE}.")
+    user_source.watch(on_user_change)
 
 # -------------------------------
 # Mimic streaming logic
 # -------------------------------
 async def send_to_main_server():
+    global sent_total, batcher
     while True:
-        if not user_generators:
+        if not user_profiles:
             await asyncio.sleep(1)
             continue
 
         try:
-            async with websockets.connect(MAIN_SERVER_WS) as ws:
-                while True:
-                    for user_id, generator in user_generators.items():
+            async with open_upstream(MAIN_SERVER_WS) as batcher:
+                async for due in scheduler.run():
+                    for user_id, period in due:
+                        if user_id not in user_profiles:
+                            continue
+                        generator = get_generator(user_id)
                         activity = user_activities.get(user_id, random.choice(list(Activity)).value)
-                        data = generator.generate_realtime_data(activity)
-                        payload = {"user_id": user_id, "data": data}
-                        await ws.send(json.dumps(payload))
-                    await asyncio.sleep(1)
+                        data = generator.generate_realtime_data(activity, duration_seconds=period)
+                        await batcher.add(user_id, data)
+                        sent_total += 1
+                    await batcher.flush_if_due()
         except Exception as e:
             print(f"❌ Connection to main server lost: {e}")
             await asyncio.sleep(5)  # retry after delay
 
-# -------------------------------
-# Initialize mimic users from Firebase
-# -------------------------------
-def init_users():
-    profiles = get_users_from_db()
-    for profile in profiles:
-        user_generators[profile.user_id] = RealTimeWearableData(profile)
-        user_activities[profile.user_id] = Activity.RESTING.value
-    print(f"✅ Initialized {len(profiles)} users from Firebase.")
-
 # -------------------------------
 # HTTP endpoints
 # -------------------------------
@@ -89,15 +158,59 @@ async def root():
 
 @app.get("/active_users")
 async def active_users():
-    return {"users": list(user_generators.keys()), "total": len(user_generators)}
+    if shard_manager is not None:
+        return {"users": list(shard_manager.user_shard.keys()), "total": len(shard_manager.user_shard)}
+    return {"users": list(user_profiles.keys()), "total": len(user_profiles)}
+
+@app.get("/stats")
+async def stats():
+    if shard_manager is not None:
+        return shard_manager.aggregate_stats()
+    batch_stats = batcher.stats() if batcher is not None else {}
+    return {"mode": "single", "users": len(user_profiles), "sent_total": sent_total,
+            **scheduler.stats(), **batch_stats}
+
+@app.post("/sampling_rate/{user_id}")
+async def set_sampling_rate(user_id: str, hz: float):
+    rate_hz = clamp_rate(hz)
+    user_rates[user_id] = rate_hz
+    if shard_manager is not None:
+        shard_manager.set_rate(user_id, rate_hz)
+    else:
+        scheduler.set_rate(user_id, rate_hz)
+    return {"user_id": user_id, "sampling_hz": rate_hz}
+
+@app.get("/episodes")
+async def episodes():
+    """Ground-truth labels of injected emergency episodes"""
+    if shard_manager is not None:
+        labels = shard_manager.episode_labels
+        return {"episodes": labels, "total": len(labels)}
+    labels = []
+    for generator in user_generators.values():
+        if isinstance(generator, EpisodeInjector):
+            labels.extend(generator.labels())
+    return {"episodes": labels, "total": len(labels)}
 
 # -------------------------------
 # Startup event
 # -------------------------------
 @app.on_event("startup")
 async def startup_event():
-    init_users()
-    asyncio.create_task(send_to_main_server())
+    global shard_manager
+    if MIMIC_SHARDS > 0:
+        shard_manager = ShardManager(MIMIC_SHARDS, MAIN_SERVER_WS, EPISODE_RATE_PER_HOUR)
+        shard_manager.start()
+        asyncio.create_task(shard_manager.run_stats_pump())
+    else:
+        asyncio.create_task(send_to_main_server())
+    asyncio.create_task(load_users())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    user_source.close()
+    if shard_manager is not None:
+        shard_manager.stop()
 
 # -------------------------------
 # Run server
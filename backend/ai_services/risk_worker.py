@@ -0,0 +1,237 @@
+# risk_worker.py
+# Second tier of the main server's triage (backend/app/triage.py): LLM risk
+# assessment of the readings its local model could not call either way.
+#
+#   REDIS_URL=redis://... GOOGLE_API_KEY=... python risk_worker.py
+#
+# Reads vitals:triage through the "risk" consumer group (run as many workers
+# as the LLM quota allows; each entry goes to one of them). Every escalated
+# reading is scored through CachedRiskScorer -> RiskBatcher ->
+# RiskAssessmentClient and becomes an "llm_risk" detection: onset at or above
+# RISK_ALERT_THRESHOLD, clear below it. The detections go back in one entry to
+# the escalation's reply_to stream (its raw partition for a detection worker,
+# vitals:analyzed for an inline main server), where the escalating process
+# feeds them to its AlertManager like any other rule; the triage entry is
+# acked in the same round trip. A reading the LLM failed on is counted and
+# dropped: the local model has already seen it, and its user is escalated
+# again on the next uncertain reading.
+# Entries left pending by a dead worker are reclaimed after CLAIM_IDLE_MS.
+# Stream names and the entry layout must match backend/app/broker.py.
+#
+# RISK_BACKEND=fake scores with FakeLLMBackend (local runs without an API key).
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import Any, Dict, List, Set
+
+from agents.risk_batcher import RiskBatcher
+from agents.risk_cache import REDIS_URL, CachedRiskScorer, create_risk_scorer
+from agents.risk_client import FakeLLMBackend, GeminiBackend, LLMBackend, RiskAssessmentClient
+
+TRIAGE_STREAM = "vitals:triage"
+RISK_GROUP = "risk"
+RISK_RULE = "llm_risk"
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "100000"))
+
+# "gemini" (GOOGLE_API_KEY) or "fake"
+RISK_BACKEND = os.getenv("RISK_BACKEND", "gemini")
+RISK_ALERT_THRESHOLD = float(os.getenv("RISK_ALERT_THRESHOLD", "0.5"))
+RISK_CRITICAL_THRESHOLD = float(os.getenv("RISK_CRITICAL_THRESHOLD", "0.8"))
+# Entries scored at once; beyond this the worker stops reading and entries wait in the stream
+RISK_WORKER_MAX_ENTRIES = int(os.getenv("RISK_WORKER_MAX_ENTRIES", "256"))
+READ_COUNT = 64
+READ_BLOCK_MS = 1000
+CLAIM_IDLE_MS = 60_000
+CLAIM_INTERVAL_SECONDS = 30.0
+STATS_INTERVAL_SECONDS = 60.0
+
+
+def _text(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def snapshot(data: Dict[str, Any]) -> str:
+    """Health snapshot of a reading for the prompt; simulator labels never reach the model"""
+    return json.dumps({key: value for key, value in data.items() if key != "ground_truth"},
+                      separators=(",", ":"))
+
+
+def risk_detection(user_id: str, data: Dict[str, Any], risk: float, short_report: str,
+                   threshold: float) -> Dict[str, Any]:
+    """Fields of the main server's Detection (app/detector.py) for one assessed reading"""
+    return {
+        "user_id": user_id,
+        "rule": RISK_RULE,
+        "metric": "risk",
+        "stat": "llm",
+        "value": round(risk, 4),
+        "score": risk,
+        "threshold": threshold,
+        "severity": "critical" if risk >= RISK_CRITICAL_THRESHOLD else "warning",
+        "timestamp": data.get("timestamp"),
+        "description": short_report or "AI risk assessment",
+        "event": "onset" if risk >= threshold else "clear",
+    }
+
+
+class RiskWorker:
+    """Consumer of vitals:triage; see the module header"""
+
+    def __init__(self, redis: Any, scorer: CachedRiskScorer, consumer: str,
+                 threshold: float = RISK_ALERT_THRESHOLD,
+                 max_entries: int = RISK_WORKER_MAX_ENTRIES):
+        self.redis = redis
+        self.scorer = scorer
+        self.consumer = consumer
+        self.threshold = threshold
+        self._slots = asyncio.Semaphore(max_entries)
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.entries = 0
+        self.readings = 0
+        self.alerts = 0
+        self.failures = 0
+        self.rejected = 0
+
+    async def setup(self) -> None:
+        from redis.exceptions import ResponseError
+
+        try:
+            await self.redis.xgroup_create(TRIAGE_STREAM, RISK_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _score(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Detection fields for one reading"""
+        assessment = await self.scorer.assess(user_id, snapshot(data), data.get("age"))
+        return risk_detection(user_id, data, assessment.risk, assessment.short_report, self.threshold)
+
+    async def handle(self, entry_id: Any, fields: Dict[Any, Any]) -> None:
+        """Score every reading of an entry, reply with its detections and ack it"""
+        fields = {_text(key): value for key, value in fields.items()}
+        try:
+            readings = json.loads(fields["frame"])["readings"]
+            user_ids = [envelope["user_id"] for envelope in readings]
+            reply_to = _text(fields["reply_to"])
+        except (TypeError, ValueError, KeyError):
+            readings = user_ids = []
+            reply_to = None
+            self.rejected += 1
+        results = await asyncio.gather(*(self._score(user_id, envelope["data"])
+                                         for user_id, envelope in zip(user_ids, readings)),
+                                       return_exceptions=True)
+        detections = []
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                self.failures += 1
+                if self.failures == 1:
+                    print(f"⚠️ Risk assessment failed for {user_id}: {result}")
+                continue
+            if result["event"] == "onset":
+                print(f"🚨 [LLM RISK] {user_id}: risk={result['value']:g} {result['description']}")
+            detections.append(result)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if detections:
+                reply = {"detections": json.dumps(detections)}
+                if "node" in fields:
+                    reply["node"] = _text(fields["node"])
+                pipe.xadd(reply_to, reply, maxlen=STREAM_MAXLEN, approximate=True)
+            pipe.xack(TRIAGE_STREAM, RISK_GROUP, entry_id)
+            await pipe.execute()
+        self.entries += 1
+        self.readings += len(readings)
+        self.alerts += sum(detection["event"] == "onset" for detection in detections)
+
+    async def _dispatch(self, entries: List[Any]) -> None:
+        for entry_id, fields in entries:
+            await self._slots.acquire()
+            task = asyncio.create_task(self.handle(entry_id, fields))
+            task.add_done_callback(lambda done: (self._tasks.discard(done), self._slots.release()))
+            self._tasks.add(task)
+
+    async def reclaim(self, min_idle_ms: int) -> None:
+        """Entries other (dead) workers left unacked"""
+        start = "0-0"
+        while True:
+            start, entries, *_ = await self.redis.xautoclaim(TRIAGE_STREAM, RISK_GROUP, self.consumer,
+                                                             min_idle_ms, start, count=READ_COUNT)
+            await self._dispatch(entries)
+            if not entries or _text(start) == "0-0":
+                break
+
+    async def run(self) -> None:
+        await self.setup()
+        # Own entries from before a restart, then everyone's stale ones
+        response = await self.redis.xreadgroup(RISK_GROUP, self.consumer, {TRIAGE_STREAM: "0"})
+        for _, entries in response or []:
+            await self._dispatch(entries)
+        await self.reclaim(CLAIM_IDLE_MS)
+        last_claim = last_stats = time.monotonic()
+        while True:
+            response = await self.redis.xreadgroup(RISK_GROUP, self.consumer, {TRIAGE_STREAM: ">"},
+                                                   count=READ_COUNT, block=READ_BLOCK_MS)
+            for _, entries in response or []:
+                await self._dispatch(entries)
+            now = time.monotonic()
+            if now - last_claim >= CLAIM_INTERVAL_SECONDS:
+                await self.reclaim(CLAIM_IDLE_MS)
+                last_claim = now
+            if now - last_stats >= STATS_INTERVAL_SECONDS:
+                print(f"📊 [RISK] {self.stats()}")
+                last_stats = now
+
+    async def close(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": self.entries,
+            "readings": self.readings,
+            "alerts": self.alerts,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "in_flight": len(self._tasks),
+            "cache": self.scorer.stats(),
+        }
+
+
+# -------------------------------
+# Run worker
+# -------------------------------
+def create_backend(name: str = RISK_BACKEND) -> LLMBackend:
+    if name == "fake":
+        return FakeLLMBackend()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise SystemExit("ERROR: set GOOGLE_API_KEY, or RISK_BACKEND=fake for local runs")
+    return GeminiBackend(api_key)
+
+
+async def main() -> None:
+    import redis.asyncio as redis
+
+    client = RiskAssessmentClient(create_backend())
+    batcher = RiskBatcher(client)
+    scorer = create_risk_scorer(batcher.assess)
+    connection = redis.from_url(REDIS_URL)
+    worker = RiskWorker(connection, scorer, f"risk-{socket.gethostname()}-{os.getpid()}")
+    print(f"✅ Risk worker consuming {TRIAGE_STREAM} ({RISK_BACKEND}, alerts at risk >= {RISK_ALERT_THRESHOLD})")
+    try:
+        await worker.run()
+    finally:
+        await worker.close()
+        await batcher.close()
+        await client.close()
+        await scorer.close()
+        await connection.aclose()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,152 @@
+# scheduler.py
+# Drift-free per-user tick scheduling for the mimic server.
+import asyncio
+import time
+import zlib
+from typing import Dict, List, Tuple, Callable, AsyncIterator, Any
+
+DEFAULT_SAMPLING_HZ = 1.0
+MIN_RATE_HZ = 0.2
+MAX_RATE_HZ = 25.0
+
+
+def clamp_rate(rate_hz: float) -> float:
+    return max(MIN_RATE_HZ, min(MAX_RATE_HZ, float(rate_hz)))
+
+
+class _Entry:
+    __slots__ = ('key', 'period', 'due', 'active')
+
+    def __init__(self, key: str, period: float, due: float):
+        self.key = key
+        self.period = period
+        self.due = due
+        self.active = True
+
+
+class TickScheduler:
+    """
+    Hashed timing wheel on the monotonic clock.
+
+    Every key (user) has its own sampling rate. Due times are computed from
+    the previous *scheduled* time, never from when the work actually ran, so
+    rates don't drift as load grows. Each key starts at a phase derived from
+    its hash, which spreads sends evenly across the period instead of
+    bursting at the top of every second.
+    """
+
+    def __init__(self, resolution: float = 0.01, wheel_size: int = 1024,
+                 clock: Callable[[], float] = time.monotonic,
+                 max_catch_up_periods: int = 2):
+        self.resolution = resolution
+        self.wheel_size = wheel_size
+        self.clock = clock
+        self.max_catch_up_periods = max_catch_up_periods
+        self._slots: List[List[_Entry]] = [[] for _ in range(wheel_size)]
+        self._entries: Dict[str, _Entry] = {}
+        self._origin = clock()
+        self._cursor = 0  # next wheel tick (in resolution units since origin) to process
+
+        # Lag metrics: how late work ran relative to its scheduled time
+        self.fired = 0
+        self.skipped = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_ewma = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _place(self, entry: _Entry, earliest_tick: int) -> None:
+        tick = max(int((entry.due - self._origin) / self.resolution), earliest_tick)
+        self._slots[tick % self.wheel_size].append(entry)
+
+    def add(self, key: str, rate_hz: float) -> None:
+        """Schedule a key at rate_hz (clamped to MIN_RATE_HZ..MAX_RATE_HZ)"""
+        self.remove(key)
+        period = 1.0 / clamp_rate(rate_hz)
+        phase = (zlib.crc32(key.encode()) / 2 ** 32) * period
+        entry = _Entry(key, period, self.clock() + phase)
+        self._entries[key] = entry
+        self._place(entry, self._cursor)
+
+    def remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            # Lazily dropped when its slot comes up
+            entry.active = False
+
+    def set_rate(self, key: str, rate_hz: float) -> None:
+        if key in self._entries:
+            self.add(key, rate_hz)
+
+    def rate(self, key: str) -> float:
+        return 1.0 / self._entries[key].period
+
+    def _record_lag(self, lag: float) -> None:
+        self.fired += 1
+        self.lag_last = lag
+        if lag > self.lag_max:
+            self.lag_max = lag
+        self.lag_ewma += (lag - self.lag_ewma) * 0.01
+
+    def poll(self, now: float = None) -> List[Tuple[str, float]]:
+        """
+        Collect everything due up to `now`.
+
+        Returns:
+            (key, period) pairs; period is the simulated time the sample covers
+        """
+        if now is None:
+            now = self.clock()
+        target = int((now - self._origin) / self.resolution)
+        due: List[Tuple[str, float]] = []
+
+        while self._cursor <= target:
+            tick = self._cursor
+            slot_index = tick % self.wheel_size
+            slot = self._slots[slot_index]
+            if slot:
+                self._slots[slot_index] = []
+                for entry in slot:
+                    if not entry.active:
+                        continue
+                    if entry.due > now:
+                        # Later round of the wheel, or later within this tick
+                        self._place(entry, tick + 1)
+                        continue
+                    self._record_lag(now - entry.due)
+                    due.append((entry.key, entry.period))
+                    entry.due += entry.period
+                    # Too far behind: skip missed samples instead of bursting to catch up
+                    if now - entry.due > self.max_catch_up_periods * entry.period:
+                        missed = int((now - entry.due) / entry.period)
+                        self.skipped += missed
+                        entry.due += missed * entry.period
+                    self._place(entry, tick + 1)
+            self._cursor += 1
+        return due
+
+    def next_wakeup(self) -> float:
+        """Monotonic time of the next wheel tick boundary"""
+        return self._origin + self._cursor * self.resolution
+
+    async def run(self) -> AsyncIterator[List[Tuple[str, float]]]:
+        """Yield the (key, period) pairs due at every wheel tick (possibly none)"""
+        while True:
+            yield self.poll()
+            delay = self.next_wakeup() - self.clock()
+            await asyncio.sleep(max(0.0, delay))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "scheduled_users": len(self._entries),
+            "fired": self.fired,
+            "skipped": self.skipped,
+            "lag_last_ms": round(self.lag_last * 1000, 2),
+            "lag_ewma_ms": round(self.lag_ewma * 1000, 2),
+            "lag_max_ms": round(self.lag_max * 1000, 2),
+        }
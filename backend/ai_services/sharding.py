@@ -0,0 +1,239 @@
+# sharding.py
+# Multi-process sharded mode for the mimic server: every worker process owns
+# a slice of the users, simulates them with a WearableFleet and streams to the
+# main server over its own upstream connection (WebSocket, or the vitals:raw
+# streams with MIMIC_SINK=redis, see stream_sink.py). With an episode rate,
+# each worker also injects labelled emergency episodes into its own users and
+# sends the labels of newly scheduled ones to the parent with its stats.
+import asyncio
+import queue
+import time
+import zlib
+import multiprocessing as mp
+from typing import Dict, List, Any, Iterable, Optional
+
+import numpy as np
+
+from agents.mimic_human import UserProfile
+from agents.fleet import WearableFleet
+from agents.episodes import FleetEpisodeInjector
+from scheduler import DEFAULT_SAMPLING_HZ, TickScheduler, clamp_rate
+from stream_sink import open_upstream
+
+EPISODE_HORIZON_SECONDS = 24 * 3600
+
+STATS_INTERVAL_SECONDS = 1.0
+RECONNECT_DELAY_SECONDS = 5
+
+
+def shard_for(user_id: str, n_shards: int) -> int:
+    """Stable user -> shard assignment (same on every run and process)"""
+    return zlib.crc32(user_id.encode()) % n_shards
+
+
+# -------------------------------
+# Worker process
+# -------------------------------
+def _drain_commands(commands: mp.Queue, fleet: WearableFleet, scheduler: TickScheduler,
+                    episodes: Optional[FleetEpisodeInjector] = None) -> bool:
+    """Apply pending parent commands; returns False when asked to stop"""
+    while True:
+        try:
+            command, argument = commands.get_nowait()
+        except queue.Empty:
+            return True
+        if command == "add":
+            fleet.add_users(profile for profile, _ in argument)
+            for profile, rate_hz in argument:
+                scheduler.add(profile.user_id, rate_hz)
+            if episodes is not None:
+                episodes.add_users(profile.user_id for profile, _ in argument)
+        elif command == "remove":
+            for user_id in argument:
+                scheduler.remove(user_id)
+            fleet.remove_users(argument)
+            if episodes is not None:
+                episodes.remove_users(argument)
+        elif command == "rate":
+            user_id, rate_hz = argument
+            scheduler.set_rate(user_id, rate_hz)
+        elif command == "stop":
+            return False
+
+
+async def _run_shard(shard_id: int, main_server_ws: str, commands: mp.Queue,
+                     stats: mp.Queue, episode_rate_per_hour: float = 0.0) -> None:
+    fleet = WearableFleet(seed=shard_id)
+    episodes = (FleetEpisodeInjector(fleet, episode_rate_per_hour, EPISODE_HORIZON_SECONDS, seed=shard_id)
+                if episode_rate_per_hour > 0 else None)
+    scheduler = TickScheduler()
+    sent_total = 0
+    errors = 0
+    last_report = time.monotonic()
+    last_sent = 0
+    running = True
+
+    while running:
+        running = _drain_commands(commands, fleet, scheduler, episodes)
+        if not len(fleet):
+            await asyncio.sleep(STATS_INTERVAL_SECONDS)
+            continue
+
+        try:
+            async with open_upstream(main_server_ws) as batcher:
+                async for due in scheduler.run():
+                    running = _drain_commands(commands, fleet, scheduler, episodes)
+                    if not running:
+                        break
+
+                    # Drop users removed after this tick was polled
+                    due = [(user_id, period) for user_id, period in due if user_id in fleet.user_index]
+                    if due:
+                        rows = np.fromiter((fleet.user_index[user_id] for user_id, _ in due),
+                                           dtype=np.int64, count=len(due))
+                        periods = np.fromiter((period for _, period in due), dtype=float, count=len(due))
+                        metrics = fleet.tick(periods, users=rows)
+                        for data in fleet.iter_payloads(metrics):
+                            if episodes is not None:
+                                episodes.apply(data)
+                            await batcher.add(data["user_id"], data)
+                        sent_total += len(due)
+                    await batcher.flush_if_due()
+
+                    now = time.monotonic()
+                    if now - last_report >= STATS_INTERVAL_SECONDS:
+                        labels = episodes.new_labels if episodes is not None else []
+                        try:
+                            stats.put_nowait({
+                                "shard": shard_id,
+                                "users": len(fleet),
+                                "sent_total": sent_total,
+                                "messages_per_second": round((sent_total - last_sent) / (now - last_report), 1),
+                                "errors": errors,
+                                "episodes_scheduled": episodes.scheduled if episodes is not None else 0,
+                                "episode_labels": list(labels),
+                                **scheduler.stats(),
+                                **batcher.stats(),
+                            })
+                            labels.clear()
+                        except queue.Full:
+                            pass   # labels go with the next report
+                        last_report = now
+                        last_sent = sent_total
+        except Exception as e:
+            errors += 1
+            print(f"❌ [shard {shard_id}] Connection to main server lost: {e}")
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+
+def shard_worker(shard_id: int, main_server_ws: str, commands: mp.Queue,
+                 stats: mp.Queue, episode_rate_per_hour: float = 0.0) -> None:
+    """Entry point of a shard process"""
+    try:
+        asyncio.run(_run_shard(shard_id, main_server_ws, commands, stats, episode_rate_per_hour))
+    except KeyboardInterrupt:
+        pass
+
+
+# -------------------------------
+# Parent side
+# -------------------------------
+class ShardManager:
+    """Partitions users across worker processes and aggregates their stats"""
+
+    def __init__(self, n_shards: int, main_server_ws: str, episode_rate_per_hour: float = 0.0):
+        self.n_shards = n_shards
+        self.main_server_ws = main_server_ws
+        self.episode_rate_per_hour = episode_rate_per_hour
+        # spawn: workers must not inherit the parent's Firebase/gRPC state
+        self._ctx = mp.get_context("spawn")
+        self._stats_queue = self._ctx.Queue(maxsize=10_000)
+        self._commands: List[mp.Queue] = []
+        self._processes: List[mp.Process] = []
+        self.user_shard: Dict[str, int] = {}
+        self.shard_stats: Dict[int, Dict[str, Any]] = {}
+        self.episode_labels: List[Dict[str, Any]] = []   # ground truth reported by every shard
+
+    def start(self) -> None:
+        for shard_id in range(self.n_shards):
+            commands = self._ctx.Queue()
+            process = self._ctx.Process(
+                target=shard_worker,
+                args=(shard_id, self.main_server_ws, commands, self._stats_queue, self.episode_rate_per_hour),
+                name=f"mimic-shard-{shard_id}",
+                daemon=True,
+            )
+            process.start()
+            self._commands.append(commands)
+            self._processes.append(process)
+        print(f"✅ Started {self.n_shards} mimic shard workers.")
+
+    def add_users(self, profiles: Iterable[UserProfile],
+                  rates: Optional[Dict[str, float]] = None) -> int:
+        """Assign new users to shards at their sampling rates; returns how many were added"""
+        rates = rates or {}
+        batches: Dict[int, List[tuple]] = {}
+        for profile in profiles:
+            if profile.user_id in self.user_shard:
+                continue
+            shard_id = shard_for(profile.user_id, self.n_shards)
+            self.user_shard[profile.user_id] = shard_id
+            rate_hz = clamp_rate(rates.get(profile.user_id, DEFAULT_SAMPLING_HZ))
+            batches.setdefault(shard_id, []).append((profile, rate_hz))
+        for shard_id, batch in batches.items():
+            self._commands[shard_id].put(("add", batch))
+        return sum(len(batch) for batch in batches.values())
+
+    def remove_users(self, user_ids: Iterable[str]) -> int:
+        """Stop streaming users; returns how many were removed"""
+        batches: Dict[int, List[str]] = {}
+        for user_id in user_ids:
+            shard_id = self.user_shard.pop(user_id, None)
+            if shard_id is not None:
+                batches.setdefault(shard_id, []).append(user_id)
+        for shard_id, batch in batches.items():
+            self._commands[shard_id].put(("remove", batch))
+        return sum(len(batch) for batch in batches.values())
+
+    def set_rate(self, user_id: str, rate_hz: float) -> None:
+        shard_id = self.user_shard.get(user_id)
+        if shard_id is not None:
+            self._commands[shard_id].put(("rate", (user_id, clamp_rate(rate_hz))))
+
+    def poll_stats(self) -> None:
+        """Pull the latest stats reported by workers"""
+        while True:
+            try:
+                report = self._stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            report["updated_at"] = time.time()
+            self.episode_labels.extend(report.pop("episode_labels", ()))
+            self.shard_stats[report["shard"]] = report
+
+    async def run_stats_pump(self, interval: float = STATS_INTERVAL_SECONDS) -> None:
+        while True:
+            self.poll_stats()
+            await asyncio.sleep(interval)
+
+    def aggregate_stats(self) -> Dict[str, Any]:
+        shards = [self.shard_stats.get(i, {"shard": i}) for i in range(self.n_shards)]
+        return {
+            "mode": "sharded",
+            "shards": self.n_shards,
+            "alive": sum(p.is_alive() for p in self._processes),
+            "users": len(self.user_shard),
+            "sent_total": sum(s.get("sent_total", 0) for s in shards),
+            "messages_per_second": round(sum(s.get("messages_per_second", 0) for s in shards), 1),
+            "lag_max_ms": max((s.get("lag_max_ms", 0) for s in shards), default=0),
+            "episodes_scheduled": sum(s.get("episodes_scheduled", 0) for s in shards),
+            "per_shard": shards,
+        }
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        for commands in self._commands:
+            commands.put(("stop", None))
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,105 @@
+# stream_sink.py
+# Upstream of the mimic server: the main server's WebSocket (default) or,
+# with MIMIC_SINK=redis, the vitals:raw partition streams read by the main
+# server's detection workers (backend/app/worker.py).
+#
+# Stream names, the partition formula and the entry layout ({"frame": batch
+# frame}) must match backend/app/broker.py.
+import os
+import zlib
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Tuple, Union
+
+import websockets
+
+from batching import FrameBatcher
+
+# "websocket" (main server /ws/mimic_receive) or "redis" (vitals:raw streams)
+MIMIC_SINK = os.getenv("MIMIC_SINK", "websocket")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+STREAM_PARTITIONS = int(os.getenv("STREAM_PARTITIONS", "16"))
+STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", "100000"))
+
+RAW_STREAM_PREFIX = "vitals:raw"
+
+
+class StreamSink:
+    """
+    Drop-in for FrameBatcher that writes to the partitioned raw streams.
+
+    Readings are batched per partition (same size/latency bounds as the
+    WebSocket link) and every batch that is ready by the next flush_if_due
+    goes out in a single pipelined round of XADDs, trimmed to ~maxlen.
+    """
+
+    def __init__(self, client: Any, partitions: int = STREAM_PARTITIONS,
+                 maxlen: int = STREAM_MAXLEN, **batch_options):
+        self.client = client
+        self.partitions = partitions
+        self.maxlen = maxlen
+        self._ready: List[Tuple[str, str]] = []
+        self.batchers = [
+            FrameBatcher(partial(self._collect, f"{RAW_STREAM_PREFIX}:{p}"), **batch_options)
+            for p in range(partitions)
+        ]
+        self.entries_published = 0
+        self.round_trips = 0
+
+    async def _collect(self, stream: str, frame: str) -> None:
+        self._ready.append((stream, frame))
+
+    async def add(self, user_id: str, data: Dict[str, Any]) -> None:
+        await self.batchers[zlib.crc32(user_id.encode()) % self.partitions].add(user_id, data)
+        if len(self._ready) >= self.partitions:
+            await self._publish()
+
+    async def flush_if_due(self) -> None:
+        for batcher in self.batchers:
+            await batcher.flush_if_due()
+        await self._publish()
+
+    async def flush(self) -> None:
+        for batcher in self.batchers:
+            await batcher.flush()
+        await self._publish()
+
+    async def _publish(self) -> None:
+        if not self._ready:
+            return
+        ready, self._ready = self._ready, []
+        async with self.client.pipeline(transaction=False) as pipe:
+            for stream, frame in ready:
+                pipe.xadd(stream, {"frame": frame}, maxlen=self.maxlen, approximate=True)
+            await pipe.execute()
+        self.entries_published += len(ready)
+        self.round_trips += 1
+
+    def stats(self) -> Dict[str, Any]:
+        frames = sum(b.frames_sent for b in self.batchers)
+        readings = sum(b.readings_sent for b in self.batchers)
+        return {
+            "sink": "redis",
+            "frames_sent": frames,
+            "readings_per_frame": round(readings / frames, 1) if frames else 0,
+            "pending_readings": sum(len(b) for b in self.batchers),
+            "entries_per_round_trip": round(self.entries_published / self.round_trips, 1) if self.round_trips else 0,
+        }
+
+
+@asynccontextmanager
+async def open_upstream(main_server_ws: str) -> AsyncIterator[Union[FrameBatcher, StreamSink]]:
+    """Connect to the configured upstream; yields an object with add/flush_if_due/stats"""
+    if MIMIC_SINK == "redis":
+        import redis.asyncio as redis
+
+        client = redis.from_url(REDIS_URL)
+        sink = StreamSink(client)
+        try:
+            yield sink
+            await sink.flush()
+        finally:
+            await client.aclose()
+    else:
+        async with websockets.connect(main_server_ws) as ws:
+            yield FrameBatcher(ws.send)
@@ -0,0 +1,6 @@
+# tests/conftest.py
+# ai_services modules import each other as top-level modules (agents.X, batching, ...)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,91 @@
+import queue
+from datetime import datetime, timedelta, timezone
+
+from agents.episodes import EpisodeInjector, FleetEpisodeInjector
+from agents.fleet import WearableFleet
+from agents.mimic_human import Clock, RealTimeWearableData, UserProfile
+from sharding import ShardManager
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+HORIZON = 3600.0
+RATE = 6.0     # per hour: a handful of episodes per horizon
+
+
+class _ManualClock(Clock):
+    def __init__(self):
+        self.current = START
+
+    def now(self):
+        return self.current
+
+
+def _horizons(episodes):
+    return {int((episode.onset - START).total_seconds() // HORIZON) for episode in episodes}
+
+
+def _no_overlaps(episodes):
+    return all(a.end <= b.onset for a, b in zip(episodes, episodes[1:]))
+
+
+# -------------------------------
+# Rolling horizon
+# -------------------------------
+def test_injector_schedules_the_next_horizon():
+    clock = _ManualClock()
+    injector = EpisodeInjector(RealTimeWearableData(UserProfile(user_id="U1"), clock=clock), seed=3)
+    injector.schedule_random(RATE, HORIZON)
+    assert _horizons(injector.episodes) <= {0}
+
+    for hour in range(1, 6):
+        clock.current = START + timedelta(seconds=hour * HORIZON)
+        injector.generate_realtime_data("resting")
+    # Episodes keep coming after the first horizon
+    assert max(_horizons(injector.episodes)) >= 4
+    assert _no_overlaps(injector.episodes)
+    assert len({label["episode_id"] for label in injector.labels()}) == len(injector.episodes)
+
+
+def test_fleet_injector_schedules_the_next_horizon():
+    clock = _ManualClock()
+    fleet = WearableFleet([UserProfile(user_id="U1")], seed=0, clock=clock)
+    injector = FleetEpisodeInjector(fleet, RATE, HORIZON, seed=3)
+    injector.add_users(["U1"])
+    first = len(injector.new_labels)
+
+    for hour in range(1, 6):
+        metrics = fleet.tick()
+        [data] = fleet.iter_payloads(metrics, timestamp=(START + timedelta(seconds=hour * HORIZON)).isoformat())
+        injector.apply(data)
+        assert "ground_truth" in data
+    assert injector.until["U1"] > START + timedelta(seconds=5 * HORIZON)
+    assert injector.scheduled == len(injector.new_labels) > first
+    onsets = [datetime.fromisoformat(label["onset"]) for label in injector.new_labels]
+    assert max(onsets) >= START + timedelta(seconds=4 * HORIZON)
+    assert len({label["episode_id"] for label in injector.new_labels}) == injector.scheduled
+
+
+def test_removed_user_gets_no_episodes():
+    clock = _ManualClock()
+    fleet = WearableFleet([UserProfile(user_id="U1")], seed=0, clock=clock)
+    injector = FleetEpisodeInjector(fleet, RATE, HORIZON, seed=3)
+    injector.add_users(["U1"])
+    injector.remove_users(["U1"])
+    [data] = fleet.iter_payloads(fleet.tick(), timestamp=(START + timedelta(seconds=HORIZON)).isoformat())
+    assert injector.apply(data)["ground_truth"] == {"episode": None}
+    assert "U1" not in injector.until
+
+
+# -------------------------------
+# Sharded labels
+# -------------------------------
+def test_shard_manager_collects_labels_from_reports():
+    manager = ShardManager(2, "ws://unused")
+    manager._stats_queue = queue.Queue()
+    manager._stats_queue.put({"shard": 0, "sent_total": 5, "episode_labels": [{"episode_id": "a-1"}]})
+    manager._stats_queue.put({"shard": 1, "sent_total": 7, "episode_labels": [{"episode_id": "b-1"}]})
+    manager._stats_queue.put({"shard": 0, "sent_total": 9, "episode_labels": []})
+    manager.poll_stats()
+    assert [label["episode_id"] for label in manager.episode_labels] == ["a-1", "b-1"]
+    # Labels are not kept in the per-shard stats
+    assert "episode_labels" not in manager.shard_stats[0]
+    assert manager.aggregate_stats()["sent_total"] == 16
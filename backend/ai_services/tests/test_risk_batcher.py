@@ -0,0 +1,151 @@
+import asyncio
+import json
+import re
+import time
+
+from agents.risk_batcher import RiskBatcher
+from agents.risk_client import FakeLLMBackend, RiskAssessmentClient, RiskAssessmentError, TokenBucket
+
+
+def _sample(heart_rate):
+    # fake_risk: (heart_rate - 75 - 25) / 60 above 100 bpm
+    return json.dumps({"physiological_metrics": {"heart_rate": heart_rate, "blood_oxygen": 98,
+                                                 "respiratory_rate": 15}})
+
+
+def _batcher(backend=None, **kwargs):
+    backend = backend or FakeLLMBackend(latency=0.0, jitter=0.0)
+    client = RiskAssessmentClient(backend, limiter=TokenBucket(1000, 1000), hedge_after=None)
+    kwargs.setdefault("max_delay", 0.01)
+    return RiskBatcher(client, **kwargs)
+
+
+class RecordingBackend(FakeLLMBackend):
+    """FakeLLMBackend that keeps the user ids of every batch prompt, optionally rewriting the answer"""
+
+    def __init__(self, rewrite=None, latency=0.0):
+        super().__init__(latency=latency, jitter=0.0)
+        self.rewrite = rewrite
+        self.batches = []
+
+    def answer(self, prompt, schema=None):
+        self.batches.append(re.findall(r'^"(\w+)":', prompt, re.M))
+        text = super().answer(prompt, schema)
+        return self.rewrite(text) if self.rewrite else text
+
+
+# -------------------------------
+# Demultiplexing
+# -------------------------------
+def test_results_go_back_to_their_users():
+    backend = RecordingBackend()
+    batcher = _batcher(backend)
+
+    async def run():
+        return await asyncio.gather(batcher.assess("a", _sample(130)), batcher.assess("b", _sample(115)),
+                                    batcher.assess("c", _sample(160)))
+
+    assert [assessment.risk for assessment in asyncio.run(run())] == [0.5, 0.25, 1.0]
+    assert backend.batches == [["a", "b", "c"]]
+    assert batcher.stats()["batches"] == 1 and batcher.stats()["users_per_batch"] == 3
+
+
+def test_bad_result_fails_only_its_user():
+    def rewrite(text):
+        data = json.loads(text)
+        results = {result["user_id"]: result for result in data["results"]}
+        results["b"]["risk"] = "high"     # malformed
+        del results["c"]                  # missing
+        return json.dumps({"results": list(results.values())})
+
+    batcher = _batcher(RecordingBackend(rewrite))
+
+    async def run():
+        return await asyncio.gather(batcher.assess("a", _sample(130)), batcher.assess("b", _sample(130)),
+                                    batcher.assess("c", _sample(130)), return_exceptions=True)
+
+    a, b, c = asyncio.run(run())
+    assert a.risk == 0.5
+    assert isinstance(b, RiskAssessmentError) and isinstance(c, RiskAssessmentError)
+    assert batcher.stats()["user_failures"] == 2 and batcher.stats()["batch_failures"] == 0
+
+
+def test_same_user_is_scored_once_on_the_newest_snapshot():
+    backend = RecordingBackend()
+    batcher = _batcher(backend)
+
+    async def run():
+        return await asyncio.gather(batcher.assess("a", _sample(130)), batcher.assess("a", _sample(160)))
+
+    first, second = asyncio.run(run())
+    assert first.risk == second.risk == 1.0
+    assert backend.batches == [["a"]]
+    assert batcher.stats()["requests"] == 2 and batcher.users == 1
+
+
+# -------------------------------
+# Flushing
+# -------------------------------
+def test_full_batch_is_sent_without_waiting_for_the_timer():
+    backend = RecordingBackend()
+    batcher = _batcher(backend, max_users=2, max_delay=10.0)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(batcher.assess("a", _sample(130)), batcher.assess("b", _sample(130)))
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 1.0
+    assert backend.batches == [["a", "b"]]
+
+
+def test_partial_batch_is_sent_after_max_delay():
+    backend = RecordingBackend()
+    batcher = _batcher(backend, max_users=10, max_delay=0.05)
+
+    async def run():
+        started = time.monotonic()
+        await batcher.assess("a", _sample(130))
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.05 * 0.9
+    assert backend.batches == [["a"]]
+
+
+def test_users_past_max_users_open_the_next_batch():
+    backend = RecordingBackend()
+    batcher = _batcher(backend, max_users=2)
+
+    async def run():
+        await asyncio.gather(*(batcher.assess(user_id, _sample(130)) for user_id in ("a", "b", "c")))
+
+    asyncio.run(run())
+    assert backend.batches == [["a", "b"], ["c"]]
+
+
+def test_close_drains_batches_in_flight():
+    backend = RecordingBackend(latency=0.05)
+    batcher = _batcher(backend, max_users=2, max_delay=10.0)
+
+    async def run():
+        # One batch in flight (full), one still open (waiting for the 10 s timer)
+        callers = [asyncio.create_task(batcher.assess(user_id, _sample(130))) for user_id in ("a", "b", "c")]
+        await asyncio.sleep(0)
+        await batcher.close()
+        assert all(caller.done() for caller in callers)
+        return [caller.result().risk for caller in callers]
+
+    assert asyncio.run(run()) == [0.5, 0.5, 0.5]
+    assert backend.batches == [["a", "b"], ["c"]]
+    assert batcher.stats()["open_batch"] == 0
+
+
+def test_failed_batch_fails_every_caller():
+    batcher = _batcher(RecordingBackend(lambda text: "no JSON here"))
+
+    async def run():
+        return await asyncio.gather(batcher.assess("a", _sample(130)), batcher.assess("b", _sample(130)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(result, RiskAssessmentError) for result in asyncio.run(run()))
+    assert batcher.stats()["batch_failures"] == 1 and batcher.stats()["user_failures"] == 2
@@ -0,0 +1,183 @@
+import asyncio
+import json
+
+import pytest
+
+from agents.risk_cache import AGE_BAND_YEARS, CachedRiskScorer, RiskCache, risk_key
+from agents.risk_client import RiskAssessment, RiskAssessmentError
+
+VALUE = {"risk": 0.5, "short_report": "ok"}
+
+
+def _snapshot(heart_rate=72, blood_pressure="120/80", activity="resting"):
+    return json.dumps({"vital_signs": {"heart_rate": heart_rate, "blood_oxygen": 98, "blood_pressure": blood_pressure,
+                                       "respiratory_rate": 14, "temperature": 36.8},
+                       "current_activity": activity})
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingScorer:
+    """score(user_id, sample) that counts calls and can be held until release()"""
+
+    def __init__(self, hold=False, error=None):
+        self.calls = 0
+        self.error = error
+        self._released = asyncio.Event() if hold else None
+
+    def release(self):
+        self._released.set()
+
+    async def __call__(self, user_id, sample):
+        self.calls += 1
+        if self._released is not None:
+            await self._released.wait()
+        if self.error is not None:
+            raise self.error
+        return RiskAssessment(0.5, f"call {self.calls}", latency=0.0, attempts=1)
+
+
+# -------------------------------
+# Keys
+# -------------------------------
+def test_same_bin_same_key():
+    assert risk_key(_snapshot(heart_rate=71)) == risk_key(_snapshot(heart_rate=74))
+    assert risk_key(_snapshot(heart_rate=74)) != risk_key(_snapshot(heart_rate=75))
+    assert risk_key(_snapshot(activity="running")) != risk_key(_snapshot())
+
+
+def test_blood_pressure_string_is_split():
+    key = risk_key(_snapshot(blood_pressure="120/80"))
+    assert (key[2], key[3]) == (12, 8)
+    assert risk_key(_snapshot(blood_pressure="129/89")) == key
+    assert risk_key(_snapshot(blood_pressure="130/80")) != key
+    assert risk_key(_snapshot(blood_pressure="120/90")) != key
+    # Wearable readings carry the numbers already
+    reading = {"physiological_metrics": {"systolic_bp": 120, "diastolic_bp": 80}}
+    assert risk_key(reading)[2:4] == (12, 8)
+
+
+def test_age_band():
+    assert risk_key(_snapshot(), age=40) == risk_key(_snapshot(), age=40 + AGE_BAND_YEARS - 1)
+    assert risk_key(_snapshot(), age=40) != risk_key(_snapshot(), age=40 + AGE_BAND_YEARS)
+
+
+# -------------------------------
+# RiskCache
+# -------------------------------
+def test_entries_expire_after_ttl():
+    clock = _Clock()
+    cache = RiskCache(ttl=60, clock=clock)
+    cache.put(("k",), VALUE)
+    clock.now = 59.9
+    assert cache.get(("k",)) == VALUE
+    clock.now = 60.0
+    assert cache.get(("k",)) is None
+    assert len(cache) == 0
+    assert cache.stats()["expired"] == 1 and cache.stats()["hits"] == 1
+
+
+def test_least_recently_used_is_evicted():
+    cache = RiskCache(max_entries=2, clock=_Clock())
+    cache.put(("a",), VALUE)
+    cache.put(("b",), VALUE)
+    cache.get(("a",))           # b is now the oldest
+    cache.put(("c",), VALUE)
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == VALUE and cache.get(("c",)) == VALUE
+    assert cache.stats()["evictions"] == 1
+
+
+# -------------------------------
+# CachedRiskScorer
+# -------------------------------
+def test_unchanged_state_is_answered_from_the_cache():
+    scorer = CountingScorer()
+    cached = CachedRiskScorer(scorer, RiskCache(clock=_Clock()))
+
+    async def run():
+        first = await cached.assess("u1", _snapshot(heart_rate=71))
+        second = await cached.assess("u1", _snapshot(heart_rate=73))
+        third = await cached.assess("u1", _snapshot(heart_rate=90))
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert not first.cached and second.cached and not third.cached
+    assert second.short_report == first.short_report
+    assert scorer.calls == 2
+    assert cached.stats()["scored"] == 2
+
+
+def test_expired_entry_is_scored_again():
+    clock = _Clock()
+    scorer = CountingScorer()
+    cached = CachedRiskScorer(scorer, RiskCache(ttl=60, clock=clock))
+
+    async def run():
+        await cached.assess("u1", _snapshot())
+        clock.now = 61.0
+        return await cached.assess("u1", _snapshot())
+
+    assert not asyncio.run(run()).cached
+    assert scorer.calls == 2
+
+
+def test_concurrent_callers_share_one_call():
+    scorer = CountingScorer(hold=True)
+    cached = CachedRiskScorer(scorer, RiskCache(clock=_Clock()))
+
+    async def run():
+        callers = [asyncio.create_task(cached.assess(f"u{i}", _snapshot())) for i in range(5)]
+        await asyncio.sleep(0)
+        scorer.release()
+        return await asyncio.gather(*callers)
+
+    first, *others = asyncio.run(run())
+    assert scorer.calls == 1
+    assert not first.cached and all(other.cached and other.risk == first.risk for other in others)
+    assert cached.stats()["coalesced"] == 4 and cached.stats()["scored"] == 1
+
+
+def test_waiters_fail_with_the_scorer_and_the_next_caller_retries():
+    scorer = CountingScorer(hold=True, error=RiskAssessmentError("overloaded"))
+    cached = CachedRiskScorer(scorer, RiskCache(clock=_Clock()))
+
+    async def run():
+        callers = [asyncio.create_task(cached.assess(f"u{i}", _snapshot())) for i in range(2)]
+        await asyncio.sleep(0)
+        scorer.release()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        scorer.error = None
+        return results, await cached.assess("u3", _snapshot())
+
+    results, retried = asyncio.run(run())
+    assert all(isinstance(result, RiskAssessmentError) for result in results)
+    assert not retried.cached and scorer.calls == 2
+
+
+def test_cancelled_first_caller_hands_over_to_a_waiter():
+    scorer = CountingScorer(hold=True)
+    cached = CachedRiskScorer(scorer, RiskCache(clock=_Clock()))
+
+    async def run():
+        first = asyncio.create_task(cached.assess("u1", _snapshot()))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cached.assess("u2", _snapshot()))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        scorer.release()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await waiter
+
+    # The waiter is not cancelled with the first caller: it scores the state itself
+    assessment = asyncio.run(run())
+    assert not assessment.cached and assessment.short_report == "call 2"
+    assert scorer.calls == 2
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from agents.risk_client import (FakeLLMBackend, LLMBackend, RiskAssessmentClient, RiskAssessmentError,
+                                RiskTimeout, TokenBucket)
+
+# fake_risk: (130 - 75 - 25) / 60
+SAMPLE = json.dumps({"physiological_metrics": {"heart_rate": 130, "blood_oxygen": 98, "respiratory_rate": 15}})
+SAMPLE_RISK = 0.5
+
+
+def _client(backend, **kwargs):
+    kwargs.setdefault("limiter", TokenBucket(1000, 1000))
+    kwargs.setdefault("hedge_after", None)
+    return RiskAssessmentClient(backend, **kwargs)
+
+
+class ScriptedBackend(FakeLLMBackend):
+    """FakeLLMBackend whose n-th call takes delays[n] seconds or raises errors[n]"""
+
+    def __init__(self, delays=(), errors=()):
+        super().__init__(latency=0.0, jitter=0.0)
+        self.delays = list(delays)
+        self.errors = list(errors)
+
+    async def generate(self, prompt, schema=None):
+        call = self.calls
+        self.calls += 1
+        if call < len(self.delays):
+            await asyncio.sleep(self.delays[call])
+        if call < len(self.errors) and self.errors[call] is not None:
+            raise self.errors[call]
+        return self.answer(prompt, schema)
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        LLMBackend()
+
+    class Incomplete(LLMBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_assess():
+    client = _client(FakeLLMBackend(latency=0.01, jitter=0.0))
+    assessment = asyncio.run(client.assess(SAMPLE))
+    assert assessment.risk == SAMPLE_RISK
+    assert assessment.attempts == 1
+    assert client.stats()["succeeded"] == 1
+
+
+def test_deadline():
+    client = _client(FakeLLMBackend(latency=1.0, jitter=0.0), timeout=0.05)
+    started = time.monotonic()
+    with pytest.raises(RiskTimeout):
+        asyncio.run(client.assess(SAMPLE))
+    assert time.monotonic() - started < 0.5
+    assert client.stats()["timeouts"] == 1
+
+
+def test_hedge_beats_slow_request():
+    backend = ScriptedBackend(delays=[5.0, 0.01])
+    client = _client(backend, hedge_after=0.05, timeout=2.0)
+    assessment = asyncio.run(client.assess(SAMPLE))
+    assert assessment.risk == SAMPLE_RISK
+    assert assessment.attempts == 2
+    assert assessment.latency < 1.0
+    assert client.stats()["hedges"] == 1
+
+
+def test_no_hedge_without_a_free_slot():
+    backend = ScriptedBackend(delays=[0.2])
+    client = _client(backend, hedge_after=0.02, max_concurrency=1)
+    assert asyncio.run(client.assess(SAMPLE)).attempts == 1
+    assert client.stats()["hedges"] == 0
+
+
+def test_retryable_error_is_retried():
+    backend = ScriptedBackend(errors=[RiskAssessmentError("overloaded"), None])
+    client = _client(backend)
+    assessment = asyncio.run(client.assess(SAMPLE))
+    assert assessment.attempts == 2
+    assert client.stats()["retries"] == 1
+
+
+def test_unparseable_answer_is_retried():
+    backend = ScriptedBackend()
+    answers = iter(["I cannot assess this.", json.dumps({"risk": 0.3, "short_report": "ok"})])
+    backend.answer = lambda prompt, schema=None: next(answers)
+    client = _client(backend)
+    assert asyncio.run(client.assess(SAMPLE)).risk == 0.3
+    assert client.stats()["parse_failures"] == 1
+
+
+def test_non_retryable_error_fails_at_once():
+    backend = ScriptedBackend(errors=[RiskAssessmentError("bad key", retryable=False)])
+    client = _client(backend)
+    with pytest.raises(RiskAssessmentError, match="bad key"):
+        asyncio.run(client.assess(SAMPLE))
+    assert client.stats()["requests"] == 1 and client.stats()["failures"] == 1
+
+
+def test_attempts_are_bounded():
+    backend = ScriptedBackend(errors=[RiskAssessmentError("overloaded")] * 5)
+    client = _client(backend, max_attempts=3)
+    with pytest.raises(RiskAssessmentError):
+        asyncio.run(client.assess(SAMPLE))
+    assert backend.calls == 3
+
+
+def test_semaphore_bounds_requests_in_flight():
+    backend = FakeLLMBackend(latency=0.02, jitter=0.0)
+    client = _client(backend, max_concurrency=3)
+
+    async def run():
+        return await asyncio.gather(*(client.assess(SAMPLE) for _ in range(20)))
+
+    assert len(asyncio.run(run())) == 20
+    assert backend.max_in_flight == 3
+
+
+def test_token_bucket_limits_rate():
+    client = _client(FakeLLMBackend(latency=0.0, jitter=0.0), limiter=TokenBucket(rate=50, burst=2))
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(client.assess(SAMPLE) for _ in range(7)))
+        return time.monotonic() - started
+
+    # 2 from the burst, then 5 at 50 per second
+    assert asyncio.run(run()) >= 5 / 50 * 0.9
+    assert client.stats()["rate_limited"] > 0
+
+
+def test_token_bucket_refill():
+    now = [0.0]
+    bucket = TokenBucket(rate=10, burst=2, clock=lambda: now[0])
+
+    async def run():
+        await bucket.acquire()
+        await bucket.acquire()
+        now[0] = 0.1        # one token refilled
+        await bucket.acquire()
+
+    asyncio.run(run())
+    assert bucket.waits == 0
+
+
+def test_streamed_risk_arrives_before_the_answer():
+    backend = FakeLLMBackend(latency=0.2, jitter=0.0)
+    client = _client(backend)
+    early = []
+
+    async def run():
+        started = time.monotonic()
+        assessment = await client.assess(SAMPLE, on_risk=lambda risk: early.append((risk, time.monotonic() - started)))
+        return assessment, time.monotonic() - started
+
+    assessment, total = asyncio.run(run())
+    [(risk, at)] = early
+    assert risk == assessment.risk == SAMPLE_RISK
+    assert at < total
+    assert client.stats()["early_risks"] == 1
@@ -0,0 +1,97 @@
+import pytest
+
+from agents.risk_response import RiskResponseError, RiskResponseParser, RiskStream, validate_report
+
+
+@pytest.fixture
+def parser():
+    return RiskResponseParser()
+
+
+# -------------------------------
+# Single answers
+# -------------------------------
+def test_plain_json(parser):
+    assert parser.parse('{"risk": 0.42, "short_report": "ok"}') == {"risk": 0.42, "short_report": "ok"}
+    assert parser.stats()["salvaged"] == 0
+
+
+def test_markdown_fence_and_prose(parser):
+    text = 'Here is the assessment:\n```json\n{"risk": 0.7, "short_report": "HR high"}\n```\nStay safe.'
+    assert parser.parse(text)["risk"] == 0.7
+
+
+def test_trailing_comma(parser):
+    assert parser.parse('{"risk": 0.3, "short_report": "fine",}')["risk"] == 0.3
+
+
+def test_quoted_number(parser):
+    assert parser.parse('{"risk": "0.25", "short_report": "fine"}')["risk"] == 0.25
+
+
+def test_salvaged_when_not_json(parser):
+    report = parser.parse('{"risk": 0.9, "short_report": "SpO2 dropping')
+    assert report == {"risk": 0.9, "short_report": "SpO2 dropping"}
+    assert parser.stats()["salvaged"] == 1
+
+
+def test_truncated_number_fails(parser):
+    # {"risk": 0 may have been {"risk": 0.9
+    with pytest.raises(RiskResponseError):
+        parser.parse('{"risk": 0')
+    assert parser.stats()["parse_failures"] == 1
+
+
+@pytest.mark.parametrize("risk", [True, False, "nan", "inf", float("nan"), 1.5, -0.1, None, "high"])
+def test_invalid_risk(risk):
+    with pytest.raises(RiskResponseError):
+        validate_report({"risk": risk, "short_report": ""})
+
+
+def test_missing_risk():
+    with pytest.raises(RiskResponseError):
+        validate_report({"short_report": "no number"})
+
+
+# -------------------------------
+# Streamed answers
+# -------------------------------
+def test_stream_risk_split_across_chunks():
+    stream = RiskStream()
+    chunks = ['{"ri', 'sk": 0.', '8', '7, "short_', 'report": "Tachycardia"}']
+    risks = [stream.feed(chunk) for chunk in chunks]
+    # Not before the number is complete, then exactly once
+    assert risks == [None, None, None, 0.87, None]
+    assert RiskResponseParser().parse(stream.text)["short_report"] == "Tachycardia"
+
+
+def test_stream_ignores_out_of_range():
+    stream = RiskStream()
+    assert stream.feed('{"risk": 7, "short_report": ""}') is None
+    assert stream.risk is None
+
+
+# -------------------------------
+# Batch answers
+# -------------------------------
+def test_batch(parser):
+    text = ('{"results": [{"user_id": "a", "risk": 0.1, "short_report": "ok"},'
+            ' {"user_id": "b", "risk": 0.9, "short_report": "bad"}]}')
+    results = parser.parse_batch(text, ["a", "b"])
+    assert results["a"]["risk"] == 0.1 and results["b"]["risk"] == 0.9
+
+
+def test_batch_salvages_complete_results(parser):
+    text = ('{"results": [{"user_id": "a", "risk": 0.1, "short_report": "ok"},'
+            ' {"user_id": "b", "risk": 0.9, "short_report": "bad"},'
+            ' {"user_id": "c", "risk": 0.')
+    results = parser.parse_batch(text, ["a", "b", "c"])
+    assert results["a"]["risk"] == 0.1 and results["b"]["risk"] == 0.9
+    assert isinstance(results["c"], RiskResponseError)
+    assert parser.stats()["salvaged"] == 1
+    assert parser.stats()["batch_results_failed"] == 1
+
+
+def test_batch_without_usable_result(parser):
+    with pytest.raises(RiskResponseError):
+        parser.parse_batch('{"results": [{"user_id": "a", "risk": "high"}]}', ["a"])
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from agents.fleet import SMOOTHNESS
+from agents.mimic_human import UserProfile
+from agents.series import _CHUNK, _clamped_walk_below, _smooth_transitions, generate_series
+
+PROFILE = UserProfile(user_id="SERIES_TEST", age=40, gender="F", fitness_level="average")
+
+
+# -------------------------------
+# Closed forms vs per-tick loops
+# -------------------------------
+@pytest.mark.parametrize("n_ticks", [1, _CHUNK - 1, _CHUNK, 3 * _CHUNK + 5])
+def test_smooth_transitions_matches_recurrence(n_ticks):
+    rng = np.random.default_rng(1)
+    initial = rng.uniform(50, 100, 3)
+    targets = rng.uniform(40, 160, (n_ticks, 3))
+    noise = rng.uniform(-1, 1, (n_ticks, 3))
+
+    expected = np.empty((n_ticks, 3))
+    x = initial
+    for t in range(n_ticks):
+        x = x + (targets[t] - x) * SMOOTHNESS + noise[t]
+        expected[t] = x
+    np.testing.assert_allclose(_smooth_transitions(initial, targets, noise), expected, rtol=1e-10)
+
+
+def test_clamped_walk_below_matches_loop():
+    rng = np.random.default_rng(2)
+    steps = rng.normal(0.1, 1.0, 2000)
+    expected = np.empty(len(steps))
+    y = 85.0
+    for t, step in enumerate(steps):
+        y = min(100.0, y + step)
+        expected[t] = y
+    actual = _clamped_walk_below(85.0, steps, 100.0)
+    np.testing.assert_allclose(actual, expected, atol=1e-9)
+    # The ceiling was actually reached
+    assert (expected == 100.0).any()
+
+
+# -------------------------------
+# generate_series
+# -------------------------------
+def test_same_seed_same_series():
+    schedule = [("sleeping", 100), ("running", 50), ("resting", 50)]
+    first = generate_series(PROFILE, schedule, 300, seed=11)
+    second = generate_series(PROFILE, schedule, 300, seed=11)
+    assert first.keys() == second.keys()
+    for name in first:
+        np.testing.assert_array_equal(first[name], second[name])
+    other = generate_series(PROFILE, schedule, 300, seed=12)
+    assert not np.array_equal(first["heart_rate"], other["heart_rate"])
+
+
+def test_single_tick():
+    series = generate_series(PROFILE, "resting", 1, seed=0)
+    assert all(len(column) == 1 for column in series.values())
+
+
+@pytest.mark.parametrize("n_ticks", [0, -5])
+def test_rejects_empty_series(n_ticks):
+    with pytest.raises(ValueError, match="n_ticks"):
+        generate_series(PROFILE, "resting", n_ticks)
+
+
+@pytest.mark.parametrize("schedule", ["flying", [("resting", 10), ("flying", 10)]])
+def test_rejects_unknown_activity(schedule):
+    with pytest.raises(ValueError, match="Unknown activity 'flying'"):
+        generate_series(PROFILE, schedule, 30)
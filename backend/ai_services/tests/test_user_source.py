@@ -0,0 +1,85 @@
+import asyncio
+
+from user_source import ChangeType, FakeUserCollection, UserSource
+
+
+def _doc(user_id, **fields):
+    return {"user_id": user_id, "age": 40, "gender": "F", "fitness_level": "average", **fields}
+
+
+def test_paginated_load():
+    source = UserSource(FakeUserCollection.with_synthetic_users(1234), page_size=500)
+    pages = list(source.iter_pages())
+    assert [len(page) for page in pages] == [500, 500, 234]
+    user_ids = [record.user_id for page in pages for record in page]
+    assert len(set(user_ids)) == 1234 and user_ids == sorted(user_ids)
+
+
+def test_paginated_load_stops_at_max_users():
+    source = UserSource(FakeUserCollection.with_synthetic_users(1234), page_size=500, max_users=700)
+    assert [len(page) for page in source.iter_pages()] == [500, 200]
+
+
+def test_stream_pages():
+    source = UserSource(FakeUserCollection.with_synthetic_users(30), page_size=8)
+
+    async def run():
+        return [len(page) async for page in source.stream_pages()]
+
+    assert asyncio.run(run()) == [8, 8, 8, 6]
+
+
+def test_synthetic_users_use_the_profile_fitness_levels():
+    collection = FakeUserCollection.with_synthetic_users(10)
+    assert {doc.to_dict()["fitness_level"] for doc in collection.stream()} == {"low", "average", "high"}
+
+
+def _watch(collection, before_watch=None, after_watch=None):
+    """Load, optionally change the collection, watch, change it again; returns the reported changes"""
+    source = UserSource(collection, page_size=3)
+    changes = []
+
+    async def run():
+        for _ in source.iter_pages():
+            pass
+        if before_watch:
+            before_watch(collection)
+        source.watch(lambda change, payload: changes.append(
+            (change, payload if change == ChangeType.REMOVE else payload.user_id)))
+        if after_watch:
+            after_watch(collection)
+        await asyncio.sleep(0)
+        source.close()
+
+    asyncio.run(run())
+    return changes
+
+
+def test_initial_snapshot_skips_loaded_users():
+    assert _watch(FakeUserCollection.with_synthetic_users(10)) == []
+
+
+def test_initial_snapshot_reports_changes_since_the_load():
+    def change(collection):
+        collection.set("user_000001", _doc("user_000001", sampling_hz=2.0))
+        collection.delete("user_000002")
+        collection.set("user_new", _doc("user_new"))
+
+    changes = _watch(FakeUserCollection.with_synthetic_users(5), before_watch=change)
+    assert sorted(changes) == sorted([(ChangeType.UPSERT, "user_000001"), (ChangeType.REMOVE, "user_000002"),
+                                      (ChangeType.UPSERT, "user_new")])
+
+
+def test_watch_reports_later_changes():
+    def change(collection):
+        collection.set("user_new", _doc("user_new"))
+        collection.set("user_000000", _doc("renamed"))
+        collection.delete("user_000001")
+
+    changes = _watch(FakeUserCollection.with_synthetic_users(3), after_watch=change)
+    assert changes == [
+        (ChangeType.UPSERT, "user_new"),
+        (ChangeType.REMOVE, "user_000000"),
+        (ChangeType.UPSERT, "renamed"),
+        (ChangeType.REMOVE, "user_000001"),
+    ]
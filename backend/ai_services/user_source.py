@@ -0,0 +1,294 @@
+# user_source.py
+# Streaming user loading for the mimic server: cursor-paginated reads of the
+# Firestore "users" collection plus a snapshot listener that reports users
+# added to / removed from the collection while the server runs.
+import asyncio
+import threading
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from agents.mimic_human import UserProfile
+from scheduler import DEFAULT_SAMPLING_HZ, clamp_rate
+
+USER_PAGE_SIZE = 500
+
+# Order pages by document id so the cursor is stable while documents change
+DOCUMENT_ID_FIELD = "__name__"
+
+
+@dataclass
+class UserRecord:
+    """A mimic user as read from the users collection"""
+    profile: UserProfile
+    sampling_hz: float = DEFAULT_SAMPLING_HZ
+
+    @property
+    def user_id(self) -> str:
+        return self.profile.user_id
+
+
+def record_from_doc(data: Dict[str, Any]) -> UserRecord:
+    """Build a UserRecord from a users document, with the defaults the mimic server always used"""
+    profile = UserProfile(
+        user_id=data["user_id"],
+        age=data.get("age", 30),
+        gender=data.get("gender", "M"),
+        weight_kg=data.get("weight_kg", 70),
+        height_cm=data.get("height_cm", 170),
+        fitness_level=data.get("fitness_level", "average")
+    )
+    return UserRecord(profile, clamp_rate(data.get("sampling_hz", DEFAULT_SAMPLING_HZ)))
+
+
+class ChangeType(str, Enum):
+    UPSERT = "upsert"   # user added, or its document changed
+    REMOVE = "remove"
+
+
+class UserSource:
+    """
+    Paginated reader and change listener for a users collection.
+
+    Works with a Firestore CollectionReference (including one backed by the
+    Firestore emulator via FIRESTORE_EMULATOR_HOST) or a FakeUserCollection.
+    """
+
+    def __init__(self, collection: Any, page_size: int = USER_PAGE_SIZE,
+                 max_users: Optional[int] = None):
+        self.collection = collection
+        self.page_size = page_size
+        self.max_users = max_users
+        self._doc_users: Dict[str, str] = {}   # document id -> user_id
+        self._loaded: Dict[str, UserRecord] = {}   # document id -> record read by iter_pages, until watch()
+        self._watch = None
+
+    def iter_pages(self) -> Iterator[List[UserRecord]]:
+        """Yield users one page at a time, resuming each query after the last document read"""
+        remaining = self.max_users
+        last_doc = None
+        while remaining is None or remaining > 0:
+            size = self.page_size if remaining is None else min(self.page_size, remaining)
+            query = self.collection.order_by(DOCUMENT_ID_FIELD).limit(size)
+            if last_doc is not None:
+                query = query.start_after(last_doc)
+            docs = list(query.stream())
+            if not docs:
+                return
+
+            page = []
+            for doc in docs:
+                data = doc.to_dict()
+                if not data or "user_id" not in data:
+                    continue
+                record = record_from_doc(data)
+                self._doc_users[doc.id] = data["user_id"]
+                if self._watch is None:
+                    self._loaded[doc.id] = record
+                page.append(record)
+            if page:
+                yield page
+
+            last_doc = docs[-1]
+            if remaining is not None:
+                remaining -= len(docs)
+            if len(docs) < size:
+                return
+
+    async def stream_pages(self) -> AsyncIterator[List[UserRecord]]:
+        """iter_pages with every (blocking) page query run in a worker thread"""
+        pages = self.iter_pages()
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                return
+            yield page
+
+    def watch(self, on_change: Callable[[ChangeType, Any], None],
+              loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        Listen for membership changes.
+
+        on_change(ChangeType.UPSERT, UserRecord) or on_change(ChangeType.REMOVE, user_id)
+        is called on the event loop, once per snapshot for all of its changes.
+        The listener's first snapshot lists every existing document; of those,
+        only users that changed or disappeared since iter_pages read them are
+        reported (on_change must still treat known users as updates).
+        """
+        loop = loop or asyncio.get_running_loop()
+        initial = True
+
+        def apply(events):
+            for change_type, payload in events:
+                on_change(change_type, payload)
+
+        def on_snapshot(docs, changes, read_time):
+            nonlocal initial
+            loaded, self._loaded = (self._loaded, {}) if initial else ({}, self._loaded)
+            events = []
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    user_id = self._doc_users.pop(doc.id, None)
+                    if user_id is not None:
+                        events.append((ChangeType.REMOVE, user_id))
+                    continue
+                data = doc.to_dict()
+                if not data or "user_id" not in data:
+                    continue
+                record = record_from_doc(data)
+                if loaded.get(doc.id) == record:
+                    # Unchanged since the paginated load
+                    continue
+                previous = self._doc_users.get(doc.id)
+                if previous is not None and previous != data["user_id"]:
+                    events.append((ChangeType.REMOVE, previous))
+                self._doc_users[doc.id] = data["user_id"]
+                events.append((ChangeType.UPSERT, record))
+            if initial:
+                # Deleted between the paginated load and the listener
+                present = {doc.id for doc in docs}
+                for doc_id in loaded.keys() - present:
+                    user_id = self._doc_users.pop(doc_id, None)
+                    if user_id is not None:
+                        events.append((ChangeType.REMOVE, user_id))
+                initial = False
+            if events:
+                loop.call_soon_threadsafe(apply, events)
+
+        self._watch = self.collection.on_snapshot(on_snapshot)
+
+    def close(self) -> None:
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+
+
+# -------------------------------
+# In-memory stand-in for local runs without Firestore
+# -------------------------------
+class _FakeDoc:
+    def __init__(self, doc_id: str, data: Optional[Dict[str, Any]]):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._data) if self._data is not None else None
+
+
+class _FakeChangeType(Enum):
+    ADDED = 1
+    MODIFIED = 2
+    REMOVED = 3
+
+
+class _FakeChange:
+    def __init__(self, change_type: _FakeChangeType, document: _FakeDoc):
+        self.type = change_type
+        self.document = document
+
+
+class _FakeQuery:
+    def __init__(self, collection: "FakeUserCollection", limit: Optional[int] = None,
+                 after: Optional[str] = None):
+        self._collection = collection
+        self._limit = limit
+        self._after = after
+
+    def order_by(self, field: str) -> "_FakeQuery":
+        # Documents are always returned in document id order
+        return self
+
+    def limit(self, count: int) -> "_FakeQuery":
+        return _FakeQuery(self._collection, count, self._after)
+
+    def start_after(self, doc: _FakeDoc) -> "_FakeQuery":
+        return _FakeQuery(self._collection, self._limit, doc.id)
+
+    def stream(self) -> Iterator[_FakeDoc]:
+        with self._collection._lock:
+            ids = sorted(self._collection._docs)
+            docs = [(doc_id, self._collection._docs[doc_id]) for doc_id in ids
+                    if self._after is None or doc_id > self._after]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return iter([_FakeDoc(doc_id, data) for doc_id, data in docs])
+
+
+class _FakeWatch:
+    def __init__(self, collection: "FakeUserCollection", callback: Callable):
+        self._collection = collection
+        self._callback = callback
+
+    def unsubscribe(self) -> None:
+        with self._collection._lock:
+            if self in self._collection._watches:
+                self._collection._watches.remove(self)
+
+
+class FakeUserCollection(_FakeQuery):
+    """
+    Minimal in-memory users collection with the query and listener API used
+    by UserSource. Listener callbacks run synchronously on the writer's
+    thread, in write order.
+    """
+
+    def __init__(self, docs: Optional[Dict[str, Dict[str, Any]]] = None):
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Dict[str, Any]] = dict(docs or {})
+        self._watches: List[_FakeWatch] = []
+        super().__init__(self)
+
+    @classmethod
+    def with_synthetic_users(cls, count: int) -> "FakeUserCollection":
+        genders = ("M", "F")
+        levels = ("low", "average", "high")
+        docs = {}
+        for i in range(count):
+            user_id = f"user_{i:06d}"
+            docs[user_id] = {
+                "user_id": user_id,
+                "age": 20 + i % 60,
+                "gender": genders[i % 2],
+                "weight_kg": 55 + i % 40,
+                "height_cm": 155 + i % 40,
+                "fitness_level": levels[i % len(levels)],
+            }
+        return cls(docs)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def set(self, doc_id: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            change_type = _FakeChangeType.MODIFIED if doc_id in self._docs else _FakeChangeType.ADDED
+            self._docs[doc_id] = dict(data)
+        self._notify([_FakeChange(change_type, _FakeDoc(doc_id, data))])
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            data = self._docs.pop(doc_id, None)
+        if data is not None:
+            self._notify([_FakeChange(_FakeChangeType.REMOVED, _FakeDoc(doc_id, data))])
+
+    def on_snapshot(self, callback: Callable) -> _FakeWatch:
+        watch = _FakeWatch(self, callback)
+        with self._lock:
+            self._watches.append(watch)
+            initial = [_FakeChange(_FakeChangeType.ADDED, _FakeDoc(doc_id, data))
+                       for doc_id, data in sorted(self._docs.items())]
+        self._deliver(watch, initial)
+        return watch
+
+    def _notify(self, changes: List[_FakeChange]) -> None:
+        with self._lock:
+            watches = list(self._watches)
+        for watch in watches:
+            self._deliver(watch, changes)
+
+    def _deliver(self, watch: _FakeWatch, changes: List[_FakeChange]) -> None:
+        watch._callback([change.document for change in changes], changes, None)
@@ -0,0 +1,334 @@
+# main_server/alerting.py
+# Alert state machine between the detector and outbound notifications.
+#
+# Each (user, rule) alert moves through
+#   PENDING --onset_seconds--> ACTIVE --clear edge--> CLEARING --clear_seconds--> resolved
+# A clear edge while PENDING drops the alert, and an onset edge while CLEARING
+# resumes it without a new notification, so a flapping signal notifies once.
+# Once ACTIVE, the policy's escalation levels (dashboard, SMS, call, ...) fire
+# after their delays. SMS and calls draw from global token buckets, and every
+# notify/suppress decision is recorded in the decision log.
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from collections import Counter, deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from app.detector import Detection
+
+DECISION_LOG_SIZE = 10_000
+
+SEVERITY_PRIORITY = {"critical": 0, "warning": 1}
+
+
+class AlertState(str, Enum):
+    PENDING = "pending"
+    ACTIVE = "active"
+    CLEARING = "clearing"
+
+
+@dataclass(frozen=True)
+class EscalationPolicy:
+    """
+    Timing of one severity's alerts.
+
+    levels are (seconds after the alert becomes active, channel) pairs.
+    """
+    onset_seconds: float
+    clear_seconds: float
+    cooldown_seconds: float
+    levels: Tuple[Tuple[float, str], ...]
+
+
+DEFAULT_POLICIES: Dict[str, EscalationPolicy] = {
+    "critical": EscalationPolicy(onset_seconds=3, clear_seconds=30, cooldown_seconds=300,
+                                 levels=((0, "dashboard"), (0, "sms"), (30, "call"))),
+    "warning": EscalationPolicy(onset_seconds=10, clear_seconds=30, cooldown_seconds=600,
+                                levels=((0, "dashboard"), (120, "sms"))),
+}
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`"""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+# Outbound budget shared by every user: (tokens per second, burst)
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "sms": (1.0, 10),
+    "call": (0.2, 3),
+}
+
+
+@dataclass
+class Alert:
+    user_id: str
+    rule: str
+    severity: str
+    policy: EscalationPolicy
+    detection: Detection
+    state: AlertState = AlertState.PENDING
+    since: float = 0.0            # entered the current state
+    not_before: float = 0.0       # cooldown: don't become active earlier
+    active_since: Optional[float] = None
+    next_level: int = 0
+    rate_limited_level: int = -1  # level whose rate-limit suppression was already logged
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.user_id, self.rule)
+
+
+@dataclass
+class Notification:
+    """An outbound action the caller should carry out"""
+    user_id: str
+    rule: str
+    severity: str
+    channel: str
+    level: int
+    detection: Detection
+    resolved: bool = False
+
+    @property
+    def message(self) -> str:
+        d = self.detection
+        if self.resolved:
+            return f"Resolved: {d.description or d.rule}"
+        return f"{d.description or d.rule}: {d.metric}={d.value:g}"
+
+    def to_event(self) -> Dict[str, Any]:
+        """Body of the dashboard message"""
+        if self.resolved:
+            return {"alert_resolved": self.message, "rule": self.rule}
+        return {**self.detection.to_alert(), "level": self.level}
+
+
+@dataclass
+class Decision:
+    timestamp: str            # wall-clock time, ISO 8601 in UTC
+    user_id: str
+    rule: str
+    decision: str             # "notify" | "suppress" | "state"
+    reason: str
+    channel: Optional[str] = None
+    level: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in self.__dict__.items() if v is not None}
+
+
+# -------------------------------
+# Delivery
+# -------------------------------
+async def send_to_contacts(notification: Notification) -> None:
+    # Imported lazily: the notifier connects to Firebase/Twilio on import
+    from app import notifier
+    send = notifier.make_emergency_call if notification.channel == "call" else notifier.send_sms_alert
+    try:
+        # Twilio/Firestore clients are blocking; keep them off the event loop
+        await asyncio.to_thread(send, notification.user_id, notification.message)
+    except Exception as e:
+        print(f"❌ [{notification.channel.upper()}] failed for {notification.user_id}: {e}")
+
+
+class NotificationDispatcher:
+    """
+    Carries out notifications: dashboard messages go to publish_event
+    (user_id, JSON text), SMS/calls to the user's contacts when
+    notify_contacts is set.
+    """
+
+    def __init__(self, publish_event: Callable[[str, str], Any], notify_contacts: bool):
+        self.publish_event = publish_event
+        self.notify_contacts = notify_contacts
+        self._outbound: Set[asyncio.Task] = set()   # SMS/call sends in flight
+
+    def dispatch(self, notification: Notification) -> None:
+        user_id = notification.user_id
+        if notification.channel == "dashboard":
+            if not notification.resolved:
+                print(f"🚨 [ALERT] {user_id}: {notification.message}")
+            self.publish_event(user_id, json.dumps(notification.to_event()))
+        elif not self.notify_contacts:
+            print(f"🔕 [{notification.channel.upper()}] {user_id}: {notification.message} (NOTIFY_CONTACTS is off)")
+        else:
+            task = asyncio.create_task(send_to_contacts(notification))
+            self._outbound.add(task)
+            task.add_done_callback(self._outbound.discard)
+
+
+class AlertManager:
+    """
+    Deduplicates, delays and escalates detections into notifications.
+
+    Feed detector events with observe() and call tick() regularly (it
+    returns the notifications now due, critical first).
+    """
+
+    def __init__(self, policies: Optional[Dict[str, EscalationPolicy]] = None,
+                 rate_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 log_size: int = DECISION_LOG_SIZE):
+        self.policies = policies or DEFAULT_POLICIES
+        self.clock = clock
+        self.buckets = {
+            channel: TokenBucket(rate, burst, clock)
+            for channel, (rate, burst) in (rate_limits or DEFAULT_RATE_LIMITS).items()
+        }
+        self.alerts: Dict[Tuple[str, str], Alert] = {}
+        self.cooldown_until: Dict[Tuple[str, str], float] = {}
+        self.decisions: Deque[Decision] = deque(maxlen=log_size)
+        self.counters: Counter = Counter()
+
+    def _record(self, alert: Alert, decision: str, reason: str,
+                channel: Optional[str] = None, level: Optional[int] = None) -> None:
+        self.decisions.append(Decision(datetime.now(timezone.utc).isoformat(), alert.user_id, alert.rule,
+                                       decision, reason, channel, level))
+        self.counters[f"{decision}:{reason}"] += 1
+
+    def _policy(self, severity: str) -> EscalationPolicy:
+        return self.policies.get(severity) or self.policies["warning"]
+
+    # -------------------------------
+    # Detector events
+    # -------------------------------
+    def observe(self, detection: Detection) -> None:
+        now = self.clock()
+        key = (detection.user_id, detection.rule)
+        alert = self.alerts.get(key)
+
+        if detection.event == "clear":
+            if alert is None:
+                return
+            if alert.state == AlertState.PENDING:
+                del self.alerts[key]
+                self._record(alert, "suppress", "cleared_before_onset")
+            elif alert.state == AlertState.ACTIVE:
+                alert.state = AlertState.CLEARING
+                alert.since = now
+                self._record(alert, "state", "clearing")
+            return
+
+        if alert is not None:
+            if alert.state == AlertState.CLEARING:
+                alert.state = AlertState.ACTIVE
+                alert.since = now
+                alert.detection = detection
+                self._record(alert, "suppress", "flapping")
+            else:
+                self._record(alert, "suppress", "duplicate")
+            return
+
+        policy = self._policy(detection.severity)
+        alert = Alert(detection.user_id, detection.rule, detection.severity, policy, detection,
+                      since=now, not_before=self.cooldown_until.get(key, 0.0))
+        self.alerts[key] = alert
+        if alert.not_before > now:
+            self._record(alert, "suppress", "cooldown")
+        else:
+            self._record(alert, "state", "pending")
+
+    # -------------------------------
+    # Timers
+    # -------------------------------
+    def tick(self) -> List[Notification]:
+        now = self.clock()
+        due: List[Tuple[Alert, int, str]] = []
+        notifications: List[Notification] = []
+
+        for key, alert in list(self.alerts.items()):
+            policy = alert.policy
+            if alert.state == AlertState.PENDING:
+                if now - alert.since >= policy.onset_seconds and now >= alert.not_before:
+                    alert.state = AlertState.ACTIVE
+                    alert.since = alert.active_since = now
+                    self._record(alert, "state", "active")
+            elif alert.state == AlertState.CLEARING:
+                if now - alert.since >= policy.clear_seconds:
+                    del self.alerts[key]
+                    self.cooldown_until[key] = now + policy.cooldown_seconds
+                    self._record(alert, "state", "resolved")
+                    if alert.active_since is not None and alert.next_level > 0:
+                        notifications.append(Notification(alert.user_id, alert.rule, alert.severity, "dashboard",
+                                                          0, alert.detection, resolved=True))
+                continue
+
+            if alert.active_since is None:
+                continue
+            level = alert.next_level
+            while level < len(policy.levels) and now - alert.active_since >= policy.levels[level][0]:
+                due.append((alert, level, policy.levels[level][1]))
+                level += 1
+
+        # Critical alerts get the outbound budget first (stable sort keeps level order)
+        due.sort(key=lambda item: SEVERITY_PRIORITY.get(item[0].severity, len(SEVERITY_PRIORITY)))
+        blocked = set()
+        for alert, level, channel in due:
+            if alert.key in blocked:
+                continue
+            bucket = self.buckets.get(channel)
+            if bucket is not None and not bucket.try_acquire():
+                # Retried on later ticks; logged once per level
+                blocked.add(alert.key)
+                if alert.rate_limited_level != level:
+                    alert.rate_limited_level = level
+                    self._record(alert, "suppress", "rate_limited", channel, level)
+                continue
+            alert.next_level = level + 1
+            self._record(alert, "notify", "escalation" if level else "onset", channel, level)
+            notifications.append(Notification(alert.user_id, alert.rule, alert.severity, channel,
+                                              level, alert.detection))
+
+        # Forget expired cooldowns
+        if len(self.cooldown_until) > 2 * len(self.alerts) + 1024:
+            self.cooldown_until = {k: t for k, t in self.cooldown_until.items() if t > now}
+        return notifications
+
+    # -------------------------------
+    # Introspection
+    # -------------------------------
+    def active_alerts(self, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        now = self.clock()
+        return [
+            {
+                "user_id": alert.user_id,
+                "rule": alert.rule,
+                "severity": alert.severity,
+                "state": alert.state.value,
+                "seconds_in_state": round(now - alert.since, 1),
+                "level": alert.next_level,
+            }
+            for alert in self.alerts.values()
+            if user_id is None or alert.user_id == user_id
+        ]
+
+    def decision_log(self, user_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        decisions = [d for d in reversed(self.decisions) if user_id is None or d.user_id == user_id]
+        return [d.to_dict() for d in decisions[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "alerts": len(self.alerts),
+            "by_state": dict(Counter(alert.state.value for alert in self.alerts.values())),
+            "cooling_down": sum(1 for t in self.cooldown_until.values() if t > self.clock()),
+            "decisions": dict(self.counters),
+        }
@@ -1,40 +1,48 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
+import asyncio
+import json
 
 from app.user_schema import UserCreate, UserSchema
 from app.config import settings
 from app.security import create_access_token, verify_password, get_password_hash
+from app.state import state
 
 router = APIRouter()
 
-# In-memory user database (for demonstration purposes)
+# Users live in the shared state backend (key "user:<user_id>", JSON) so every
+# server process sees the same accounts
 # In a real application, use a proper database
-fake_users_db = {}
+def user_key(user_id: str) -> str:
+    return f"user:{user_id}"
 
 @router.post("/signup", response_model=UserSchema)
-def signup(user: UserCreate):
+async def signup(user: UserCreate):
     """
     Create a new user.
     """
-    if user.user_id in fake_users_db:
+    # bcrypt takes ~0.3 s of CPU; keep it off the event loop
+    hashed_password = await asyncio.to_thread(get_password_hash, user.password)
+    user_data = user.dict()
+    user_data.pop("password")
+    created = await state.set_if_absent(user_key(user.user_id),
+                                        json.dumps({**user_data, "hashed_password": hashed_password}))
+    if not created:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this ID already exists",
         )
-    hashed_password = get_password_hash(user.password)
-    user_data = user.dict()
-    user_data.pop("password")
-    fake_users_db[user.user_id] = {**user_data, "hashed_password": hashed_password}
     return UserSchema(**user_data)
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     """
     Log in a user and return an access token.
     """
-    user = fake_users_db.get(form_data.username)
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    stored = await state.get(user_key(form_data.username))
+    user = json.loads(stored) if stored is not None else None
+    if not user or not await asyncio.to_thread(verify_password, form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -0,0 +1,360 @@
+# main_server/broker.py
+# Stream broker between ingest (main server / mimic server) and detection workers.
+#
+# Readings go to STREAM_PARTITIONS partition streams "vitals:raw:<p>", with
+# p = crc32(user_id) % partitions, so every reading of a user lands in the same
+# stream and is processed in order by the one worker owning that partition.
+# Each entry holds a batch of readings ({"frame": batch frame, i.e. JSON
+# {"type": "batch", "readings": [{"user_id", "data"}, ...]}}). Workers read
+# through a consumer group, ack once the entry's effects are durable and
+# reclaim entries left pending by a crashed consumer. With each ack a worker
+# stores the partition's high-water mark (last processed entry id) in the hash
+# "vitals:marks:<group>", so whoever owns the partition next skips what was
+# already processed.
+# Dashboard-bound alert messages come back on "vitals:analyzed"; readings the
+# triage model escalates to the LLM go out on "vitals:triage", and the risk
+# worker's answer ({"detections": JSON array}) goes to the escalation's reply_to
+# stream.
+import asyncio
+import itertools
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+RAW_STREAM_PREFIX = "vitals:raw"
+ANALYZED_STREAM = "vitals:analyzed"
+# Readings the triage model could not call, for the LLM risk worker (ai_services)
+TRIAGE_STREAM = "vitals:triage"
+DETECTOR_GROUP = "detectors"
+# Hash of per-partition high-water marks, one per consumer group
+MARKS_KEY_PREFIX = "vitals:marks"
+
+# Entries: (entry id, fields)
+Entry = Tuple[str, Dict[str, bytes]]
+
+
+def partition_for(user_id: str, partitions: int) -> int:
+    """Stable user -> partition assignment (same formula as the mimic server's sharding)"""
+    return zlib.crc32(user_id.encode()) % partitions
+
+
+def raw_stream(partition: int) -> str:
+    return f"{RAW_STREAM_PREFIX}:{partition}"
+
+
+def entry_id_key(entry_id: str) -> Tuple[int, int]:
+    """Sortable form of a stream entry id "<ms>-<seq>" """
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def marks_key(group: str) -> str:
+    return f"{MARKS_KEY_PREFIX}:{group}"
+
+
+class StreamBroker(ABC):
+    """Interface shared by RedisStreamBroker and InMemoryStreamBroker"""
+
+    @abstractmethod
+    async def publish(self, entries: Sequence[Tuple[str, Dict[str, bytes]]]) -> List[str]:
+        """Append (stream, fields) entries in one round trip; returns their ids"""
+
+    @abstractmethod
+    async def ensure_group(self, stream: str, group: str) -> None:
+        """Create the consumer group (reading from the start) unless it exists"""
+
+    @abstractmethod
+    async def read_group(self, group: str, consumer: str, streams: Sequence[str],
+                         count: int, block_ms: int) -> Dict[str, List[Entry]]:
+        """Deliver new entries of the given streams to this consumer"""
+
+    @abstractmethod
+    async def ack(self, stream: str, group: str, entry_ids: Sequence[str],
+                  high_water: Optional[str] = None) -> None:
+        """Ack entries; high_water, if given, is stored as the stream's mark in the same transaction"""
+
+    @abstractmethod
+    async def high_water(self, stream: str, group: str) -> Optional[str]:
+        """Last high-water mark stored with an ack, or None"""
+
+    @abstractmethod
+    async def claim_stale(self, stream: str, group: str, consumer: str,
+                          min_idle_ms: int, count: int, start_id: str = "0-0") -> List[Entry]:
+        """
+        Take over entries pending longer than min_idle_ms (e.g. from a crashed
+        consumer), in id order from start_id (inclusive)
+        """
+
+    @abstractmethod
+    async def read(self, streams: Dict[str, str], count: int, block_ms: int) -> Dict[str, List[Entry]]:
+        """Plain (non-group) read after the given ids; every reader sees every entry"""
+
+    @abstractmethod
+    async def pending(self, stream: str, group: str) -> int:
+        """Entries delivered to the group but not acked yet"""
+
+    @abstractmethod
+    async def length(self, stream: str) -> int:
+        """Entries in the stream"""
+
+    async def close(self) -> None:
+        pass
+
+
+# -------------------------------
+# Redis
+# -------------------------------
+class RedisStreamBroker(StreamBroker):
+    """
+    Redis Streams backend.
+
+    XADDs are pipelined (one round trip per publish call) and trimmed with
+    MAXLEN ~ maxlen, so a stalled consumer can't grow Redis without bound.
+    """
+
+    def __init__(self, url: str, maxlen: int = 100_000):
+        import redis.asyncio as redis
+        from redis.exceptions import ResponseError
+
+        self.redis = redis.from_url(url)
+        self._response_error = ResponseError
+        self.maxlen = maxlen
+
+    async def publish(self, entries):
+        if not entries:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for stream, fields in entries:
+                pipe.xadd(stream, fields, maxlen=self.maxlen, approximate=True)
+            ids = await pipe.execute()
+        return [_text(entry_id) for entry_id in ids]
+
+    async def ensure_group(self, stream, group):
+        try:
+            await self.redis.xgroup_create(stream, group, id="0", mkstream=True)
+        except self._response_error as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read_group(self, group, consumer, streams, count, block_ms):
+        response = await self.redis.xreadgroup(group, consumer, {stream: ">" for stream in streams},
+                                               count=count, block=block_ms)
+        return _stream_entries(response)
+
+    async def ack(self, stream, group, entry_ids, high_water=None):
+        if not entry_ids and high_water is None:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if entry_ids:
+                pipe.xack(stream, group, *entry_ids)
+            if high_water is not None:
+                pipe.hset(marks_key(group), stream, high_water)
+            await pipe.execute()
+
+    async def high_water(self, stream, group):
+        mark = await self.redis.hget(marks_key(group), stream)
+        return _text(mark) if mark is not None else None
+
+    async def claim_stale(self, stream, group, consumer, min_idle_ms, count, start_id="0-0"):
+        response = await self.redis.xautoclaim(stream, group, consumer, min_idle_ms,
+                                               start_id=start_id, count=count)
+        # [next start id, claimed entries, ids deleted by trimming (Redis 7+)]
+        return [_entry(entry_id, fields) for entry_id, fields in response[1] if fields]
+
+    async def read(self, streams, count, block_ms):
+        response = await self.redis.xread(streams, count=count, block=block_ms)
+        return _stream_entries(response)
+
+    async def pending(self, stream, group):
+        try:
+            return (await self.redis.xpending(stream, group))["pending"]
+        except self._response_error:
+            return 0
+
+    async def length(self, stream):
+        return await self.redis.xlen(stream)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def _text(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _entry(entry_id: Any, fields: Dict[Any, bytes]) -> Entry:
+    return _text(entry_id), {_text(k): v for k, v in fields.items()}
+
+
+def _stream_entries(response: Any) -> Dict[str, List[Entry]]:
+    # RESP2 reply: [[stream, [(entry id, fields), ...]], ...]
+    result: Dict[str, List[Entry]] = {}
+    for stream, entries in response or ():
+        result[_text(stream)] = [_entry(entry_id, fields) for entry_id, fields in entries]
+    return result
+
+
+# -------------------------------
+# In-process fake
+# -------------------------------
+class _Group:
+    def __init__(self):
+        self.last_delivered = 0     # index into the stream's entries
+        self.pending: Dict[str, Tuple[str, float]] = {}   # entry id -> (consumer, delivered at)
+
+
+class _Stream:
+    def __init__(self):
+        self.entries: List[Entry] = []
+        self.trimmed = 0            # entries dropped from the front by maxlen
+        self.groups: Dict[str, _Group] = {}
+
+    def after(self, index: int) -> List[Entry]:
+        return self.entries[max(0, index - self.trimmed):]
+
+
+class InMemoryStreamBroker(StreamBroker):
+    """
+    Single-process stand-in with the same consumer-group semantics as Redis
+    Streams (delivery, pending entries, acks, reclaim, maxlen trimming).
+    For tests and for running ingest and workers in one process.
+    """
+
+    def __init__(self, maxlen: int = 100_000, clock=time.monotonic):
+        self.maxlen = maxlen
+        self.clock = clock
+        self.streams: Dict[str, _Stream] = {}
+        self.marks: Dict[Tuple[str, str], str] = {}    # (group, stream) -> high-water mark
+        self._changed = asyncio.Condition()
+        self._ms = itertools.count(1)
+
+    def _stream(self, name: str) -> _Stream:
+        stream = self.streams.get(name)
+        if stream is None:
+            stream = self.streams[name] = _Stream()
+        return stream
+
+    async def publish(self, entries):
+        ids = []
+        for name, fields in entries:
+            stream = self._stream(name)
+            entry_id = f"{next(self._ms)}-0"
+            stream.entries.append((entry_id, dict(fields)))
+            if len(stream.entries) > self.maxlen:
+                drop = len(stream.entries) - self.maxlen
+                del stream.entries[:drop]
+                stream.trimmed += drop
+            ids.append(entry_id)
+        async with self._changed:
+            self._changed.notify_all()
+        return ids
+
+    async def ensure_group(self, stream, group):
+        self._stream(stream).groups.setdefault(group, _Group())
+
+    def _deliver(self, group, consumer, streams, count):
+        result = {}
+        now = self.clock()
+        for name in streams:
+            stream = self._stream(name)
+            state = stream.groups.get(group)
+            if state is None:
+                raise ValueError(f"No consumer group '{group}' on stream '{name}'")
+            entries = stream.after(state.last_delivered)[:count]
+            if not entries:
+                continue
+            state.last_delivered = stream.trimmed + stream.entries.index(entries[-1]) + 1
+            for entry_id, _ in entries:
+                state.pending[entry_id] = (consumer, now)
+            result[name] = entries
+        return result
+
+    async def read_group(self, group, consumer, streams, count, block_ms):
+        result = self._deliver(group, consumer, streams, count)
+        if result or not block_ms:
+            return result
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), block_ms / 1000)
+            except asyncio.TimeoutError:
+                return {}
+        return self._deliver(group, consumer, streams, count)
+
+    async def ack(self, stream, group, entry_ids, high_water=None):
+        pending = self._stream(stream).groups[group].pending
+        for entry_id in entry_ids:
+            pending.pop(entry_id, None)
+        if high_water is not None:
+            self.marks[(group, stream)] = high_water
+
+    async def high_water(self, stream, group):
+        return self.marks.get((group, stream))
+
+    async def claim_stale(self, stream, group, consumer, min_idle_ms, count, start_id="0-0"):
+        state = self._stream(stream).groups[group]
+        entries = dict(self._stream(stream).entries)
+        start = entry_id_key(start_id)
+        now = self.clock()
+        claimed = []
+        for entry_id, (owner, delivered_at) in sorted(state.pending.items(), key=lambda item: entry_id_key(item[0])):
+            if len(claimed) >= count:
+                break
+            if entry_id_key(entry_id) < start:
+                continue
+            if (now - delivered_at) * 1000 < min_idle_ms:
+                continue
+            if entry_id not in entries:
+                # Trimmed away before anyone acked it
+                del state.pending[entry_id]
+                continue
+            state.pending[entry_id] = (consumer, now)
+            claimed.append((entry_id, entries[entry_id]))
+        return claimed
+
+    def _read_after(self, streams, count):
+        result = {}
+        for name, last_id in streams.items():
+            stream = self._stream(name)
+            if last_id == "$":
+                continue
+            last = entry_id_key(last_id)
+            entries = [entry for entry in stream.entries if entry_id_key(entry[0]) > last][:count]
+            if entries:
+                result[name] = entries
+        return result
+
+    async def read(self, streams, count, block_ms):
+        # "$" means entries added after this call
+        streams = {
+            name: (self.latest_id(name) if last_id == "$" else last_id)
+            for name, last_id in streams.items()
+        }
+        result = self._read_after(streams, count)
+        if result or not block_ms:
+            return result
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), block_ms / 1000)
+            except asyncio.TimeoutError:
+                return {}
+        return self._read_after(streams, count)
+
+    def latest_id(self, name: str) -> str:
+        entries = self._stream(name).entries
+        return entries[-1][0] if entries else "0-0"
+
+    async def pending(self, stream, group):
+        state = self._stream(stream).groups.get(group)
+        return len(state.pending) if state else 0
+
+    async def length(self, stream):
+        return len(self._stream(stream).entries)
+
+
+def create_broker(backend: str, url: str, maxlen: int) -> StreamBroker:
+    if backend == "memory":
+        return InMemoryStreamBroker(maxlen)
+    if backend == "redis":
+        return RedisStreamBroker(url, maxlen)
+    raise ValueError(f"Unknown broker backend '{backend}', expected 'redis' or 'memory'")
@@ -0,0 +1,240 @@
+# main_server/cluster.py
+# Routing of live readings and alerts between main server processes.
+#
+# A frontend socket lives in exactly one process (node), but the readings and
+# alerts for its users may be produced by another one (the node holding the
+# mimic connection). Every node registers the users its subscribers follow in
+# the state backend ("node:<id>:users") and announces changes on the "routes"
+# channel, so each node keeps an in-memory map user -> other nodes following
+# it. Readings and alerts for such users are buffered per destination node
+# and published on that node's channels every FORWARD_FLUSH_SECONDS; nodes
+# without remote followers never touch the state backend on the hot path.
+# Every node refreshes "node:<id>:alive" (expiring after NODE_TTL_SECONDS)
+# every NODE_HEARTBEAT_SECONDS, and prunes the nodes whose key has expired,
+# so the routes of a crashed node go away without it ever coming back.
+import asyncio
+import json
+import os
+import socket
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.fanout import FanoutHub
+from app.frames import FrameError, WearableReading, decode_frame, encode_batch_frame
+from app.state import StateBackend
+
+NODES_KEY = "nodes"
+ROUTES_CHANNEL = "routes"
+FORWARD_FLUSH_SECONDS = 0.05
+NODE_HEARTBEAT_SECONDS = 5.0
+NODE_TTL_SECONDS = 15.0
+
+
+def node_users_key(node_id: str) -> str:
+    return f"node:{node_id}:users"
+
+
+def node_alive_key(node_id: str) -> str:
+    return f"node:{node_id}:alive"
+
+
+def readings_channel(node_id: str) -> str:
+    return f"node:{node_id}:readings"
+
+
+def events_channel(node_id: str) -> str:
+    return f"node:{node_id}:events"
+
+
+class ClusterRouter:
+    """
+    Publishes to local subscribers through the hub and forwards to the other
+    nodes that have followers of the same user.
+
+    Nodes that stop cleanly deregister; a crashed node is pruned by the
+    others once its heartbeat key expires (messages to it are simply dropped
+    by pub/sub meanwhile).
+    """
+
+    def __init__(self, state: StateBackend, hub: FanoutHub, node_id: Optional[str] = None,
+                 flush_interval: float = FORWARD_FLUSH_SECONDS,
+                 heartbeat_interval: float = NODE_HEARTBEAT_SECONDS,
+                 node_ttl: float = NODE_TTL_SECONDS):
+        self.state = state
+        self.hub = hub
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.flush_interval = flush_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.node_ttl = node_ttl
+        self.remote: Dict[str, Set[str]] = {}              # user_id -> other nodes following it
+        self._route_changes: Dict[str, bool] = {}          # local follow changes not yet announced
+        self._readings: Dict[str, List[Tuple[str, WearableReading]]] = {}   # node -> readings to forward
+        self._events: Dict[str, List[Tuple[str, str]]] = {}                 # node -> (user_id, message)
+        self._tasks: List[asyncio.Task] = []
+        hub.route_listener = self._on_local_route
+
+        self.forwarded_readings = 0
+        self.forwarded_events = 0
+        self.received_readings = 0
+        self.received_events = 0
+        self.pruned_nodes = 0
+
+    # -------------------------------
+    # Lifecycle
+    # -------------------------------
+    async def start(self) -> None:
+        ready = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self.state.listen(
+            [ROUTES_CHANNEL, readings_channel(self.node_id), events_channel(self.node_id)],
+            self._on_message, ready)))
+        # Subscribed before loading, so no route change falls in between
+        await ready.wait()
+        await self.state.delete(node_users_key(self.node_id))
+        await self.state.set(node_alive_key(self.node_id), b"1", ttl=self.node_ttl)
+        await self.state.add_members(NODES_KEY, [self.node_id])
+        await self.prune_dead_nodes()
+        for node in await self.state.members(NODES_KEY):
+            if node == self.node_id:
+                continue
+            for user_id in await self.state.members(node_users_key(node)):
+                self.remote.setdefault(user_id, set()).add(node)
+        self._route_changes = {user_id: True for user_id in self.hub.followers}
+        self._tasks.append(asyncio.create_task(self._run_flush()))
+        self._tasks.append(asyncio.create_task(self._run_heartbeat()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.state.remove_members(NODES_KEY, [self.node_id])
+        await self.state.delete(node_users_key(self.node_id))
+        await self.state.delete(node_alive_key(self.node_id))
+        await self.state.publish(ROUTES_CHANNEL, json.dumps({"node": self.node_id, "down": True}))
+
+    # -------------------------------
+    # Publishing
+    # -------------------------------
+    def has_followers(self, user_id: str) -> bool:
+        return self.hub.has_followers(user_id) or user_id in self.remote
+
+    def publish_reading(self, user_id: str, reading: WearableReading) -> None:
+        self.hub.publish_reading(user_id, reading)
+        for node in self.remote.get(user_id, ()):
+            self._readings.setdefault(node, []).append((user_id, reading))
+
+    def publish_event(self, user_id: str, message: str) -> None:
+        self.hub.publish_event(user_id, message)
+        for node in self.remote.get(user_id, ()):
+            self._events.setdefault(node, []).append((user_id, message))
+
+    async def flush(self) -> None:
+        if self._route_changes:
+            changes, self._route_changes = self._route_changes, {}
+            followed = [user_id for user_id, follows in changes.items() if follows]
+            unfollowed = [user_id for user_id, follows in changes.items() if not follows]
+            await self.state.add_members(node_users_key(self.node_id), followed)
+            await self.state.remove_members(node_users_key(self.node_id), unfollowed)
+            await self.state.publish(ROUTES_CHANNEL, json.dumps(
+                {"node": self.node_id, "follow": followed, "unfollow": unfollowed}))
+
+        readings, self._readings = self._readings, {}
+        for node, batch in readings.items():
+            await self.state.publish(readings_channel(node), encode_batch_frame(batch))
+            self.forwarded_readings += len(batch)
+        events, self._events = self._events, {}
+        for node, batch in events.items():
+            await self.state.publish(events_channel(node), json.dumps(batch))
+            self.forwarded_events += len(batch)
+
+    async def _run_flush(self) -> None:
+        while True:
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Forwarding to other nodes failed: {e}")
+            await asyncio.sleep(self.flush_interval)
+
+    # -------------------------------
+    # Liveness
+    # -------------------------------
+    async def prune_dead_nodes(self) -> List[str]:
+        """Deregister the nodes whose heartbeat expired and tell every node to drop their routes"""
+        dead = []
+        for node in await self.state.members(NODES_KEY):
+            if node == self.node_id or await self.state.get(node_alive_key(node)) is not None:
+                continue
+            await self.state.remove_members(NODES_KEY, [node])
+            await self.state.delete(node_users_key(node))
+            await self.state.publish(ROUTES_CHANNEL, json.dumps({"node": node, "down": True}))
+            self._apply_routes({"node": node, "down": True})
+            dead.append(node)
+        if dead:
+            self.pruned_nodes += len(dead)
+            print(f"🪦 Pruned nodes without a heartbeat: {dead}")
+        return dead
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.state.set(node_alive_key(self.node_id), b"1", ttl=self.node_ttl)
+                if self.node_id not in await self.state.members(NODES_KEY):
+                    # Pruned after a stall longer than the TTL: register and announce routes again
+                    await self.state.add_members(NODES_KEY, [self.node_id])
+                    self._route_changes = {user_id: True for user_id in self.hub.followers}
+                await self.prune_dead_nodes()
+            except Exception as e:
+                print(f"❌ Node heartbeat failed: {e}")
+
+    # -------------------------------
+    # Incoming
+    # -------------------------------
+    def _on_local_route(self, user_id: str, follows: bool) -> None:
+        self._route_changes[user_id] = follows
+
+    async def _on_message(self, channel: str, message: bytes) -> None:
+        if channel == ROUTES_CHANNEL:
+            self._apply_routes(json.loads(message))
+        elif channel == readings_channel(self.node_id):
+            try:
+                batch = decode_frame(message)
+            except FrameError as e:
+                print(f"❌ Bad forwarded readings: {e}")
+                return
+            for user_id, reading in batch:
+                self.hub.publish_reading(user_id, reading)
+            self.received_readings += len(batch)
+        else:
+            for user_id, text in json.loads(message):
+                self.hub.publish_event(user_id, text)
+                self.received_events += 1
+
+    def _apply_routes(self, change: Dict[str, Any]) -> None:
+        node = change["node"]
+        if node == self.node_id:
+            return
+        if change.get("down"):
+            for user_id in [u for u, nodes in self.remote.items() if node in nodes]:
+                self._drop_route(user_id, node)
+            return
+        for user_id in change.get("follow", ()):
+            self.remote.setdefault(user_id, set()).add(node)
+        for user_id in change.get("unfollow", ()):
+            self._drop_route(user_id, node)
+
+    def _drop_route(self, user_id: str, node: str) -> None:
+        nodes = self.remote.get(user_id)
+        if nodes is not None:
+            nodes.discard(node)
+            if not nodes:
+                del self.remote[user_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "node_id": self.node_id,
+            "remote_routes": len(self.remote),
+            "forwarded_readings": self.forwarded_readings,
+            "forwarded_events": self.forwarded_events,
+            "received_readings": self.received_readings,
+            "received_events": self.received_events,
+            "pruned_nodes": self.pruned_nodes,
+        }
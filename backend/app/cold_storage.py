@@ -0,0 +1,193 @@
+# main_server/cold_storage.py
+# Cold tier for raw vitals older than RETENTION_DAYS.
+#
+# compact() moves raw HealthData rows past the retention cutoff into one
+# Parquet file per user and day ({COLD_STORAGE_DIR}/{user_id}/{YYYY-MM-DD}.parquet,
+# zstd, sorted by timestamp, vitals as float64 so they read back exactly as
+# stored), then deletes them from the database. A user_id outside a safe
+# charset gets a hashed directory name instead, so no id reaches outside
+# COLD_STORAGE_DIR. Rollups stay
+# in the hot database, so charts never touch the cold tier; read_raw() merges
+# cold files (memory-mapped, filtered on timestamp) with hot rows for
+# full-resolution queries. Run one pass with `python -m app.cold_storage`, or
+# let the main server do it every RETENTION_INTERVAL_SECONDS.
+import asyncio
+import hashlib
+import os
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import delete, func, select
+from sqlalchemy.engine import Engine
+
+from app.models import HealthData, as_utc
+
+COLD_COLUMNS = ("heart_rate", "spo2", "stress", "respiratory_rate", "hrv",
+                "temperature", "systolic_bp", "diastolic_bp")
+
+# Rows per fetch when raw rows are streamed to the event loop
+RAW_STREAM_ROWS = 500
+
+COLD_SCHEMA = pa.schema(
+    [("timestamp", pa.timestamp("us", tz="UTC"))]
+    + [(name, pa.float64()) for name in COLD_COLUMNS]
+    + [("activity", pa.dictionary(pa.int8(), pa.string()))]
+)
+
+# Used verbatim as a directory name; never "." or ".." (no leading dot) and no separators
+_SAFE_USER_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}")
+# Significant digits of float32, the type of the vitals in files written before float64
+_FLOAT32_DIGITS = 7
+
+
+def user_dir(user_id: str) -> str:
+    """Directory name of a user: the id itself when safe, else "~" + its SHA-256 ("~" is never in a safe id)"""
+    if _SAFE_USER_ID.fullmatch(user_id):
+        return user_id
+    return "~" + hashlib.sha256(user_id.encode()).hexdigest()
+
+
+def day_path(root: str, user_id: str, day: date) -> str:
+    return os.path.join(root, user_dir(user_id), f"{day.isoformat()}.parquet")
+
+
+def _read_day(path: str, **kwargs: Any) -> pa.Table:
+    """One day file as COLD_SCHEMA; float32 vitals of older files are rounded back to what was stored"""
+    table = pq.read_table(path, schema=COLD_SCHEMA, **kwargs)
+    legacy = [field.name for field in pq.read_schema(path) if field.type == pa.float32()]
+    for name in legacy:
+        index = table.schema.get_field_index(name)
+        values = [None if value is None else float(f"{value:.{_FLOAT32_DIGITS}g}")
+                  for value in table.column(index).to_pylist()]
+        table = table.set_column(index, name, pa.array(values, type=pa.float64()))
+    return table
+
+
+def _day_bounds(day: date):
+    start = datetime.combine(day, time(), tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+# -------------------------------
+# Compaction
+# -------------------------------
+def _write_day(root: str, user_id: str, day: date, table: pa.Table) -> None:
+    path = day_path(root, user_id, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        # Late readings for an already compacted day
+        table = pa.concat_tables([_read_day(path), table])
+        table = table.sort_by("timestamp")
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    # Readers only ever see a complete file
+    os.replace(tmp_path, path)
+
+
+def compact(engine: Engine, root: str, older_than: datetime) -> Dict[str, int]:
+    """
+    Move raw rows with timestamp < older_than (rounded down to a day) to Parquet.
+
+    Every (user, day) is written to its file before its rows are deleted, so an
+    interrupted pass leaves at worst rows that are in both tiers; the next pass
+    merges them into the file again. Returns counts of users, days and rows.
+    """
+    cutoff, _ = _day_bounds(older_than.astimezone(timezone.utc).date())
+    users = days = rows = 0
+    with engine.connect() as conn:
+        firsts = conn.execute(
+            select(HealthData.user_id, func.min(HealthData.timestamp))
+            .where(HealthData.timestamp < cutoff)
+            .group_by(HealthData.user_id)).all()
+
+    for user_id, first in firsts:
+        users += 1
+        day = as_utc(first).astimezone(timezone.utc).date()
+        while True:
+            start, end = _day_bounds(day)
+            if start >= cutoff:
+                break
+            day += timedelta(days=1)
+            window = (HealthData.user_id == user_id, HealthData.timestamp >= start, HealthData.timestamp < end)
+            with engine.begin() as conn:
+                result = conn.execute(
+                    select(HealthData.timestamp, *(getattr(HealthData, c) for c in COLD_COLUMNS), HealthData.activity)
+                    .where(*window)
+                    .order_by(HealthData.timestamp)).all()
+                if not result:
+                    continue
+                columns = list(zip(*result))
+                table = pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) if field.name != "activity"
+                     else pa.array(values, type=pa.string()).dictionary_encode().cast(field.type)
+                     for field, values in zip(COLD_SCHEMA, columns)],
+                    schema=COLD_SCHEMA)
+                _write_day(root, user_id, start.date(), table)
+                conn.execute(delete(HealthData).where(*window))
+            days += 1
+            rows += len(result)
+    return {"users": users, "days": days, "rows": rows}
+
+
+# -------------------------------
+# Reading
+# -------------------------------
+def read_cold(root: str, user_id: str, start: datetime, end: datetime) -> pa.Table:
+    """Cold rows of a user in [start, end), sorted by timestamp"""
+    tables = []
+    day = start.astimezone(timezone.utc).date()
+    while _day_bounds(day)[0] < end:
+        path = day_path(root, user_id, day)
+        if os.path.exists(path):
+            tables.append(_read_day(path, memory_map=True,
+                                    filters=[("timestamp", ">=", start), ("timestamp", "<", end)]))
+        day += timedelta(days=1)
+    if not tables:
+        return COLD_SCHEMA.empty_table()
+    return pa.concat_tables(tables)
+
+
+def cold_rows(root: Optional[str], user_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Cold rows of a user in [start, end) as HealthData-shaped dicts (blocking file I/O)"""
+    if root is None:
+        return []
+    rows = read_cold(root, user_id, start, end).to_pylist()
+    for row in rows:
+        row["user_id"] = user_id
+    return rows
+
+
+def hot_rows_query(user_id: str, start: datetime, end: datetime):
+    """HealthData rows of a user in [start, end), oldest first"""
+    return (select(HealthData.user_id, HealthData.timestamp, HealthData.activity,
+                   *(getattr(HealthData, c) for c in COLD_COLUMNS))
+            .where(HealthData.user_id == user_id, HealthData.timestamp >= start, HealthData.timestamp < end)
+            .order_by(HealthData.timestamp))
+
+
+def read_raw(conn, root: Optional[str], user_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Raw rows of a user in [start, end) from the cold files and HealthData, oldest first"""
+    rows = cold_rows(root, user_id, start, end)
+    rows.extend(dict(row) for row in conn.execute(hot_rows_query(user_id, start, end)).mappings())
+    return rows
+
+
+async def read_raw_async(conn, root: Optional[str], user_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """read_raw on an AsyncConnection; the Parquet reads run in a thread"""
+    rows = await asyncio.to_thread(cold_rows, root, user_id, start, end)
+    # Streamed in partitions so converting a long range of rows never holds the event loop for long
+    result = await conn.stream(hot_rows_query(user_id, start, end))
+    async for partition in result.mappings().partitions(RAW_STREAM_ROWS):
+        rows.extend(dict(row) for row in partition)
+    return rows
+
+if __name__ == "__main__":
+    from app.config import settings
+    from app.database import engine
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.RETENTION_DAYS)
+    print(f"🧊 Compacting raw vitals before {cutoff.date()} into {settings.COLD_STORAGE_DIR}")
+    print(compact(engine, settings.COLD_STORAGE_DIR, cutoff))
@@ -1,13 +1,64 @@
 # lifelink-ai/backend/app/core/config.py
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     REDIS_URL: str = "redis://localhost:6379"
+    DATABASE_URL: str = "sqlite:///./lifelink.db"
+    # Connection pool per engine (see app.database)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_STATEMENT_CACHE_SIZE: int = 500
     FIREBASE_CREDENTIALS: str = "./firebase-key.json"
     NOTIFICATION_CHANNEL: str = "notifications"
     SECRET_KEY: str = "a_very_secret_key"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Twilio (SMS/call escalation of alerts)
+    TWILIO_SID: Optional[str] = None
+    TWILIO_AUTH: Optional[str] = None
+    TWILIO_PHONE: Optional[str] = None
+    # Off by default so local/simulated runs never text or call real contacts
+    NOTIFY_CONTACTS: bool = False
+    # Ingest: "inline" runs detection in the main server, "broker" hands readings
+    # to detection workers (app.worker) over the vitals:raw streams
+    INGEST_MODE: str = "inline"
+    # "redis" (REDIS_URL) or "memory" (in-process, workers run inside the main server)
+    BROKER_BACKEND: str = "redis"
+    STREAM_PARTITIONS: int = 16
+    STREAM_MAXLEN: int = 100_000
+    # Detection worker identity: owns partitions p with p % WORKER_COUNT == WORKER_INDEX
+    WORKER_INDEX: int = 0
+    WORKER_COUNT: int = 1
+    # Users, contacts and frontend routing: "memory" (single process) or "redis"
+    # (required for uvicorn --workers N or several nodes)
+    STATE_BACKEND: str = "memory"
+    # Store every reading in HealthData (write-behind, see app.persistence)
+    PERSIST_READINGS: bool = True
+    PERSIST_BATCH_ROWS: int = 5000
+    PERSIST_FLUSH_SECONDS: float = 1.0
+    # Buffered rows at which ingest waits for the database to catch up
+    PERSIST_MAX_PENDING_ROWS: int = 200_000
+    # Raw readings older than RETENTION_DAYS move to Parquet files (app.cold_storage);
+    # rollups stay in the database. RETENTION_INTERVAL_SECONDS=0 leaves compaction to
+    # `python -m app.cold_storage` (e.g. from cron, or with several server processes).
+    COLD_STORAGE_DIR: str = "./cold_storage"
+    RETENTION_DAYS: int = 30
+    RETENTION_INTERVAL_SECONDS: float = 3600
+    # Tiered triage (app.triage): the local model resolves clear-normal and
+    # clear-critical readings; with TRIAGE_ESCALATE uncertain ones go to the LLM
+    # risk worker (ai_services/risk_worker.py) over vitals:triage. Thresholds
+    # default to the model file's.
+    TRIAGE_ENABLED: bool = True
+    TRIAGE_MODEL_PATH: Optional[str] = None
+    TRIAGE_ESCALATE: bool = False
+    TRIAGE_ESCALATE_COOLDOWN_SECONDS: float = 30.0
+    # Frames of escalations waiting to be published (inline mode); more are dropped
+    TRIAGE_ESCALATE_QUEUE_FRAMES: int = 1000
+    TRIAGE_NORMAL_BELOW: Optional[float] = None
+    TRIAGE_CRITICAL_ABOVE: Optional[float] = None
     # other settings...
     class Config:
         env_file = ".env"
@@ -1,13 +1,85 @@
 # main_server/database.py
+# Two engines on DATABASE_URL:
+#   engine        sync; for scripts and for bulk writes run in worker threads
+#                 (app.persistence, app.cold_storage)
+#   async_engine  async driver (asyncpg / aiosqlite); for anything awaited on
+#                 the event loop, i.e. every async endpoint
+from typing import Any, AsyncIterator, Dict
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel import SQLModel, create_engine, Session
-from main_server.config import settings
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.config import settings
+
+# Sync driver -> async driver of the same database
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.drivername}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
 
-engine = create_engine(settings.DATABASE_URL, echo=False)
+def _engine_options(url: str) -> Dict[str, Any]:
+    """Pool sizing, pre-ping and statement caching shared by both engines"""
+    options: Dict[str, Any] = {
+        "echo": False,
+        "pool_pre_ping": True,                          # drop dead connections before use
+        "query_cache_size": settings.DB_STATEMENT_CACHE_SIZE,   # compiled SQL cache
+    }
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite lives in a single connection; no pool to size
+        return options
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    return options
+
+
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
+
+_async_url = async_database_url(settings.DATABASE_URL)
+_async_options = _engine_options(_async_url)
+if make_url(_async_url).get_backend_name() == "postgresql":
+    # Server-side prepared statements per connection (asyncpg)
+    _async_options["connect_args"] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+async_engine = create_async_engine(_async_url, **_async_options)
+async_session = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 def init_db():
-    from main_server.models import User, HealthData, Alert
+    from app.models import User, HealthData, Alert, VitalsRollup1m, VitalsRollup1h, VitalsRollup1d
     SQLModel.metadata.create_all(engine)
+    # create_all only builds tables it creates; add (nullable) columns and
+    # indexes introduced later to existing ones
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                                      f"{column.type.compile(engine.dialect)}"))
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def get_session():
     with Session(engine) as session:
         yield session
+
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency for async endpoints"""
+    async with async_session() as session:
+        yield session
@@ -0,0 +1,157 @@
+# main_server/db_benchmark.py
+# History queries from the event loop: sync engine vs async engine.
+#
+#   DATABASE_URL=sqlite:///./bench.db python -m app.db_benchmark
+#
+# Seeds BENCH_USERS users with BENCH_HOURS of 1 Hz readings (raw rows and
+# rollups), then runs BENCH_QUERIES /history-style queries, BENCH_CONCURRENCY
+# at a time, three ways:
+#   sync    query_history on the sync engine called straight from a coroutine
+#   thread  the same call offloaded with asyncio.to_thread
+#   async   query_history_async on an async_session connection
+# Next to throughput and latency it reports event loop lag: a ticker wakes every
+# LAG_TICK_SECONDS, and any delay beyond that is time the loop could not serve
+# WebSockets (ingest, fanout) because a query held it.
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+from sqlalchemy import delete, func, insert, select
+
+from app.database import async_engine, async_session, engine, init_db
+from app.models import HealthData
+from app.rollups import ROLLUPS, UPSERT_DIALECTS, query_history, query_history_async, write_rollups
+
+BENCH_USERS = int(os.getenv("BENCH_USERS", 20))
+BENCH_HOURS = int(os.getenv("BENCH_HOURS", 2))
+BENCH_QUERIES = int(os.getenv("BENCH_QUERIES", 400))
+BENCH_CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", 20))
+LAG_TICK_SECONDS = 0.005
+SEED_BATCH_ROWS = 5000
+
+
+# -------------------------------
+# Data
+# -------------------------------
+def seed(users: int, hours: int, end: datetime) -> int:
+    """Insert 1 Hz readings for bench users unless they are already there; returns rows in the table"""
+    user_ids = [f"bench-{i}" for i in range(users)]
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(HealthData)
+                                .where(HealthData.user_id.in_(user_ids))).scalar_one()
+    if existing == users * hours * 3600:
+        return existing
+
+    with engine.begin() as conn:
+        conn.execute(delete(HealthData).where(HealthData.user_id.in_(user_ids)))
+        for _, _, model in ROLLUPS:
+            conn.execute(delete(model).where(model.user_id.in_(user_ids)))
+    start = end - timedelta(hours=hours)
+    rng = random.Random(7)
+    for user_id in user_ids:
+        rows = [{
+            "user_id": user_id,
+            "timestamp": start + timedelta(seconds=s),
+            "heart_rate": rng.gauss(75, 8),
+            "spo2": rng.gauss(97, 1),
+            "stress": rng.random(),
+            "activity": "resting",
+            "respiratory_rate": rng.gauss(15, 2),
+            "hrv": rng.gauss(50, 10),
+        } for s in range(hours * 3600)]
+        for i in range(0, len(rows), SEED_BATCH_ROWS):
+            with engine.begin() as conn:
+                conn.execute(insert(HealthData), rows[i:i + SEED_BATCH_ROWS])
+                write_rollups(conn, rows[i:i + SEED_BATCH_ROWS])
+    return users * hours * 3600
+
+
+def make_queries(count: int, users: int, hours: int, end: datetime) -> List[Dict[str, Any]]:
+    """A mix of raw (10 min), 1-minute (1 h) and whole-range chart queries"""
+    rng = random.Random(11)
+    queries = []
+    for _ in range(count):
+        span = rng.choice((timedelta(minutes=10), timedelta(hours=1), timedelta(hours=hours)))
+        query_end = end - timedelta(seconds=rng.randrange(0, max(1, int(hours * 3600 - span.total_seconds()))))
+        queries.append({"user_id": f"bench-{rng.randrange(users)}", "start": query_end - span, "end": query_end})
+    return queries
+
+
+# -------------------------------
+# Runs
+# -------------------------------
+async def _sync(q: Dict[str, Any]) -> None:
+    # What an async endpoint does when it uses the sync session directly
+    query_history(engine, q["user_id"], q["start"], q["end"])
+
+
+async def _thread(q: Dict[str, Any]) -> None:
+    await asyncio.to_thread(query_history, engine, q["user_id"], q["start"], q["end"])
+
+
+async def _async(q: Dict[str, Any]) -> None:
+    async with async_session() as session:
+        await query_history_async(await session.connection(), q["user_id"], q["start"], q["end"])
+
+
+async def run(name: str, call: Callable[[Dict[str, Any]], Awaitable[None]],
+              queries: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    lags: List[float] = []
+    pending = iter(queries)
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(LAG_TICK_SECONDS)
+            lags.append(max(0.0, time.perf_counter() - before - LAG_TICK_SECONDS))
+
+    async def client():
+        for q in pending:
+            started = time.perf_counter()
+            await call(q)
+            latencies.append(time.perf_counter() - started)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+
+    latencies.sort()
+    lags.sort()
+    return {
+        "mode": name,
+        "queries_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1] * 1000, 2) if lags else None,
+        "loop_lag_max_ms": round(lags[-1] * 1000, 2) if lags else None,
+    }
+
+
+async def main() -> None:
+    if engine.dialect.name not in UPSERT_DIALECTS:
+        raise ValueError(f"Rollups need INSERT ... ON CONFLICT; {engine.dialect.name} is not supported")
+    init_db()
+    end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    rows = await asyncio.to_thread(seed, BENCH_USERS, BENCH_HOURS, end)
+    queries = make_queries(BENCH_QUERIES, BENCH_USERS, BENCH_HOURS, end)
+    print(f"📊 {rows} readings, {len(queries)} queries, {BENCH_CONCURRENCY} concurrent, {engine.url.drivername}")
+
+    # Warm both pools and statement caches
+    await run("warmup", _thread, queries[:BENCH_CONCURRENCY], BENCH_CONCURRENCY)
+    await run("warmup", _async, queries[:BENCH_CONCURRENCY], BENCH_CONCURRENCY)
+    for name, call in (("sync", _sync), ("thread", _thread), ("async", _async)):
+        print(await run(name, call, queries, BENCH_CONCURRENCY))
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
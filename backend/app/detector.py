@@ -0,0 +1,401 @@
+# main_server/detector.py
+# Streaming per-user anomaly detection on the ingest path.
+#
+# Every user owns one row in a set of preallocated NumPy arrays:
+#   - fast EWMA mean of each metric (smoothed current value)
+#   - a personalized baseline (slow EW mean/variance, or pinned via set_baseline)
+#     that z-scores are computed against
+#   - a ring buffer of the last `window` samples plus running sums, which give
+#     the least-squares slope over the window in O(1) per reading
+# A whole frame of readings is updated and evaluated with a handful of
+# vectorized operations, so cost per reading stays flat as users grow.
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.frames import WearableReading
+
+DETECTOR_METRICS = ("heart_rate", "blood_oxygen", "respiratory_rate", "hrv")
+METRIC_INDEX = {metric: i for i, metric in enumerate(DETECTOR_METRICS)}
+
+# Baseline standard deviation floors, so z-scores stay meaningful for very steady users
+MIN_BASELINE_STD = np.array([2.0, 0.5, 1.0, 3.0])
+
+STATS = ("value", "ewma", "z", "slope")
+
+# Running window sums are recomputed from the ring every this many samples
+# to stop floating-point error from accumulating
+_RESYNC_SAMPLES = 4096
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    Fires while `stat` of `metric` is above (op ">") or below (op "<") threshold.
+
+    stat is one of "value" (raw reading), "ewma" (smoothed), "z" (z-score
+    against the user's baseline) or "slope" (units per minute over the window).
+    Rules on z and slope only fire once the user has min_samples readings,
+    and no rule fires while the reading's current_activity is exempt (e.g.
+    high heart rate while running) or within the detector's grace period
+    after an exempt activity, while vitals settle.
+    """
+    name: str
+    metric: str
+    stat: str
+    op: str
+    threshold: float
+    severity: str = "warning"
+    min_samples: int = 0
+    description: str = ""
+    exempt_activities: Tuple[str, ...] = ()
+
+    def __post_init__(self):
+        if self.metric not in METRIC_INDEX:
+            raise ValueError(f"Unknown metric '{self.metric}'. Available: {list(DETECTOR_METRICS)}")
+        if self.stat not in STATS:
+            raise ValueError(f"Unknown stat '{self.stat}'. Available: {list(STATS)}")
+        if self.op not in (">", "<"):
+            raise ValueError(f"Unknown op '{self.op}', expected '>' or '<'")
+
+
+_ACTIVE = ("walking", "running", "exercising")
+_EXERTION = ("running", "exercising")
+
+DEFAULT_RULES: Tuple[Rule, ...] = (
+    Rule("asystole", "heart_rate", "ewma", "<", 25, "critical", description="Pulse lost"),
+    Rule("bradycardia", "heart_rate", "ewma", "<", 45, "critical", description="Sustained very low heart rate",
+         exempt_activities=("sleeping", "meditation")),
+    Rule("tachycardia", "heart_rate", "ewma", ">", 150, "critical", description="Sustained very high heart rate",
+         exempt_activities=_EXERTION),
+    Rule("heart_rate_spike", "heart_rate", "z", ">", 6, "warning", min_samples=120,
+         description="Heart rate far above personal baseline", exempt_activities=_ACTIVE + ("stressed",)),
+    Rule("heart_rate_surge", "heart_rate", "slope", ">", 60, "warning", min_samples=30,
+         description="Heart rate rising fast", exempt_activities=_ACTIVE + ("stressed",)),
+    Rule("irregular_rhythm", "hrv", "ewma", ">", 100, "critical", description="Highly irregular heart rhythm"),
+    Rule("hrv_collapse", "hrv", "z", "<", -5, "warning", min_samples=120,
+         description="Heart rate variability far below personal baseline",
+         exempt_activities=_ACTIVE + ("stressed",)),
+    Rule("hypoxemia", "blood_oxygen", "ewma", "<", 90, "critical", description="Low blood oxygen"),
+    Rule("desaturation", "blood_oxygen", "slope", "<", -10, "warning", min_samples=30,
+         description="Blood oxygen falling fast", exempt_activities=_EXERTION),
+    Rule("tachypnea", "respiratory_rate", "ewma", ">", 30, "warning", description="High respiratory rate",
+         exempt_activities=_EXERTION),
+    Rule("bradypnea", "respiratory_rate", "ewma", "<", 6, "critical", description="Breathing stopped or very slow",
+         exempt_activities=("meditation",)),
+)
+
+
+@dataclass
+class Detection:
+    """A rule that started (event "onset") or stopped (event "clear") firing for a user"""
+    user_id: str
+    rule: str
+    metric: str
+    stat: str
+    value: float      # raw reading
+    score: float      # the stat compared against the rule threshold
+    threshold: float
+    severity: str
+    timestamp: datetime
+    description: str = ""
+    event: str = "onset"
+
+    def to_alert(self) -> Dict[str, Any]:
+        return {
+            "alert": f"{self.description or self.rule}: {self.metric}={self.value:g}",
+            "rule": self.rule,
+            "metric": self.metric,
+            "stat": self.stat,
+            "score": round(self.score, 2),
+            "threshold": self.threshold,
+            "severity": self.severity,
+            "timestamp": self.timestamp.isoformat(),
+        }
+
+
+class StreamingDetector:
+    """
+    Rolling statistics and rule evaluation for many users.
+
+    Args:
+        rules: Rules to evaluate on every reading
+        window: Readings kept per user for the slope
+        alpha: Smoothing factor of the fast EWMA
+        baseline_alpha: Smoothing factor of the learned baseline
+        exempt_grace_samples: Readings a rule stays exempt after an exempt activity
+        capacity: Initial number of user rows (grows by doubling)
+    """
+
+    def __init__(self, rules: Sequence[Rule] = DEFAULT_RULES, window: int = 30,
+                 alpha: float = 0.2, baseline_alpha: float = 0.005,
+                 exempt_grace_samples: int = 180, capacity: int = 1024):
+        self.rules = tuple(rules)
+        self.window = window
+        self.exempt_grace_samples = exempt_grace_samples
+        self.alpha = alpha
+        self.baseline_alpha = baseline_alpha
+        self.user_index: Dict[str, int] = {}
+        self.user_ids: List[str] = []
+        self._allocate(capacity)
+        self._compile_rules()
+
+        # Slope denominators n^2 (n^2 - 1) / 12 and index sums, by samples in window
+        n = np.arange(window + 1, dtype=float)
+        self._sum_x = n * (n - 1) / 2
+        self._slope_denominator = np.maximum(n * n * (n * n - 1) / 12, 1.0)
+
+        self.readings = 0
+        self.detections = 0
+
+    # -------------------------------
+    # Storage
+    # -------------------------------
+    def _allocate(self, capacity: int) -> None:
+        n_met = len(DETECTOR_METRICS)
+        self.capacity = capacity
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.ewma = np.zeros((capacity, n_met))
+        self.base_mean = np.zeros((capacity, n_met))
+        self.base_var = np.zeros((capacity, n_met))
+        self.pinned = np.zeros((capacity, n_met), dtype=bool)
+        self.ring = np.zeros((capacity, n_met, self.window), dtype=np.float32)
+        self.sum_y = np.zeros((capacity, n_met))
+        self.sum_xy = np.zeros((capacity, n_met))
+        self.active = np.zeros((capacity, len(self.rules)), dtype=bool)
+        self.exempt_until = np.zeros((capacity, len(self.rules)), dtype=np.int64)
+
+    def _grow(self) -> None:
+        old = {name: getattr(self, name) for name in
+               ('count', 'ewma', 'base_mean', 'base_var', 'pinned', 'ring', 'sum_y', 'sum_xy',
+                'active', 'exempt_until')}
+        size = self.capacity
+        self._allocate(self.capacity * 2)
+        for name, array in old.items():
+            getattr(self, name)[:size] = array
+
+    def _row(self, user_id: str) -> int:
+        row = self.user_index.get(user_id)
+        if row is None:
+            row = len(self.user_ids)
+            if row == self.capacity:
+                self._grow()
+            self.user_index[user_id] = row
+            self.user_ids.append(user_id)
+        return row
+
+    def _compile_rules(self) -> None:
+        self._rule_stat = np.array([STATS.index(rule.stat) for rule in self.rules], dtype=np.int64)
+        self._rule_metric = np.array([METRIC_INDEX[rule.metric] for rule in self.rules], dtype=np.int64)
+        self._rule_sign = np.array([1.0 if rule.op == ">" else -1.0 for rule in self.rules])
+        self._rule_threshold = np.array([rule.threshold for rule in self.rules]) * self._rule_sign
+        self._rule_min_samples = np.array([rule.min_samples for rule in self.rules])
+        # Rows of _exempt are activities in order of first appearance
+        self._activity_index: Dict[str, int] = {}
+        self._exempt = np.zeros((0, len(self.rules)), dtype=bool)
+
+    def _activity_code(self, activity: str) -> int:
+        code = self._activity_index.get(activity)
+        if code is None:
+            code = self._activity_index[activity] = len(self._activity_index)
+            exempt = np.array([[activity in rule.exempt_activities for rule in self.rules]], dtype=bool)
+            self._exempt = np.concatenate([self._exempt, exempt])
+        return code
+
+    def set_baseline(self, user_id: str, metric: str, mean: float, std: float) -> None:
+        """Pin a user's personal baseline for a metric (otherwise it is learned)"""
+        row = self._row(user_id)
+        m = METRIC_INDEX[metric]
+        self.base_mean[row, m] = mean
+        self.base_var[row, m] = std * std
+        self.pinned[row, m] = True
+
+    # -------------------------------
+    # Streaming update
+    # -------------------------------
+    def process(self, readings: Sequence[Tuple[str, WearableReading]]) -> List[Detection]:
+        """
+        Update every user in a frame and return the rules that started or stopped firing.
+
+        Readings of the same user within one frame are applied in order.
+        """
+        if not readings:
+            return []
+        # The only per-reading Python work: two dict lookups and one tuple
+        index_get = self.user_index.get
+        activity_get = self._activity_index.get
+        rows = []
+        activities = []
+        columns = []
+        for user_id, reading in readings:
+            row = index_get(user_id)
+            if row is None:
+                row = self._row(user_id)
+            code = activity_get(reading.current_activity)
+            if code is None:
+                code = self._activity_code(reading.current_activity)
+            metrics = reading.physiological_metrics
+            rows.append(row)
+            activities.append(code)
+            columns.append((metrics.heart_rate, metrics.blood_oxygen, metrics.respiratory_rate, metrics.hrv,
+                            reading.duration_seconds))
+        rows = np.array(rows, dtype=np.int64)
+        activities = np.array(activities, dtype=np.int64)
+        columns = np.array(columns, dtype=float)
+        values = columns[:, :len(DETECTOR_METRICS)]
+        dt = columns[:, -1]
+        self.readings += len(rows)
+
+        if len(np.unique(rows)) == len(rows):
+            return self._evaluate(np.arange(len(rows)), rows, values, dt, activities, readings)
+
+        # Same user more than once: apply in rounds of first, second, ... occurrence
+        seen: Dict[int, int] = {}
+        rank = np.empty(len(rows), dtype=np.int64)
+        for i, row in enumerate(rows.tolist()):
+            rank[i] = seen[row] = seen.get(row, -1) + 1
+        detections = []
+        for r in range(rank.max() + 1):
+            positions = np.flatnonzero(rank == r)
+            detections.extend(self._evaluate(positions, rows[positions], values[positions], dt[positions],
+                                             activities[positions], readings))
+        return detections
+
+    def _update(self, rows: np.ndarray, x: np.ndarray, dt: np.ndarray) -> np.ndarray:
+        """Advance the rolling statistics; returns stats of shape (len(STATS), n, n_metrics)"""
+        count = self.count[rows]
+        first = (count == 0)[:, None]
+
+        # Fast EWMA (seeded with the first reading)
+        ewma = np.where(first, x, self.ewma[rows] + (x - self.ewma[rows]) * self.alpha)
+        self.ewma[rows] = ewma
+
+        # z-score against the baseline before it absorbs this reading
+        base_mean = self.base_mean[rows]
+        base_var = self.base_var[rows]
+        std = np.maximum(np.sqrt(base_var), MIN_BASELINE_STD)
+        z = np.where(first & ~self.pinned[rows], 0.0, (x - base_mean) / std)
+
+        # Learned baseline: exponentially weighted mean and variance
+        a = self.baseline_alpha
+        delta = x - base_mean
+        learned_mean = np.where(first, x, base_mean + a * delta)
+        learned_var = np.where(first, 0.0, (1 - a) * (base_var + a * delta * delta))
+        pinned = self.pinned[rows]
+        self.base_mean[rows] = np.where(pinned, base_mean, learned_mean)
+        self.base_var[rows] = np.where(pinned, base_var, learned_var)
+
+        # Ring buffer and running sums for the window slope
+        w = self.window
+        position = count % w
+        full = (count >= w)[:, None]
+        oldest = self.ring[rows, :, position].astype(float)
+        sum_y = self.sum_y[rows] - np.where(full, oldest, 0.0)
+        # Dropping the oldest shifts every remaining sample one index down
+        sum_xy = self.sum_xy[rows] - np.where(full, sum_y, 0.0)
+        n_before = np.minimum(count, w - 1)[:, None]
+        sum_xy += n_before * x
+        sum_y += x
+        self.ring[rows, :, position] = x
+
+        count += 1
+        self.count[rows] = count
+        resync = count % _RESYNC_SAMPLES == 0
+        if resync.any():
+            sum_y[resync], sum_xy[resync] = self._window_sums(rows[resync], count[resync])
+        self.sum_y[rows] = sum_y
+        self.sum_xy[rows] = sum_xy
+
+        n = np.minimum(count, w)
+        slope_per_sample = ((n[:, None] * sum_xy - self._sum_x[n][:, None] * sum_y)
+                            / self._slope_denominator[n][:, None])
+        slope = slope_per_sample * (60.0 / np.maximum(dt, 1e-3))[:, None]
+
+        return np.stack([x, ewma, z, slope])
+
+    def _window_sums(self, rows: np.ndarray, count: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact window sums from the ring, oldest sample at index 0"""
+        w = self.window
+        n = np.minimum(count, w)
+        start = np.where(count >= w, count % w, 0)
+        order = (start[:, None] + np.arange(w)[None, :]) % w
+        window = np.take_along_axis(self.ring[rows], order[:, None, :], axis=2).astype(float)
+        index = np.arange(w, dtype=float)
+        valid = (index[None, :] < n[:, None])[:, None, :]
+        window = np.where(valid, window, 0.0)
+        return window.sum(axis=2), (window * index).sum(axis=2)
+
+    def _evaluate(self, positions: np.ndarray, rows: np.ndarray, x: np.ndarray, dt: np.ndarray,
+                  activities: np.ndarray,
+                  readings: Sequence[Tuple[str, WearableReading]]) -> List[Detection]:
+        stats = self._update(rows, x, dt)
+        if not self.rules:
+            return []
+
+        # scores[n, n_rules]: the stat each rule looks at, sign-flipped for "<" rules
+        scores = stats[self._rule_stat, :, self._rule_metric].T * self._rule_sign
+        count = self.count[rows][:, None]
+        exempt_until = np.where(self._exempt[activities], count + self.exempt_grace_samples,
+                                self.exempt_until[rows])
+        self.exempt_until[rows] = exempt_until
+        firing = (scores > self._rule_threshold) & (count >= self._rule_min_samples) & (count > exempt_until)
+        changed = firing != self.active[rows]
+        self.active[rows] = firing
+        if not changed.any():
+            return []
+
+        detections = []
+        for i, r in zip(*np.nonzero(changed)):
+            rule = self.rules[r]
+            user_id, reading = readings[positions[i]]
+            detections.append(Detection(
+                user_id=user_id,
+                rule=rule.name,
+                metric=rule.metric,
+                stat=rule.stat,
+                value=float(x[i, self._rule_metric[r]]),
+                score=float(scores[i, r] * self._rule_sign[r]),
+                threshold=rule.threshold,
+                severity=rule.severity,
+                timestamp=reading.timestamp,
+                description=rule.description,
+                event="onset" if firing[i, r] else "clear",
+            ))
+            if firing[i, r]:
+                self.detections += 1
+        return detections
+
+    # -------------------------------
+    # Introspection
+    # -------------------------------
+    def user_stats(self, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self.user_index.get(user_id)
+        if row is None:
+            return None
+        n = min(int(self.count[row]), self.window)
+        sum_x = self._sum_x[n]
+        slope = (n * self.sum_xy[row] - sum_x * self.sum_y[row]) / self._slope_denominator[n]
+        return {
+            "samples": int(self.count[row]),
+            "metrics": {
+                metric: {
+                    "ewma": round(float(self.ewma[row, m]), 2),
+                    "baseline_mean": round(float(self.base_mean[row, m]), 2),
+                    "baseline_std": round(float(np.sqrt(self.base_var[row, m])), 2),
+                    "baseline_pinned": bool(self.pinned[row, m]),
+                    "slope_per_sample": round(float(slope[m]), 3),
+                }
+                for metric, m in METRIC_INDEX.items()
+            },
+            "active_rules": [rule.name for r, rule in enumerate(self.rules) if self.active[row, r]],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.user_ids),
+            "readings": self.readings,
+            "detections": self.detections,
+            "active": int(self.active[:len(self.user_ids)].sum()),
+        }
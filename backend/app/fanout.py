@@ -0,0 +1,210 @@
+# main_server/fanout.py
+# Live fanout of readings and alerts to frontend subscribers.
+#
+# Every subscriber (patient app, caregiver or clinician dashboard) gets its own
+# bounded queue and sender task, so publishing never waits on a client:
+#   - live readings are coalesced per user (a slow client only ever has the
+#     latest reading of each user it follows pending)
+#   - events such as alerts are queued in order, dropping the oldest when full
+# A subscriber may follow each user with its own selection of metrics.
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, FrozenSet, Iterable, Optional, Tuple
+
+# Metrics a subscriber wants for a user (None = every metric)
+MetricSelection = Optional[FrozenSet[str]]
+# (user_id, reading, metrics) -> message text
+ReadingRenderer = Callable[[str, Any, MetricSelection], str]
+
+FANOUT_MAX_EVENTS = 256
+
+_subscriber_ids = itertools.count(1)
+
+
+class Subscriber:
+    """One connected frontend and its pending messages"""
+
+    def __init__(self, send: Callable[[str], Awaitable[Any]], subscriber_id: Optional[str] = None,
+                 max_events: int = FANOUT_MAX_EVENTS):
+        self.subscriber_id = subscriber_id or f"sub-{next(_subscriber_ids)}"
+        self.send = send
+        self.user_ids: Dict[str, MetricSelection] = {}
+        self.events: Deque[Tuple[float, str]] = deque(maxlen=max_events)
+        self.latest: Dict[str, Tuple[float, str]] = {}   # user_id -> newest pending reading
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_ewma = 0.0
+
+    def pending(self) -> int:
+        return len(self.events) + len(self.latest)
+
+    def put_event(self, message: str, now: float) -> None:
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((now, message))
+        self.wakeup.set()
+
+    def reply(self, message: str) -> None:
+        """Queue a direct response to this subscriber (acks, pongs, errors)"""
+        self.put_event(message, time.monotonic())
+
+    def put_reading(self, user_id: str, message: str, now: float) -> None:
+        previous = self.latest.get(user_id)
+        if previous is not None:
+            # Keep the original enqueue time so lag reflects the stale reading
+            self.coalesced += 1
+            now = previous[0]
+        self.latest[user_id] = (now, message)
+        self.wakeup.set()
+
+    def _next(self) -> Optional[Tuple[float, str]]:
+        # Events (alerts) go out before live readings
+        if self.events:
+            return self.events.popleft()
+        if self.latest:
+            user_id = next(iter(self.latest))
+            return self.latest.pop(user_id)
+        return None
+
+    async def run(self, on_error: Callable[["Subscriber"], None]) -> None:
+        try:
+            while not self.closed:
+                item = self._next()
+                if item is None:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                enqueued_at, message = item
+                await self.send(message)
+                lag = time.monotonic() - enqueued_at
+                self.sent += 1
+                self.lag_last = lag
+                if lag > self.lag_max:
+                    self.lag_max = lag
+                self.lag_ewma += (lag - self.lag_ewma) * 0.05
+        except Exception:
+            # Client went away mid-send
+            on_error(self)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscriber_id": self.subscriber_id,
+            "users": sorted(self.user_ids),
+            "pending": self.pending(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "lag_last_ms": round(self.lag_last * 1000, 2),
+            "lag_ewma_ms": round(self.lag_ewma * 1000, 2),
+            "lag_max_ms": round(self.lag_max * 1000, 2),
+        }
+
+
+class FanoutHub:
+    """Routes per-user messages to every subscriber following that user"""
+
+    def __init__(self, render_reading: ReadingRenderer, max_events: int = FANOUT_MAX_EVENTS):
+        self.render_reading = render_reading
+        self.max_events = max_events
+        self.subscribers: Dict[str, Subscriber] = {}
+        self.followers: Dict[str, Dict[Subscriber, MetricSelection]] = {}   # user_id -> subscribers
+        # Called with (user_id, True) when a user gains its first follower, (user_id, False) when it loses the last
+        self.route_listener: Optional[Callable[[str, bool], None]] = None
+
+    def subscribe(self, send: Callable[[str], Awaitable[Any]], user_ids: Iterable[str] = (),
+                  subscriber_id: Optional[str] = None) -> Subscriber:
+        """Register a subscriber and start its sender task (must run on the event loop)"""
+        subscriber = Subscriber(send, subscriber_id, self.max_events)
+        self.subscribers[subscriber.subscriber_id] = subscriber
+        for user_id in user_ids:
+            self.follow(subscriber, user_id)
+        subscriber.task = asyncio.create_task(subscriber.run(self._remove))
+        return subscriber
+
+    def follow(self, subscriber: Subscriber, user_id: str, metrics: MetricSelection = None) -> None:
+        """Follow (or change the metric selection for) a user"""
+        if subscriber.closed:
+            # Already removed: following would leave it in self.followers for good
+            return
+        subscriber.user_ids[user_id] = metrics
+        followers = self.followers.get(user_id)
+        if followers is None:
+            followers = self.followers[user_id] = {}
+            if self.route_listener is not None:
+                self.route_listener(user_id, True)
+        followers[subscriber] = metrics
+
+    def unfollow(self, subscriber: Subscriber, user_id: str) -> None:
+        subscriber.user_ids.pop(user_id, None)
+        subscriber.latest.pop(user_id, None)
+        followers = self.followers.get(user_id)
+        if followers is not None:
+            followers.pop(subscriber, None)
+            if not followers:
+                del self.followers[user_id]
+                if self.route_listener is not None:
+                    self.route_listener(user_id, False)
+
+    def _remove(self, subscriber: Subscriber) -> None:
+        subscriber.closed = True
+        subscriber.wakeup.set()
+        self.subscribers.pop(subscriber.subscriber_id, None)
+        for user_id in list(subscriber.user_ids):
+            self.unfollow(subscriber, user_id)
+
+    async def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._remove(subscriber)
+        if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
+            try:
+                await subscriber.task
+            except asyncio.CancelledError:
+                pass
+
+    def has_followers(self, user_id: str) -> bool:
+        return user_id in self.followers
+
+    def publish_reading(self, user_id: str, reading: Any) -> int:
+        """Queue a live reading (coalesced per user); returns the number of subscribers reached"""
+        followers = self.followers.get(user_id)
+        if not followers:
+            return 0
+        now = time.monotonic()
+        # Render once per distinct metric selection, not once per subscriber
+        rendered: Dict[MetricSelection, str] = {}
+        for subscriber, metrics in followers.items():
+            message = rendered.get(metrics)
+            if message is None:
+                message = rendered[metrics] = self.render_reading(user_id, reading, metrics)
+            subscriber.put_reading(user_id, message, now)
+        return len(followers)
+
+    def publish_event(self, user_id: str, message: str) -> int:
+        """Queue an event such as an alert (never coalesced); returns the number of subscribers reached"""
+        followers = self.followers.get(user_id)
+        if not followers:
+            return 0
+        now = time.monotonic()
+        for subscriber in followers:
+            subscriber.put_event(message, now)
+        return len(followers)
+
+    def stats(self) -> Dict[str, Any]:
+        subscribers = [s.stats() for s in self.subscribers.values()]
+        return {
+            "subscribers": len(subscribers),
+            "followed_users": len(self.followers),
+            "dropped": sum(s["dropped"] for s in subscribers),
+            "coalesced": sum(s["coalesced"] for s in subscribers),
+            "lag_max_ms": max((s["lag_max_ms"] for s in subscribers), default=0),
+            "per_subscriber": subscribers,
+        }
@@ -0,0 +1,212 @@
+# main_server/frames.py
+# Typed wearable frames received from the mimic server on /ws/mimic_receive.
+#
+# Frames are decoded and validated in one pass by msgspec straight into the
+# structs below; unknown fields are skipped without being materialized.
+#   single: {"user_id": ..., "data": {...reading...}}
+#   batch:  {"type": "batch", "readings": [{"user_id": ..., "data": {...}}, ...]}
+# A batch with an invalid reading is decoded again envelope by envelope, so
+# only the bad readings are dropped, not the other users' readings.
+from datetime import datetime
+from typing import Annotated, Any, Dict, FrozenSet, List, Optional, Tuple, Union
+
+import msgspec
+from msgspec import Meta
+
+HeartRate = Annotated[int, Meta(ge=0, le=300)]
+Percent = Annotated[float, Meta(ge=0, le=100)]
+NonNegative = Annotated[float, Meta(ge=0)]
+
+
+class PhysiologicalMetrics(msgspec.Struct, kw_only=True, gc=False):
+    # Vitals watched by the streaming detector are required
+    heart_rate: HeartRate
+    stress_level: Annotated[int, Meta(ge=0, le=100)]
+    blood_oxygen: Percent
+    respiratory_rate: NonNegative
+    hrv: NonNegative
+    steps: NonNegative = 0
+    calories: NonNegative = 0.0
+    temperature: NonNegative = 0.0
+    sleep_quality: Percent = 0.0
+    systolic_bp: NonNegative = 0
+    diastolic_bp: NonNegative = 0
+    recovery_rate: NonNegative = 0.0
+    exertion_level: NonNegative = 0.0
+    vo2_max_estimate: NonNegative = 0.0
+    energy_level: NonNegative = 0
+
+
+class SessionTotals(msgspec.Struct, gc=False):
+    total_steps: NonNegative = 0
+    total_calories: NonNegative = 0.0
+
+
+class HealthIndicators(msgspec.Struct, gc=False):
+    recovery_score: float = 0
+    cardio_fitness: str = ""
+    stress_recovery_balance: float = 0.0
+
+
+class WearableReading(msgspec.Struct, kw_only=True):
+    """One data point of RealTimeWearableData.generate_realtime_data"""
+    timestamp: datetime
+    user_id: str
+    physiological_metrics: PhysiologicalMetrics
+    current_activity: str = "unknown"
+    duration_seconds: float = 1.0
+    age: Optional[int] = None
+    gender: Optional[str] = None
+    fitness_level: Optional[str] = None
+    bmr_kcal_day: Optional[float] = None
+    session_totals: Optional[SessionTotals] = None
+    health_indicators: Optional[HealthIndicators] = None
+    # Set only for readings with an injected emergency episode
+    ground_truth: Optional[Dict[str, Any]] = None
+
+
+class ReadingEnvelope(msgspec.Struct, gc=False):
+    user_id: str
+    data: WearableReading
+
+
+class MimicFrame(msgspec.Struct, kw_only=True, gc=False):
+    type: str = "reading"
+    user_id: Optional[str] = None
+    data: Optional[WearableReading] = None
+    readings: List[ReadingEnvelope] = []
+
+
+class _RawBatch(msgspec.Struct, kw_only=True, gc=False):
+    type: str = "reading"
+    readings: List[msgspec.Raw] = []
+
+
+class FrameError(ValueError):
+    """Raised for frames that are not valid JSON or don't match the schema"""
+
+
+_decoder = msgspec.json.Decoder(MimicFrame)
+_raw_batch_decoder = msgspec.json.Decoder(_RawBatch)
+_envelope_decoder = msgspec.json.Decoder(ReadingEnvelope)
+_encoder = msgspec.json.Encoder()
+
+
+def _decode_envelopes(raw: Union[str, bytes], error: msgspec.ValidationError,
+                      rejected: Optional[List[str]]) -> List[Tuple[str, WearableReading]]:
+    """The valid readings of a batch frame that failed validation as a whole"""
+    try:
+        frame = _raw_batch_decoder.decode(raw)
+    except msgspec.DecodeError:
+        raise FrameError(str(error)) from None
+    if frame.type != "batch":
+        raise FrameError(str(error))
+    batch = []
+    for i, envelope in enumerate(frame.readings):
+        try:
+            decoded = _envelope_decoder.decode(envelope)
+        except msgspec.DecodeError as e:
+            if rejected is not None:
+                rejected.append(f"readings[{i}]: {e}")
+            continue
+        batch.append((decoded.user_id, decoded.data))
+    return batch
+
+
+def decode_frame(raw: Union[str, bytes], rejected: Optional[List[str]] = None) -> List[Tuple[str, WearableReading]]:
+    """
+    Decode a single or batch frame.
+
+    Args:
+        raw: Frame JSON
+        rejected: Gets one error message per invalid reading of a batch
+            frame; those readings are left out, the rest are returned
+
+    Returns:
+        (user_id, reading) pairs in frame order
+
+    Raises:
+        FrameError: on malformed JSON, an invalid single frame or batch
+            envelope, or a frame with neither readings nor user_id/data
+    """
+    try:
+        frame = _decoder.decode(raw)
+    except msgspec.ValidationError as e:
+        # Fast path failed: find the bad readings of a batch
+        return _decode_envelopes(raw, e, rejected)
+    except msgspec.DecodeError as e:
+        raise FrameError(str(e)) from None
+
+    if frame.type == "batch":
+        return [(envelope.user_id, envelope.data) for envelope in frame.readings]
+    if frame.user_id is None or frame.data is None:
+        raise FrameError("Frame has neither readings nor user_id/data")
+    return [(frame.user_id, frame.data)]
+
+
+def encode_batch_frame(batch: List[Tuple[str, WearableReading]]) -> bytes:
+    """Inverse of decode_frame: a {"type": "batch", "readings": [...]} frame"""
+    return _encoder.encode({
+        "type": "batch",
+        "readings": [ReadingEnvelope(user_id, reading) for user_id, reading in batch],
+    })
+
+
+def encode_live_reading(user_id: str, reading: WearableReading,
+                        metrics: Optional[FrozenSet[str]] = None) -> str:
+    """
+    Frontend message for a live reading: {"type": "reading", "user_id": ..., "data": {...}}
+
+    With metrics, data only carries the timestamp, activity and the selected
+    physiological metrics.
+    """
+    if metrics is None:
+        data = _encoder.encode(reading)
+    else:
+        physiological = reading.physiological_metrics
+        data = _encoder.encode({
+            "timestamp": reading.timestamp,
+            "current_activity": reading.current_activity,
+            "physiological_metrics": {name: getattr(physiological, name) for name in metrics},
+        })
+    return f'{{"type":"reading","user_id":{_encoder.encode(user_id).decode()},"data":{data.decode()}}}'
+
+
+# -------------------------------
+# Frontend -> server messages on /ws/frontend
+# -------------------------------
+METRIC_NAMES = frozenset(PhysiologicalMetrics.__struct_fields__)
+
+
+class ClientMessage(msgspec.Struct, kw_only=True, gc=False):
+    """
+    {"action": "subscribe", "user_ids": [...], "metrics": [...]}   (metrics omitted = all)
+    {"action": "unsubscribe", "user_ids": [...]}
+    {"action": "ping"}
+    """
+    action: str
+    user_ids: List[str] = []
+    metrics: Optional[List[str]] = None
+
+
+CLIENT_ACTIONS = ("subscribe", "unsubscribe", "ping")
+
+_client_decoder = msgspec.json.Decoder(ClientMessage)
+
+
+def decode_client_message(raw: Union[str, bytes]) -> ClientMessage:
+    """
+    Raises:
+        FrameError: on malformed messages, unknown actions or unknown metric names
+    """
+    try:
+        message = _client_decoder.decode(raw)
+    except (msgspec.DecodeError, msgspec.ValidationError) as e:
+        raise FrameError(str(e)) from None
+    if message.action not in CLIENT_ACTIONS:
+        raise FrameError(f"Unknown action '{message.action}'. Available: {list(CLIENT_ACTIONS)}")
+    if message.metrics is not None:
+        unknown = set(message.metrics) - METRIC_NAMES
+        if unknown:
+            raise FrameError(f"Unknown metrics {sorted(unknown)}")
+    return message
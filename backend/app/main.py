@@ -1,36 +1,264 @@
 # main_server.py
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from fastapi import Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import json
+from datetime import datetime, timedelta, timezone
+import logging
+import time
 from app.auth import router as auth
+from app.frames import (WearableReading, FrameError, decode_frame, decode_client_message,
+                        encode_batch_frame, encode_live_reading)
+from app.fanout import FanoutHub
+from app.detector import StreamingDetector, Detection
+from app.alerting import AlertManager, NotificationDispatcher
+from app.broker import ANALYZED_STREAM, DETECTOR_GROUP, StreamBroker, create_broker, partition_for, raw_stream
+from app.worker import DetectionWorker, create_triage, owned_partitions
+from app.triage import Escalation, TriageEngine, decode_risk_detections, escalation_entries
+from app.state import state
+from app.cluster import ClusterRouter
+from app.database import async_engine, engine, get_async_session, init_db
+from app.persistence import HealthDataWriter
+from app.models import as_utc
+from app.rollups import HISTORY_DEFAULT_WINDOW, query_history_async
+from app.cold_storage import compact
+from app.config import settings
+from sqlmodel.ext.asyncio.session import AsyncSession
 app = FastAPI(title="LifeLink AI - Main Server")
+logger = logging.getLogger("lifelink.mimic")
+
+# Interval of the mimic link throughput summary (replaces per-reading prints)
+MIMIC_LOG_INTERVAL_SECONDS = 10.0
+# Resolution of alert onset/clear/escalation timers
+ALERT_TICK_SECONDS = 0.5
+# Alert messages per read of vitals:analyzed (broker mode)
+ANALYZED_READ_COUNT = 500
 
 # -------------------------------
-# Store emergency contacts per user
+# Per-process state (contacts and accounts live in app.state)
 # -------------------------------
-emergency_contacts: Dict[str, List[str]] = {}  # user_id -> [phone/email]
-connected_frontends: Dict[str, WebSocket] = {}  # user_id -> websocket
+hub = FanoutHub(encode_live_reading)  # user_id -> live subscribers (patient, caregivers, clinicians)
+router = ClusterRouter(state, hub)    # forwards to subscribers held by other server processes
+detector = StreamingDetector()        # per-user rolling statistics and alert rules
+alert_manager = AlertManager()        # dedup, hysteresis and escalation of detections
+dispatcher = NotificationDispatcher(router.publish_event, settings.NOTIFY_CONTACTS)
+broker: Optional[StreamBroker] = None  # set when INGEST_MODE is "broker"
+local_workers: List[DetectionWorker] = []  # in-process workers of the "memory" broker
+writer: Optional[HealthDataWriter] = None  # write-behind HealthData inserts (PERSIST_READINGS)
+triage: Optional[TriageEngine] = None      # local triage model (TRIAGE_ENABLED, inline mode)
+triage_broker: Optional[StreamBroker] = None  # escalations to the LLM risk worker (TRIAGE_ESCALATE, inline mode)
+escalation_queue: Optional["asyncio.Queue[List[Escalation]]"] = None  # frames of escalations for triage_broker
+escalations_dropped = 0
 app.include_router(auth, prefix="/api/auth", tags=["Authentication"])
 
 # -------------------------------
 # WebSocket endpoint to receive mimic data
 # -------------------------------
+def handle_reading(user_id: str, reading: WearableReading):
+    if logger.isEnabledFor(logging.DEBUG):
+        metrics = reading.physiological_metrics
+        logger.debug("[MIMIC DATA] %s: HR=%s, Stress=%s", user_id, metrics.heart_rate, metrics.stress_level)
+
+    # Stream to subscribed frontends, here or on other server processes.
+    # Only enqueues: subscriber tasks and the router's flush do the sending.
+    if router.has_followers(user_id):
+        router.publish_reading(user_id, reading)
+
+def handle_detection(detection: Detection):
+    # Only feeds the state machine; notifications come from run_alert_loop
+    alert_manager.observe(detection)
+
+# -------------------------------
+# Alert notifications
+# -------------------------------
+async def run_alert_loop():
+    while True:
+        for notification in alert_manager.tick():
+            dispatcher.dispatch(notification)
+        await asyncio.sleep(ALERT_TICK_SECONDS)
+
+# -------------------------------
+# Broker mode: detection runs in app.worker processes
+# -------------------------------
+async def publish_raw(batch: List[Tuple[str, WearableReading]]):
+    """Split a frame by partition and append one entry per partition (one pipelined round trip)"""
+    partitions: Dict[int, List[Tuple[str, WearableReading]]] = {}
+    for user_id, reading in batch:
+        partitions.setdefault(partition_for(user_id, settings.STREAM_PARTITIONS), []).append((user_id, reading))
+    await broker.publish([
+        (raw_stream(partition), {"frame": encode_batch_frame(readings)})
+        for partition, readings in partitions.items()
+    ])
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+async def consume_analyzed(source: StreamBroker):
+    """
+    Forward alert messages published by the workers to this server's subscribers.
+    Every server process reads the whole stream, so this stays local (no router).
+    Risk worker detections addressed to this node (inline mode escalations)
+    go through the alert state machine like any other rule.
+    """
+    last_id = "$"
+    while True:
+        try:
+            response = await source.read({ANALYZED_STREAM: last_id}, ANALYZED_READ_COUNT, 1000)
+        except Exception as e:
+            print(f"❌ Reading {ANALYZED_STREAM} failed: {e}")
+            await asyncio.sleep(1)
+            continue
+        for entry_id, fields in response.get(ANALYZED_STREAM, []):
+            last_id = entry_id
+            if "detections" in fields:
+                if _text(fields.get("node", b"")) != router.node_id:
+                    continue
+                try:
+                    detections = decode_risk_detections(fields["detections"])
+                except (TypeError, ValueError) as e:
+                    print(f"⚠️ Dropped malformed risk detections {entry_id}: {e}")
+                    continue
+                for detection in detections:
+                    handle_detection(detection)
+                continue
+            hub.publish_event(_text(fields["user_id"]), _text(fields["message"]))
+
+# -------------------------------
+# Inline mode: uncertain readings go to the LLM risk worker
+# -------------------------------
+def queue_escalations(escalations: List[Escalation]):
+    """Hand a frame's escalations to run_escalation_publisher; dropped when it is behind"""
+    global escalations_dropped
+    try:
+        escalation_queue.put_nowait(escalations)
+    except asyncio.QueueFull:
+        escalations_dropped += len(escalations)
+
+async def run_escalation_publisher():
+    """Publishes queued escalations off the ingest path; failed publishes are logged and dropped"""
+    global escalations_dropped
+    while True:
+        frames = [await escalation_queue.get()]
+        while not escalation_queue.empty():
+            frames.append(escalation_queue.get_nowait())
+        escalations = [escalation for frame in frames for escalation in frame]
+        try:
+            await triage_broker.publish(escalation_entries(escalations, reply_to=ANALYZED_STREAM,
+                                                           node=router.node_id))
+        except Exception as e:
+            escalations_dropped += len(escalations)
+            print(f"❌ Publishing {len(escalations)} triage escalations failed: {e}")
+
+# -------------------------------
+# Retention: raw readings past RETENTION_DAYS go to cold storage
+# -------------------------------
+async def run_retention_loop():
+    while True:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.RETENTION_DAYS)
+        try:
+            moved = await asyncio.to_thread(compact, engine, settings.COLD_STORAGE_DIR, cutoff)
+            if moved["rows"]:
+                print(f"🧊 [RETENTION] Moved {moved['rows']} readings ({moved['days']} user-days) to cold storage")
+        except Exception as e:
+            print(f"❌ [RETENTION] Compaction failed: {e}")
+        await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
+
+@app.on_event("startup")
+async def startup_event():
+    global broker, writer, triage, triage_broker, escalation_queue
+    await router.start()
+    if settings.PERSIST_READINGS:
+        init_db()
+        writer = HealthDataWriter(engine, settings.PERSIST_BATCH_ROWS, settings.PERSIST_FLUSH_SECONDS,
+                                  settings.PERSIST_MAX_PENDING_ROWS)
+        writer.start()
+        if settings.RETENTION_INTERVAL_SECONDS > 0:
+            asyncio.create_task(run_retention_loop())
+    if settings.INGEST_MODE != "broker":
+        triage = create_triage()
+        if triage is not None and settings.TRIAGE_ESCALATE:
+            if settings.BROKER_BACKEND == "redis":
+                triage_broker = create_broker(settings.BROKER_BACKEND, settings.REDIS_URL, settings.STREAM_MAXLEN)
+                escalation_queue = asyncio.Queue(settings.TRIAGE_ESCALATE_QUEUE_FRAMES)
+                asyncio.create_task(run_escalation_publisher())
+                # LLM alerts come back on vitals:analyzed
+                asyncio.create_task(consume_analyzed(triage_broker))
+            else:
+                print("⚠️ TRIAGE_ESCALATE needs the redis broker to reach the risk worker; not escalating")
+        asyncio.create_task(run_alert_loop())
+        return
+
+    broker = create_broker(settings.BROKER_BACKEND, settings.REDIS_URL, settings.STREAM_MAXLEN)
+    asyncio.create_task(consume_analyzed(broker))
+    if settings.BROKER_BACKEND == "memory":
+        # Nothing outside this process can reach the streams, so consume them here
+        # (and the risk worker could not read escalations either)
+        worker = DetectionWorker(broker, owned_partitions(settings.STREAM_PARTITIONS, 0, 1), "local",
+                                 notify_contacts=settings.NOTIFY_CONTACTS, writer=writer,
+                                 triage=create_triage(), escalate=False)
+        local_workers.append(worker)
+        asyncio.create_task(worker.run())
+    print(f"✅ Ingest via {settings.BROKER_BACKEND} streams ({settings.STREAM_PARTITIONS} partitions)")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await router.stop()
+    if writer is not None:
+        await writer.close()
+    if broker is not None:
+        await broker.close()
+    if triage_broker is not None:
+        await triage_broker.close()
+    await async_engine.dispose()
+
 @app.websocket("/ws/mimic_receive")
 async def mimic_receive(ws: WebSocket):
     await ws.accept()
+    frames = readings = rejected = rejected_readings = 0
+    last_log = time.monotonic()
     try:
         while True:
             msg = await ws.receive_text()
-            payload = json.loads(msg)
-            user_id = payload["user_id"]
-            data = payload["data"]
-            print(f"[MIMIC DATA] {user_id}: HR={data['physiological_metrics']['heart_rate']}, Stress={data['physiological_metrics']['stress_level']}")
-
-            # If HR or stress triggers alert, send to frontend
-            if user_id in connected_frontends:
-                frontend_ws = connected_frontends[user_id]
-                if data['physiological_metrics']['heart_rate'] > 120 or data['physiological_metrics']['stress_level'] > 7:
-                    await frontend_ws.send_text(json.dumps({"alert": f"Emergency! HR={data['physiological_metrics']['heart_rate']}, Stress={data['physiological_metrics']['stress_level']}"}))
+            bad_readings: List[str] = []
+            try:
+                batch = decode_frame(msg, bad_readings)
+            except FrameError as e:
+                rejected += 1
+                if rejected == 1 or logger.isEnabledFor(logging.DEBUG):
+                    logger.warning("Rejected mimic frame: %s", e)
+                continue
+            if bad_readings:
+                if rejected_readings == 0 or logger.isEnabledFor(logging.DEBUG):
+                    logger.warning("Rejected %d mimic readings: %s", len(bad_readings), bad_readings[0])
+                rejected_readings += len(bad_readings)
+
+            frames += 1
+            if broker is not None:
+                # Awaited, so a slow broker pushes back on the mimic link.
+                # Workers run detection and storage.
+                await publish_raw(batch)
+                detections = []
+            else:
+                detections = detector.process(batch)
+                if triage is not None:
+                    triage_detections, escalations = triage.process(batch)
+                    detections.extend(triage_detections)
+                    if escalations and triage_broker is not None:
+                        queue_escalations(escalations)
+                if writer is not None:
+                    await writer.add(batch)
+            for user_id, reading in batch:
+                handle_reading(user_id, reading)
+            for detection in detections:
+                handle_detection(detection)
+            readings += len(batch)
+
+            now = time.monotonic()
+            if now - last_log >= MIMIC_LOG_INTERVAL_SECONDS:
+                print(f"[MIMIC] {readings / (now - last_log):.0f} readings/s in {frames} frames, "
+                      f"{rejected} frames and {rejected_readings} readings rejected")
+                frames = readings = rejected = rejected_readings = 0
+                last_log = now
     except WebSocketDisconnect:
         print("Mimic connection disconnected")
 
@@ -39,20 +267,138 @@ async def mimic_receive(ws: WebSocket):
 # -------------------------------
 @app.websocket("/ws/frontend/{user_id}")
 async def frontend_ws(user_id: str, ws: WebSocket):
+    """
+    Follows user_id (all metrics) on connect. Clients may then send
+    subscribe/unsubscribe/ping messages (see app.frames.ClientMessage).
+
+    The handler only wakes up for client messages. Liveness is left to
+    uvicorn's protocol-level WebSocket pings (--ws-ping-interval and
+    --ws-ping-timeout, 20 s each by default, however the app is started); a
+    failed ping or closed socket ends the receive loop and removes the
+    subscriber straight away.
+    """
     await ws.accept()
-    connected_frontends[user_id] = ws
+    subscriber = hub.subscribe(ws.send_text, [user_id])
     try:
         while True:
-            await asyncio.sleep(1)  # keep connection alive
+            msg = await ws.receive_text()
+            try:
+                message = decode_client_message(msg)
+            except FrameError as e:
+                subscriber.reply(json.dumps({"type": "error", "detail": str(e)}))
+                continue
+
+            if message.action == "ping":
+                subscriber.reply('{"type":"pong"}')
+                continue
+            if message.action == "subscribe":
+                metrics = frozenset(message.metrics) if message.metrics is not None else None
+                for followed in message.user_ids:
+                    hub.follow(subscriber, followed, metrics)
+            else:
+                for followed in message.user_ids:
+                    hub.unfollow(subscriber, followed)
+            subscriber.reply(json.dumps({"type": "subscriptions", "users": {
+                followed: sorted(metrics) if metrics is not None else None
+                for followed, metrics in subscriber.user_ids.items()
+            }}))
     except WebSocketDisconnect:
-        connected_frontends.pop(user_id, None)
+        pass
+    finally:
+        await hub.unsubscribe(subscriber)
+
+@app.get("/detector/stats")
+async def detector_stats():
+    return detector.stats()
+
+@app.get("/triage/stats")
+async def triage_stats():
+    """Readings per tier, escalations to the LLM and model cost per reading"""
+    engines = [triage] if triage is not None else [w.triage for w in local_workers if w.triage is not None]
+    if not engines:
+        raise HTTPException(status_code=404, detail="No triage model in this process")
+    stats = engines[0].stats()
+    if escalation_queue is not None:
+        stats["escalation_queue"] = {"frames": escalation_queue.qsize(), "dropped": escalations_dropped}
+    return stats
+
+@app.get("/detector/{user_id}")
+async def detector_user(user_id: str):
+    """Rolling statistics, baselines and active rules of one user"""
+    user_stats = detector.user_stats(user_id)
+    if user_stats is None:
+        raise HTTPException(status_code=404, detail="No readings for this user")
+    return user_stats
+
+@app.get("/alerts")
+async def alerts(user_id: Optional[str] = None):
+    """Alerts that are pending, active or clearing"""
+    return {"alerts": alert_manager.active_alerts(user_id), **alert_manager.stats()}
+
+@app.get("/alerts/decisions")
+async def alert_decisions(user_id: Optional[str] = None, limit: int = 100):
+    """Most recent notify/suppress decisions, newest first"""
+    return {"decisions": alert_manager.decision_log(user_id, limit)}
+
+@app.get("/broker/stats")
+async def broker_stats():
+    """Stream lengths and unacked entries per raw partition (broker mode)"""
+    if broker is None:
+        raise HTTPException(status_code=404, detail="INGEST_MODE is not broker")
+    partitions = {}
+    for partition in range(settings.STREAM_PARTITIONS):
+        stream = raw_stream(partition)
+        partitions[stream] = {"length": await broker.length(stream),
+                              "pending": await broker.pending(stream, DETECTOR_GROUP)}
+    return {
+        "backend": settings.BROKER_BACKEND,
+        "analyzed_length": await broker.length(ANALYZED_STREAM),
+        "partitions": partitions,
+        "local_workers": [await worker.stats() for worker in local_workers],
+    }
+
+@app.get("/storage/stats")
+async def storage_stats():
+    """Write-behind HealthData buffer: rows written, pending, flush sizes and latency"""
+    if writer is None:
+        raise HTTPException(status_code=404, detail="PERSIST_READINGS is off")
+    return writer.stats()
+
+@app.get("/history/{user_id}")
+async def history(user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  resolution: Optional[int] = None,
+                  session: AsyncSession = Depends(get_async_session)):
+    """
+    Vitals of a user between start and end (default: the last 24 hours), one
+    point per resolution seconds with min/max/avg per metric. Served from the
+    coarsest rollup (1m/1h/1d) that fits the resolution, raw rows (hot and cold)
+    below 1 minute.
+    """
+    end = as_utc(end) if end is not None else datetime.now(timezone.utc)
+    start = as_utc(start) if start is not None else end - HISTORY_DEFAULT_WINDOW
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if resolution is not None and resolution < 1:
+        raise HTTPException(status_code=400, detail="resolution must be at least 1 second")
+    return await query_history_async(await session.connection(), user_id, start, end, resolution,
+                                     settings.COLD_STORAGE_DIR)
+
+@app.get("/fanout/stats")
+async def fanout_stats():
+    """Per-subscriber queue depth, drops and send lag"""
+    return {**hub.stats(), "cluster": router.stats()}
 
 # -------------------------------
 # HTTP endpoint to add emergency contacts
 # -------------------------------
 @app.post("/add_contact/{user_id}")
 async def add_contact(user_id: str, contact: str):
-    if user_id not in emergency_contacts:
-        emergency_contacts[user_id] = []
-    emergency_contacts[user_id].append(contact)
-    return {"status": f"Contact added for {user_id}", "contacts": emergency_contacts[user_id]}
+    contacts = await state.append(f"contacts:{user_id}", contact)
+    return {"status": f"Contact added for {user_id}", "contacts": contacts}
+
+# -------------------------------
+# Run server
+# -------------------------------
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000)
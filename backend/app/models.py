@@ -1,7 +1,16 @@
 # main_server/models.py
-from datetime import datetime
+from datetime import datetime, timezone
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
+def as_utc(timestamp: datetime) -> datetime:
+    """
+    Timestamps are stored in UTC. Aware ones (the mimic sends its local time
+    with the offset) are converted; naive ones are SQLite's read-backs of
+    stored values, which already are UTC.
+    """
+    return timestamp.replace(tzinfo=timezone.utc) if timestamp.tzinfo is None else timestamp.astimezone(timezone.utc)
+
 class User(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     user_id: str
@@ -9,6 +18,9 @@ class User(SQLModel, table=True):
     gender: str | None = None
 
 class HealthData(SQLModel, table=True):
+    # History/range queries are always per user and time window; unique so that
+    # a redelivered reading is skipped on insert (app.persistence)
+    __table_args__ = (Index("ux_healthdata_user_id_timestamp", "user_id", "timestamp", unique=True),)
     id: int | None = Field(default=None, primary_key=True)
     user_id: str
     timestamp: datetime
@@ -16,9 +28,59 @@ class HealthData(SQLModel, table=True):
     spo2: float
     stress: float
     activity: str
+    # Added with the write-behind ingest; nullable for rows stored before
+    respiratory_rate: float | None = None
+    hrv: float | None = None
+    temperature: float | None = None
+    systolic_bp: float | None = None
+    diastolic_bp: float | None = None
 
 class Alert(SQLModel, table=True):
+    __table_args__ = (Index("ix_alert_user_id_timestamp", "user_id", "timestamp"),)
     id: int | None = Field(default=None, primary_key=True)
     user_id: str
     alert_type: str
     timestamp: datetime
+
+# -------------------------------
+# Rollups of HealthData, maintained on ingest (see app.rollups)
+# -------------------------------
+class VitalsRollup(SQLModel):
+    """
+    min/max/sum/count per metric over one bucket; avg = sum / count of that metric.
+    Readings missing a metric (NULL) only count towards `count`; min/max are
+    NULL while a metric has no values. A NULL <metric>_count is a bucket
+    written before per-metric counts existed, where every reading had the metric.
+    """
+    user_id: str = Field(primary_key=True)
+    bucket: datetime = Field(primary_key=True)   # bucket start (UTC)
+    count: int
+    heart_rate_min: float | None = None
+    heart_rate_max: float | None = None
+    heart_rate_sum: float
+    heart_rate_count: int | None = None
+    spo2_min: float | None = None
+    spo2_max: float | None = None
+    spo2_sum: float
+    spo2_count: int | None = None
+    stress_min: float | None = None
+    stress_max: float | None = None
+    stress_sum: float
+    stress_count: int | None = None
+    respiratory_rate_min: float | None = None
+    respiratory_rate_max: float | None = None
+    respiratory_rate_sum: float
+    respiratory_rate_count: int | None = None
+    hrv_min: float | None = None
+    hrv_max: float | None = None
+    hrv_sum: float
+    hrv_count: int | None = None
+
+class VitalsRollup1m(VitalsRollup, table=True):
+    __tablename__ = "vitals_rollup_1m"
+
+class VitalsRollup1h(VitalsRollup, table=True):
+    __tablename__ = "vitals_rollup_1h"
+
+class VitalsRollup1d(VitalsRollup, table=True):
+    __tablename__ = "vitals_rollup_1d"
@@ -2,13 +2,13 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 from twilio.rest import Client
-from config import settings
+from app.config import settings
 
 # -------------------------------
 # Firebase setup
 # -------------------------------
 if not firebase_admin._apps:
-    cred = credentials.Certificate("firebase_service_account.json")  # your Firebase service account
+    cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS)  # your Firebase service account
     firebase_admin.initialize_app(cred)
 
 db = firestore.client()
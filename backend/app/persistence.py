@@ -0,0 +1,208 @@
+# main_server/persistence.py
+# Write-behind storage of readings in the HealthData table.
+#
+# Ingest only appends rows to an in-memory buffer. A single writer task turns
+# the buffer into one multi-row INSERT (executemany, batched by SQLAlchemy's
+# insertmanyvalues) whenever it holds batch_rows rows or its oldest row has
+# waited flush_seconds, running the blocking database call in a thread. While
+# a flush is slow the buffer keeps filling; past max_pending rows add() makes
+# the ingest path wait, which pushes back on the mimic link instead of growing
+# memory without bound. close() writes out whatever is left.
+# The 1m/1h/1d rollups (app.rollups) are updated in the same transaction.
+#
+# Inserts are idempotent: (user_id, timestamp) is unique and a row that is
+# already stored is skipped (ON CONFLICT DO NOTHING), and only the rows
+# actually inserted reach the rollups. A reading redelivered after a crash
+# therefore is neither stored nor counted twice. rows_committed counts rows
+# handed to add() that are now committed (or were duplicates), in add() order,
+# so a caller can wait_committed() for everything it added before acking it.
+import asyncio
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy.engine import Connection, Engine
+
+from app.frames import WearableReading
+from app.models import HealthData, as_utc
+from app.rollups import ROLLUP_METRICS, UPSERT_DIALECTS, write_rollups
+
+PERSIST_BATCH_ROWS = 5000
+PERSIST_FLUSH_SECONDS = 1.0
+PERSIST_MAX_PENDING_ROWS = 200_000
+RETRY_DELAY_SECONDS = 1.0
+
+
+def reading_row(user_id: str, reading: WearableReading) -> Dict[str, Any]:
+    """HealthData column values of a reading"""
+    metrics = reading.physiological_metrics
+    return {
+        "user_id": user_id,
+        "timestamp": as_utc(reading.timestamp),
+        "heart_rate": metrics.heart_rate,
+        "spo2": metrics.blood_oxygen,
+        "stress": metrics.stress_level,
+        "activity": reading.current_activity,
+        "respiratory_rate": metrics.respiratory_rate,
+        "hrv": metrics.hrv,
+        "temperature": metrics.temperature,
+        "systolic_bp": metrics.systolic_bp,
+        "diastolic_bp": metrics.diastolic_bp,
+    }
+
+
+def _insert_new(conn: Connection, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """INSERT ... ON CONFLICT DO NOTHING; returns the rollup columns of the rows inserted"""
+    insert = UPSERT_DIALECTS[conn.dialect.name][0]
+    columns = HealthData.__table__.c
+    stmt = (insert(HealthData)
+            .on_conflict_do_nothing(index_elements=["user_id", "timestamp"])
+            .returning(columns.user_id, columns.timestamp, *(columns[metric] for metric in ROLLUP_METRICS)))
+    return [dict(row._mapping) for row in conn.execute(stmt, rows)]
+
+
+class HealthDataWriter:
+    """Buffers readings and bulk-inserts them into HealthData"""
+
+    def __init__(self, engine: Engine,
+                 batch_rows: int = PERSIST_BATCH_ROWS,
+                 flush_seconds: float = PERSIST_FLUSH_SECONDS,
+                 max_pending: int = PERSIST_MAX_PENDING_ROWS):
+        if engine.dialect.name not in UPSERT_DIALECTS:
+            raise ValueError(f"HealthDataWriter needs INSERT ... ON CONFLICT; {engine.dialect.name} is not supported "
+                             f"(use one of {', '.join(sorted(UPSERT_DIALECTS))})")
+        self.engine = engine
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._rows: List[Dict[str, Any]] = []
+        self._oldest = 0.0
+        self._in_flight = 0
+        self._wakeup = asyncio.Event()      # size trigger
+        self._drained = asyncio.Event()     # buffer back under max_pending
+        self._drained.set()
+        self._committed = asyncio.Condition()
+        self._task = None
+        self._closing = False
+
+        self.rows_added = 0
+        self.rows_committed = 0
+        self.rows_written = 0
+        self.duplicates = 0
+        self.flushes = 0
+        self.flush_seconds_total = 0.0
+        self.errors = 0
+        self.backpressure_waits = 0
+
+    def pending(self) -> int:
+        return len(self._rows) + self._in_flight
+
+    def add_nowait(self, batch: Sequence[Tuple[str, WearableReading]]) -> None:
+        if not batch:
+            return
+        if not self._rows:
+            self._oldest = time.monotonic()
+        self._rows.extend(reading_row(user_id, reading) for user_id, reading in batch)
+        self.rows_added += len(batch)
+        if len(self._rows) >= self.batch_rows:
+            self._wakeup.set()
+        if self.pending() >= self.max_pending:
+            self._drained.clear()
+
+    async def wait_for_capacity(self) -> None:
+        if not self._drained.is_set():
+            self.backpressure_waits += 1
+            await self._drained.wait()
+
+    async def add(self, batch: Sequence[Tuple[str, WearableReading]]) -> None:
+        """Buffer readings; waits while the database is max_pending rows behind"""
+        self.add_nowait(batch)
+        await self.wait_for_capacity()
+
+    async def wait_committed(self, rows_added: int) -> None:
+        """Wait until the first rows_added rows handed to add() are committed"""
+        async with self._committed:
+            await self._committed.wait_for(lambda: self.rows_committed >= rows_added)
+
+    # -------------------------------
+    # Writer task
+    # -------------------------------
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def _insert(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert rows not stored yet and fold them into the rollups; returns rows inserted"""
+        with self.engine.begin() as conn:
+            inserted = _insert_new(conn, rows)
+            write_rollups(conn, inserted)
+        return len(inserted)
+
+    async def flush(self) -> None:
+        """Write out everything buffered so far"""
+        while self._rows:
+            rows = self._rows[:self.batch_rows]
+            del self._rows[:self.batch_rows]
+            self._oldest = time.monotonic()
+            self._in_flight = len(rows)
+            started = time.monotonic()
+            try:
+                inserted = await asyncio.to_thread(self._insert, rows)
+            except Exception as e:
+                # Keep the rows (in order) and retry; ingest backs off via max_pending
+                self.errors += 1
+                self._rows[:0] = rows
+                print(f"❌ [DB] Writing {len(rows)} readings failed: {e}")
+                if self._closing:
+                    # The writer task hands over to close(), whose final flush reports the failure
+                    if self._task is None:
+                        raise
+                    return
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+                continue
+            finally:
+                self._in_flight = 0
+            self.flushes += 1
+            self.rows_written += inserted
+            self.duplicates += len(rows) - inserted
+            self.flush_seconds_total += time.monotonic() - started
+            async with self._committed:
+                self.rows_committed += len(rows)
+                self._committed.notify_all()
+            if self.pending() < self.max_pending:
+                self._drained.set()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            if self._rows:
+                timeout = max(0.0, self._oldest + self.flush_seconds - time.monotonic())
+            else:
+                timeout = self.flush_seconds
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._rows and (len(self._rows) >= self.batch_rows
+                               or time.monotonic() - self._oldest >= self.flush_seconds):
+                await self.flush()
+
+    async def close(self) -> None:
+        """Stop the writer task (letting a running insert finish) and flush the remaining rows"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        self._drained.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows_written": self.rows_written,
+            "duplicates": self.duplicates,
+            "pending_rows": self.pending(),
+            "flushes": self.flushes,
+            "rows_per_flush": round(self.rows_written / self.flushes, 1) if self.flushes else 0,
+            "flush_ms_avg": round(self.flush_seconds_total / self.flushes * 1000, 2) if self.flushes else 0,
+            "errors": self.errors,
+            "backpressure_waits": self.backpressure_waits,
+        }
@@ -0,0 +1,250 @@
+# main_server/rollups.py
+# 1-minute / 1-hour / 1-day rollups of HealthData and the history query on top.
+#
+# The write-behind writer (app.persistence) calls write_rollups in the same
+# transaction as the raw insert: the batch is aggregated to 1-minute buckets,
+# those are merged into 1-hour and 1-day buckets, and each level is upserted
+# (counts and sums added, min/max combined) with INSERT ... ON CONFLICT.
+# Vitals missing from a row (NULL in rows stored before the column existed,
+# or in cold files) are skipped, and every metric keeps its own count, so
+# they neither show up as 0 nor lower the average.
+# query_history answers from the coarsest level whose bucket still fits in the
+# requested resolution, so a 30-day chart reads ~720 hourly rows instead of
+# 2.6M raw samples.
+import asyncio
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.models import as_utc, VitalsRollup, VitalsRollup1d, VitalsRollup1h, VitalsRollup1m
+from app.cold_storage import read_raw, read_raw_async
+
+ROLLUP_METRICS = ("heart_rate", "spo2", "stress", "respiratory_rate", "hrv")
+_COLUMNS = tuple((m, f"{m}_min", f"{m}_max", f"{m}_sum", f"{m}_count") for m in ROLLUP_METRICS)
+
+# Dialects with INSERT ... ON CONFLICT: name -> (insert, least, greatest)
+UPSERT_DIALECTS = {
+    "postgresql": (postgresql.insert, func.least, func.greatest),
+    "sqlite": (sqlite.insert, func.min, func.max),     # scalar min()/max() with two arguments
+}
+
+# (bucket seconds, name, table), finest first
+ROLLUPS: Tuple[Tuple[int, str, Type[VitalsRollup]], ...] = (
+    (60, "1m", VitalsRollup1m),
+    (3600, "1h", VitalsRollup1h),
+    (86400, "1d", VitalsRollup1d),
+)
+
+# Points returned when no resolution is given, and the most a query may return
+HISTORY_TARGET_POINTS = 500
+HISTORY_MAX_POINTS = 5000
+HISTORY_DEFAULT_WINDOW = timedelta(hours=24)
+# Above this many rows the async path aggregates in a thread instead of on the event loop
+HISTORY_INLINE_ROWS = 1000
+
+
+def bucket_start(timestamp: datetime, seconds: int) -> datetime:
+    epoch = timestamp.timestamp()
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc)
+
+
+# -------------------------------
+# Aggregation
+# -------------------------------
+def aggregate(rows: Iterable[Dict[str, Any]], seconds: int) -> List[Dict[str, Any]]:
+    """Raw HealthData rows -> rollup rows of the given bucket size; NULL metrics are skipped"""
+    groups: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for row in rows:
+        # Bucket number as the key; the datetime is only built once per bucket
+        key = (row["user_id"], int(as_utc(row["timestamp"]).timestamp() // seconds))
+        agg = groups.get(key)
+        if agg is None:
+            agg = groups[key] = {"user_id": key[0], "count": 0,
+                                 "bucket": datetime.fromtimestamp(key[1] * seconds, tz=timezone.utc)}
+            for _, low, high, total, count in _COLUMNS:
+                agg[low] = math.inf
+                agg[high] = -math.inf
+                agg[total] = 0.0
+                agg[count] = 0
+        agg["count"] += 1
+        for metric, low, high, total, count in _COLUMNS:
+            value = row[metric]
+            if value is None:
+                continue
+            if value < agg[low]:
+                agg[low] = value
+            if value > agg[high]:
+                agg[high] = value
+            agg[total] += value
+            agg[count] += 1
+    for agg in groups.values():
+        for _, low, high, _, count in _COLUMNS:
+            if not agg[count]:
+                agg[low] = agg[high] = None
+    return list(groups.values())
+
+
+def _metric_count(row: Dict[str, Any], count: str) -> int:
+    # NULL in rollup rows written before per-metric counts: every reading had the metric
+    value = row.get(count)
+    return row["count"] if value is None else value
+
+
+def _combine(a: Optional[float], b: Optional[float], pick: Any) -> Optional[float]:
+    """pick(a, b), ignoring a missing side"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return pick(a, b)
+
+
+def merge(rollups: Iterable[Dict[str, Any]], seconds: int) -> List[Dict[str, Any]]:
+    """Rollup rows -> rollup rows of a coarser bucket size"""
+    groups: Dict[Tuple[str, datetime], Dict[str, Any]] = {}
+    for row in rollups:
+        key = (row["user_id"], bucket_start(as_utc(row["bucket"]), seconds))
+        agg = groups.get(key)
+        if agg is None:
+            agg = groups[key] = {**row, "bucket": key[1]}
+            for _, _, _, _, count in _COLUMNS:
+                agg[count] = _metric_count(row, count)
+            continue
+        agg["count"] += row["count"]
+        for _, low, high, total, count in _COLUMNS:
+            agg[low] = _combine(agg[low], row[low], min)
+            agg[high] = _combine(agg[high], row[high], max)
+            agg[total] += row[total]
+            agg[count] += _metric_count(row, count)
+    return list(groups.values())
+
+
+def _upsert(conn: Connection, model: Type[VitalsRollup], rows: List[Dict[str, Any]]) -> None:
+    insert, least, greatest = UPSERT_DIALECTS[conn.dialect.name]
+    stmt = insert(model)
+    current, new = model.__table__.c, stmt.excluded
+    update = {"count": current["count"] + new["count"]}
+    for _, low, high, total, count in _COLUMNS:
+        # A NULL side (no values yet) must not win: SQLite's scalar min()/max() return NULL then
+        update[low] = least(func.coalesce(current[low], new[low]), func.coalesce(new[low], current[low]))
+        update[high] = greatest(func.coalesce(current[high], new[high]), func.coalesce(new[high], current[high]))
+        update[total] = current[total] + new[total]
+        update[count] = func.coalesce(current[count], current["count"]) + new[count]
+    conn.execute(stmt.on_conflict_do_update(index_elements=["user_id", "bucket"], set_=update), rows)
+
+
+def write_rollups(conn: Connection, rows: Sequence[Dict[str, Any]]) -> None:
+    """Fold a batch of raw rows into every rollup level"""
+    level = None
+    for seconds, _, model in ROLLUPS:
+        level = aggregate(rows, seconds) if level is None else merge(level, seconds)
+        if level:
+            _upsert(conn, model, level)
+
+
+# -------------------------------
+# History
+# -------------------------------
+def choose_source(resolution: int) -> Optional[Tuple[int, str, Type[VitalsRollup]]]:
+    """Coarsest rollup whose bucket fits in resolution (None = raw rows)"""
+    chosen = None
+    for rollup in ROLLUPS:
+        if rollup[0] <= resolution:
+            chosen = rollup
+    return chosen
+
+
+def _point(row: Dict[str, Any]) -> Dict[str, Any]:
+    point: Dict[str, Any] = {"timestamp": row["bucket"].isoformat(), "count": row["count"]}
+    for metric, low, high, total, count in _COLUMNS:
+        n = _metric_count(row, count)
+        point[metric] = {
+            "min": row[low],
+            "max": row[high],
+            "avg": round(row[total] / n, 2) if n else None,
+        }
+    return point
+
+
+def plan_history(start: datetime, end: datetime, resolution: Optional[int] = None
+                 ) -> Tuple[int, Optional[Tuple[int, str, Type[VitalsRollup]]]]:
+    """(resolution in seconds, rollup to read or None for raw rows) of a history query"""
+    span = (end - start).total_seconds()
+    if resolution is None:
+        resolution = math.ceil(span / HISTORY_TARGET_POINTS)
+    resolution = max(1, resolution, math.ceil(span / HISTORY_MAX_POINTS))
+
+    source = choose_source(resolution)
+    if source is not None:
+        # Whole source buckets per point, so points stay aligned to minutes/hours/days
+        resolution = math.ceil(resolution / source[0]) * source[0]
+    return resolution, source
+
+
+def _rollup_query(model: Type[VitalsRollup], seconds: int, user_id: str, start: datetime, end: datetime):
+    return (select(model)
+            .where(model.user_id == user_id, model.bucket >= bucket_start(start, seconds), model.bucket < end)
+            .order_by(model.bucket))
+
+
+def _history(user_id: str, start: datetime, end: datetime, resolution: int,
+             source: Optional[Tuple[int, str, Type[VitalsRollup]]], rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if source is None:
+        points = aggregate(rows, resolution)
+        source_name = "raw"
+    else:
+        seconds, source_name, _ = source
+        rows = [dict(row, bucket=as_utc(row["bucket"])) for row in rows]
+        points = merge(rows, resolution) if resolution > seconds else rows
+    return {
+        "user_id": user_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "resolution_seconds": resolution,
+        "source": source_name,
+        "points": [_point(row) for row in sorted(points, key=lambda row: row["bucket"])],
+    }
+
+
+def query_history(engine: Engine, user_id: str, start: datetime, end: datetime,
+                  resolution: Optional[int] = None, cold_root: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Vitals of a user in [start, end) as one point per resolution seconds.
+
+    Args:
+        resolution: bucket size in seconds; by default about HISTORY_TARGET_POINTS
+            points, and never more than HISTORY_MAX_POINTS
+        cold_root: cold storage directory, merged in when raw rows are needed
+
+    Returns:
+        {"resolution_seconds", "source" ("raw", "1m", "1h" or "1d"), "points": [...]}
+        where every point has count and min/max/avg per metric
+    """
+    resolution, source = plan_history(start, end, resolution)
+    with engine.connect() as conn:
+        if source is None:
+            rows = read_raw(conn, cold_root, user_id, start, end)
+        else:
+            seconds, _, model = source
+            rows = list(conn.execute(_rollup_query(model, seconds, user_id, start, end)).mappings())
+    return _history(user_id, start, end, resolution, source, rows)
+
+
+async def query_history_async(conn: AsyncConnection, user_id: str, start: datetime, end: datetime,
+                              resolution: Optional[int] = None, cold_root: Optional[str] = None) -> Dict[str, Any]:
+    """query_history on an AsyncConnection, for use from the event loop"""
+    resolution, source = plan_history(start, end, resolution)
+    if source is None:
+        rows = await read_raw_async(conn, cold_root, user_id, start, end)
+    else:
+        seconds, _, model = source
+        result = await conn.execute(_rollup_query(model, seconds, user_id, start, end))
+        rows = list(result.mappings())
+    if len(rows) > HISTORY_INLINE_ROWS:
+        return await asyncio.to_thread(_history, user_id, start, end, resolution, source, rows)
+    return _history(user_id, start, end, resolution, source, rows)
@@ -0,0 +1,231 @@
+# main_server/state.py
+# State shared by every main server process (uvicorn --workers N, several nodes).
+#
+# StateBackend offers the few Redis-shaped primitives the server needs:
+# string keys (optionally expiring), lists, sets and pub/sub channels. InMemoryStateBackend keeps
+# them in this process (single worker, tests); RedisStateBackend (REDIS_URL)
+# shares them between processes and machines. Keys are namespaced under
+# STATE_KEY_PREFIX.
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Sequence, Union
+
+from app.config import settings
+
+STATE_KEY_PREFIX = "lifelink:"
+
+# (channel, message) -> None; awaited in arrival order
+MessageHandler = Callable[[str, bytes], Awaitable[None]]
+
+
+class StateBackend(ABC):
+    """Interface shared by InMemoryStateBackend and RedisStateBackend"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Union[str, bytes], ttl: Optional[float] = None) -> None:
+        """Set key, expiring after ttl seconds when given"""
+        ...
+
+    @abstractmethod
+    async def set_if_absent(self, key: str, value: Union[str, bytes]) -> bool:
+        """Atomically create key; False if it already exists"""
+        ...
+
+    @abstractmethod
+    async def append(self, key: str, value: str) -> List[str]:
+        """Append to a list; returns the whole list"""
+        ...
+
+    @abstractmethod
+    async def get_list(self, key: str) -> List[str]:
+        ...
+
+    @abstractmethod
+    async def add_members(self, key: str, members: Sequence[str]) -> None:
+        ...
+
+    @abstractmethod
+    async def remove_members(self, key: str, members: Sequence[str]) -> None:
+        ...
+
+    @abstractmethod
+    async def members(self, key: str) -> Set[str]:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, message: Union[str, bytes]) -> None:
+        ...
+
+    @abstractmethod
+    async def listen(self, channels: Sequence[str], handler: MessageHandler,
+                     ready: Optional[asyncio.Event] = None) -> None:
+        """Deliver messages on channels to handler until cancelled; sets ready once subscribed"""
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+def _bytes(value: Union[str, bytes]) -> bytes:
+    return value.encode() if isinstance(value, str) else value
+
+
+# -------------------------------
+# In-process
+# -------------------------------
+class InMemoryStateBackend(StateBackend):
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.values: Dict[str, bytes] = {}
+        self.expires: Dict[str, float] = {}     # key -> clock time it expires
+        self.lists: Dict[str, List[str]] = defaultdict(list)
+        self.sets: Dict[str, Set[str]] = defaultdict(set)
+        self.channels: Dict[str, List[asyncio.Queue]] = defaultdict(list)
+
+    def _expire(self, key: str) -> None:
+        expires = self.expires.get(key)
+        if expires is not None and expires <= self.clock():
+            del self.expires[key]
+            self.values.pop(key, None)
+
+    async def get(self, key):
+        self._expire(key)
+        return self.values.get(key)
+
+    async def set(self, key, value, ttl=None):
+        self.values[key] = _bytes(value)
+        if ttl is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = self.clock() + ttl
+
+    async def set_if_absent(self, key, value):
+        self._expire(key)
+        if key in self.values:
+            return False
+        self.values[key] = _bytes(value)
+        return True
+
+    async def append(self, key, value):
+        self.lists[key].append(value)
+        return list(self.lists[key])
+
+    async def get_list(self, key):
+        return list(self.lists.get(key, ()))
+
+    async def add_members(self, key, members):
+        self.sets[key].update(members)
+
+    async def remove_members(self, key, members):
+        self.sets[key].difference_update(members)
+
+    async def members(self, key):
+        return set(self.sets.get(key, ()))
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+        self.expires.pop(key, None)
+        self.lists.pop(key, None)
+        self.sets.pop(key, None)
+
+    async def publish(self, channel, message):
+        for queue in self.channels.get(channel, ()):
+            queue.put_nowait((channel, _bytes(message)))
+
+    async def listen(self, channels, handler, ready=None):
+        queue: asyncio.Queue = asyncio.Queue()
+        for channel in channels:
+            self.channels[channel].append(queue)
+        if ready is not None:
+            ready.set()
+        try:
+            while True:
+                channel, message = await queue.get()
+                await handler(channel, message)
+        finally:
+            for channel in channels:
+                self.channels[channel].remove(queue)
+
+
+# -------------------------------
+# Redis
+# -------------------------------
+class RedisStateBackend(StateBackend):
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+
+    async def get(self, key):
+        return await self.redis.get(STATE_KEY_PREFIX + key)
+
+    async def set(self, key, value, ttl=None):
+        await self.redis.set(STATE_KEY_PREFIX + key, value, px=int(ttl * 1000) if ttl is not None else None)
+
+    async def set_if_absent(self, key, value):
+        return bool(await self.redis.set(STATE_KEY_PREFIX + key, value, nx=True))
+
+    async def append(self, key, value):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(STATE_KEY_PREFIX + key, value)
+            pipe.lrange(STATE_KEY_PREFIX + key, 0, -1)
+            _, values = await pipe.execute()
+        return [v.decode() for v in values]
+
+    async def get_list(self, key):
+        return [v.decode() for v in await self.redis.lrange(STATE_KEY_PREFIX + key, 0, -1)]
+
+    async def add_members(self, key, members):
+        if members:
+            await self.redis.sadd(STATE_KEY_PREFIX + key, *members)
+
+    async def remove_members(self, key, members):
+        if members:
+            await self.redis.srem(STATE_KEY_PREFIX + key, *members)
+
+    async def members(self, key):
+        return {m.decode() for m in await self.redis.smembers(STATE_KEY_PREFIX + key)}
+
+    async def delete(self, key):
+        await self.redis.delete(STATE_KEY_PREFIX + key)
+
+    async def publish(self, channel, message):
+        await self.redis.publish(STATE_KEY_PREFIX + channel, message)
+
+    async def listen(self, channels, handler, ready=None):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(*(STATE_KEY_PREFIX + channel for channel in channels))
+        if ready is not None:
+            ready.set()
+        try:
+            while True:
+                message = await pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    channel = message["channel"].decode()[len(STATE_KEY_PREFIX):]
+                    await handler(channel, message["data"])
+        finally:
+            await pubsub.aclose()
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_state_backend(backend: str, url: str) -> StateBackend:
+    if backend == "memory":
+        return InMemoryStateBackend()
+    if backend == "redis":
+        return RedisStateBackend(url)
+    raise ValueError(f"Unknown state backend '{backend}', expected 'memory' or 'redis'")
+
+
+state = create_state_backend(settings.STATE_BACKEND, settings.REDIS_URL)
@@ -0,0 +1,253 @@
+# main_server/triage.py
+# Tiered triage of every reading: a local model first, the LLM only when unsure.
+#
+# TriageModel is a logistic regression over hinge features of the vitals
+# (how far a vital is past a clinical limit, optionally ignored during
+# exertion), trained offline by ai_services/agents/train_triage.py and loaded
+# from triage_model.json. Scoring a frame is one matrix-vector product.
+# TriageEngine sorts scores into three tiers with the model's two thresholds:
+#   score < normal_below      normal, nothing else to do
+#   score >= critical_above   critical, raised locally as a "triage_critical"
+#                             detection (AlertManager onset/clear like any rule)
+#   in between                uncertain, escalated to the LLM risk worker
+#                             (ai_services/risk_worker.py) over vitals:triage,
+#                             at most once per escalate_cooldown per user
+# The risk worker answers every escalation entry with "llm_risk" detections
+# (onset at or above its threshold, clear below) on the entry's reply_to
+# stream, and whoever escalated feeds them to its AlertManager.
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.broker import TRIAGE_STREAM
+from app.detector import Detection
+from app.frames import WearableReading, encode_batch_frame
+
+TRIAGE_MODEL_PATH = os.path.join(os.path.dirname(__file__), "triage_model.json")
+TRIAGE_RULE = "triage_critical"
+RISK_RULE = "llm_risk"
+ESCALATE_COOLDOWN_SECONDS = 30.0
+
+TIERS = ("normal", "uncertain", "critical")
+
+
+@dataclass
+class Escalation:
+    """An uncertain reading for the LLM"""
+    user_id: str
+    reading: WearableReading
+    score: float
+
+
+class TriageModel:
+    """
+    Scores readings with the model file written by agents/train_triage.py.
+
+    Feature kinds (must match feature_matrix there):
+        below     max(0, at - vital)
+        above     max(0, vital - at)
+        activity  1 while current_activity is in "in"
+    below/above are zero while the activity is in unless_activity, or not in
+    when_activity when that is given.
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.features: List[Dict[str, Any]] = spec["features"]
+        self.normal_below = float(spec["normal_below"])
+        self.critical_above = float(spec["critical_above"])
+        self.evaluation: Dict[str, Any] = spec.get("evaluation", {})
+        self.metrics = tuple(sorted({feature["metric"] for feature in self.features if "metric" in feature}))
+        self._values = attrgetter(*self.metrics)
+        self._column = {metric: i for i, metric in enumerate(self.metrics)}
+
+        # Standardization folded into the weights: ((x - mean) / scale) @ w + b
+        scale = np.asarray(spec["scale"], dtype=float)
+        weights = np.asarray(spec["weights"], dtype=float)
+        self._weights = weights / scale
+        self._bias = float(spec["bias"]) - float(np.asarray(spec["mean"], dtype=float) @ self._weights)
+
+    @classmethod
+    def load(cls, path: str = TRIAGE_MODEL_PATH) -> "TriageModel":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def feature_matrix(self, readings: Sequence[WearableReading]) -> np.ndarray:
+        values = np.array([self._values(reading.physiological_metrics) for reading in readings], dtype=float)
+        values = values.reshape(len(readings), len(self.metrics))
+        activity = np.array([reading.current_activity for reading in readings])
+        columns = []
+        for feature in self.features:
+            if feature["kind"] == "activity":
+                columns.append(np.isin(activity, feature["in"]).astype(float))
+                continue
+            column = values[:, self._column[feature["metric"]]]
+            if feature["kind"] == "below":
+                column = np.maximum(0.0, feature["at"] - column)
+            elif feature["kind"] == "above":
+                column = np.maximum(0.0, column - feature["at"])
+            if feature.get("unless_activity"):
+                column = column * ~np.isin(activity, feature["unless_activity"])
+            if feature.get("when_activity"):
+                column = column * np.isin(activity, feature["when_activity"])
+            columns.append(column)
+        return np.stack(columns, axis=1)
+
+    def score(self, readings: Sequence[WearableReading]) -> np.ndarray:
+        """Probability of an emergency for each reading"""
+        if not readings:
+            return np.empty(0)
+        z = self.feature_matrix(readings) @ self._weights + self._bias
+        return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+class TriageEngine:
+    """
+    Splits frames into the three tiers; see the module header.
+
+    Args:
+        model: Scoring model
+        normal_below: Scores below are normal (default: the model's)
+        critical_above: Scores at or above are critical (default: the model's)
+        escalate_cooldown: Seconds between two escalations of the same user
+        clock: Monotonic time source of the cooldown
+    """
+
+    def __init__(self, model: TriageModel,
+                 normal_below: Optional[float] = None,
+                 critical_above: Optional[float] = None,
+                 escalate_cooldown: float = ESCALATE_COOLDOWN_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.model = model
+        self.normal_below = model.normal_below if normal_below is None else normal_below
+        self.critical_above = model.critical_above if critical_above is None else critical_above
+        if self.critical_above < self.normal_below:
+            raise ValueError("critical_above must not be below normal_below")
+        self.escalate_cooldown = escalate_cooldown
+        self.clock = clock
+        self.critical: Set[str] = set()             # users whose last reading was critical
+        self._escalated_at: Dict[str, float] = {}
+
+        self.readings = 0
+        self.tiers = [0, 0, 0]
+        self.escalated = 0
+        self.cooled_down = 0
+        self.detections = 0
+        self.seconds_total = 0.0
+
+    def process(self, batch: Sequence[Tuple[str, WearableReading]]) -> Tuple[List[Detection], List[Escalation]]:
+        """
+        Score a frame of (user_id, reading) in order.
+
+        Returns:
+            (onset/clear detections of TRIAGE_RULE, escalations of uncertain readings)
+        """
+        if not batch:
+            return [], []
+        started = time.perf_counter()
+        scores = self.model.score([reading for _, reading in batch])
+        tiers = np.digitize(scores, [self.normal_below, self.critical_above])
+        self.readings += len(batch)
+        self.tiers = [count + int(n) for count, n in zip(self.tiers, np.bincount(tiers, minlength=3))]
+
+        detections: List[Detection] = []
+        # Readings of users that are or become critical in this frame: onset and clear edges
+        flagged = self.critical | {batch[i][0] for i in np.flatnonzero(tiers == 2)}
+        watch = [i for i, (user_id, _) in enumerate(batch) if user_id in flagged] if flagged else []
+        for i in watch:
+            user_id, reading = batch[i]
+            critical = tiers[i] == 2
+            if critical == (user_id in self.critical):
+                continue
+            if critical:
+                self.critical.add(user_id)
+            else:
+                self.critical.discard(user_id)
+            detections.append(Detection(
+                user_id=user_id, rule=TRIAGE_RULE, metric="risk", stat="model",
+                value=round(float(scores[i]), 4), score=float(scores[i]), threshold=self.critical_above,
+                severity="critical", timestamp=reading.timestamp,
+                description="Local triage model: emergency likely",
+                event="onset" if critical else "clear"))
+        self.detections += len(detections)
+
+        escalations: List[Escalation] = []
+        uncertain = np.flatnonzero(tiers == 1)
+        if len(uncertain):
+            now = self.clock()
+            for i in uncertain:
+                user_id, reading = batch[i]
+                if now - self._escalated_at.get(user_id, -self.escalate_cooldown) < self.escalate_cooldown:
+                    self.cooled_down += 1
+                    continue
+                self._escalated_at[user_id] = now
+                escalations.append(Escalation(user_id, reading, float(scores[i])))
+            self.escalated += len(escalations)
+
+        self.seconds_total += time.perf_counter() - started
+        return detections, escalations
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "readings": self.readings,
+            **dict(zip(TIERS, self.tiers)),
+            "resolved_locally": round(1 - self.tiers[1] / self.readings, 4) if self.readings else 0,
+            "escalated": self.escalated,
+            "cooled_down": self.cooled_down,
+            "detections": self.detections,
+            "critical_users": len(self.critical),
+            "us_per_reading": round(self.seconds_total / self.readings * 1e6, 2) if self.readings else 0,
+            "thresholds": {"normal_below": self.normal_below, "critical_above": self.critical_above},
+            "model": self.model.evaluation,
+        }
+
+
+def escalation_entries(escalations: Sequence[Escalation], reply_to: str,
+                       node: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    One TRIAGE_STREAM entry for a frame's escalations: the readings as a batch
+    frame, scores alongside.
+
+    Args:
+        escalations: Uncertain readings of one frame
+        reply_to: Stream the risk worker publishes its detections to
+        node: Copied into the reply, for readers of a stream shared by several servers
+    """
+    if not escalations:
+        return []
+    fields = {
+        "frame": encode_batch_frame([(escalation.user_id, escalation.reading) for escalation in escalations]),
+        "scores": json.dumps([round(escalation.score, 4) for escalation in escalations]),
+        "reply_to": reply_to,
+    }
+    if node is not None:
+        fields["node"] = node
+    return [(TRIAGE_STREAM, fields)]
+
+
+def decode_risk_detections(payload: Any) -> List[Detection]:
+    """Detections of a risk worker reply ({"detections": JSON array of Detection fields})"""
+    detections = []
+    for fields in json.loads(payload):
+        timestamp = fields.get("timestamp")
+        detections.append(Detection(**{
+            **fields,
+            "timestamp": datetime.fromisoformat(timestamp) if timestamp else datetime.now(timezone.utc),
+        }))
+    return detections
+
+
+def load_triage_engine(path: Optional[str] = None, **kwargs: Any) -> Optional[TriageEngine]:
+    """TriageEngine on the model file, or None (with a warning) when there is none"""
+    path = path or TRIAGE_MODEL_PATH
+    try:
+        model = TriageModel.load(path)
+    except FileNotFoundError:
+        print(f"⚠️ No triage model at {path}; train one with `python -m agents.train_triage`")
+        return None
+    return TriageEngine(model, **kwargs)
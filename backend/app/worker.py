@@ -0,0 +1,283 @@
+# main_server/worker.py
+# Detection worker: consumes vitals:raw partitions, runs the detector and
+# alert state machine, and publishes dashboard alerts to vitals:analyzed.
+#
+# Scaling: run WORKER_COUNT processes (on any number of machines sharing
+# REDIS_URL), each with its own WORKER_INDEX:
+#   WORKER_INDEX=0 WORKER_COUNT=4 python -m app.worker
+# A worker owns the partitions p with p % WORKER_COUNT == WORKER_INDEX, so all
+# readings of a user go through one detector in order. Within a partition the
+# consumer group delivers each entry once, and entries left pending by a
+# crashed worker are reclaimed (first thing on startup, then periodically once
+# idle for CLAIM_IDLE_MS).
+# An entry is acked only once its effects are durable: the events it caused
+# (escalations, dashboard messages) are published and, with PERSIST_READINGS,
+# its readings are committed (app.persistence). Acks go out in the order the
+# entries were handled, each with the partition's high-water mark, which the
+# broker stores in the same transaction. The mark is loaded on startup and
+# skips entries that were processed but whose ack was lost, so a redelivery
+# never reaches the detector twice, across restarts too. A crash between the
+# commit and the ack redelivers the entry; its readings are then skipped by
+# the unique (user_id, timestamp) key, and its events are published again.
+# With TRIAGE_ENABLED readings also go through the local triage model
+# (app.triage); TRIAGE_ESCALATE publishes the uncertain ones to vitals:triage,
+# and the risk worker's detections come back as entries of the partition the
+# readings came from, so they reach this partition's AlertManager in order.
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from app.broker import (ANALYZED_STREAM, DETECTOR_GROUP, Entry, StreamBroker, create_broker,
+                        entry_id_key, raw_stream)
+from app.frames import FrameError, decode_frame
+from app.detector import StreamingDetector
+from app.alerting import AlertManager, NotificationDispatcher
+from app.persistence import HealthDataWriter
+from app.triage import TriageEngine, decode_risk_detections, escalation_entries, load_triage_engine
+from app.database import engine, init_db
+from app.config import settings
+
+READ_COUNT = 64              # stream entries per XREADGROUP
+READ_BLOCK_MS = 1000
+CLAIM_IDLE_MS = 30_000       # pending this long = its consumer is presumed dead
+CLAIM_INTERVAL_SECONDS = 10.0
+ALERT_TICK_SECONDS = 0.5
+
+
+def owned_partitions(partitions: int, worker_index: int, worker_count: int) -> List[int]:
+    return [p for p in range(partitions) if p % worker_count == worker_index]
+
+
+class DetectionWorker:
+    """Consumer-group reader of a set of raw partitions with its own detector state"""
+
+    def __init__(self, broker: StreamBroker, partitions: Sequence[int], consumer: str,
+                 detector: Optional[StreamingDetector] = None,
+                 alert_manager: Optional[AlertManager] = None,
+                 notify_contacts: bool = False,
+                 group: str = DETECTOR_GROUP,
+                 claim_idle_ms: int = CLAIM_IDLE_MS,
+                 writer: Optional[HealthDataWriter] = None,
+                 triage: Optional[TriageEngine] = None,
+                 escalate: bool = False):
+        self.broker = broker
+        self.streams = [raw_stream(p) for p in partitions]
+        self.consumer = consumer
+        self.group = group
+        self.claim_idle_ms = claim_idle_ms
+        self.detector = detector or StreamingDetector()
+        self.alert_manager = alert_manager or AlertManager()
+        self.dispatcher = NotificationDispatcher(self._queue_event, notify_contacts)
+        self.writer = writer
+        self.triage = triage
+        self.escalate = escalate
+        self._events: List[Tuple[str, Dict[str, bytes]]] = []
+        self.high_water: Dict[str, Tuple[int, int]] = {}   # stream -> last processed entry id
+        # Handled, not yet acked: (stream, entry ids, high-water mark, writer rows to wait for)
+        self._unacked: Deque[Tuple[str, List[str], str, int]] = deque()
+        self._ack_lock = asyncio.Lock()
+
+        self.entries = 0
+        self.readings = 0
+        self.rejected = 0
+        self.rejected_readings = 0
+        self.duplicates = 0
+        self.reclaimed = 0
+
+    def _queue_event(self, user_id: str, message: str) -> None:
+        self._events.append((ANALYZED_STREAM, {"user_id": user_id, "message": message}))
+
+    # -------------------------------
+    # Processing
+    # -------------------------------
+    def process_entries(self, stream: str, entries: List[Entry]) -> List[str]:
+        """Run entries through the detector in id order; returns the ids to ack"""
+        high_water = self.high_water.get(stream, (0, -1))
+        batch = []
+        risk_detections = []
+        for entry_id, fields in sorted(entries, key=lambda entry: entry_id_key(entry[0])):
+            key = entry_id_key(entry_id)
+            if key <= high_water:
+                self.duplicates += 1
+                continue
+            high_water = key
+            self.entries += 1
+            try:
+                if "detections" in fields:
+                    # Risk worker reply to an escalation of this partition
+                    risk_detections.extend(decode_risk_detections(fields["detections"]))
+                else:
+                    bad_readings: List[str] = []
+                    batch.extend(decode_frame(fields["frame"], bad_readings))
+                    self.rejected_readings += len(bad_readings)
+            except (FrameError, KeyError, TypeError, ValueError):
+                # Poison entries are acked and dropped, never retried
+                self.rejected += 1
+        self.high_water[stream] = high_water
+
+        for detection in self.detector.process(batch):
+            self.alert_manager.observe(detection)
+        if self.triage is not None:
+            detections, escalations = self.triage.process(batch)
+            for detection in detections:
+                self.alert_manager.observe(detection)
+            if self.escalate:
+                self._events.extend(escalation_entries(escalations, reply_to=stream))
+        for detection in risk_detections:
+            self.alert_manager.observe(detection)
+        if self.writer is not None:
+            self.writer.add_nowait(batch)
+        self.readings += len(batch)
+        return [entry_id for entry_id, _ in entries]
+
+    async def _handle(self, stream: str, entries: List[Entry]) -> None:
+        ids = self.process_entries(stream, entries)
+        # Escalations of these entries go out before the entries are acked
+        await self.publish_events()
+        rows = self.writer.rows_added if self.writer is not None else 0
+        self._unacked.append((stream, ids, "%d-%d" % self.high_water[stream], rows))
+        if self.writer is not None:
+            # Stop reading (and let entries wait in the stream) while the database is behind
+            await self.writer.wait_for_capacity()
+        await self.ack_durable()
+
+    async def ack_durable(self) -> None:
+        """Ack handled entries whose readings are committed, in the order they were handled"""
+        async with self._ack_lock:
+            while self._unacked:
+                stream, ids, mark, rows = self._unacked[0]
+                if self.writer is not None and self.writer.rows_committed < rows:
+                    break
+                await self.broker.ack(stream, self.group, ids, mark)
+                self._unacked.popleft()
+
+    async def setup(self) -> None:
+        for stream in self.streams:
+            await self.broker.ensure_group(stream, self.group)
+            mark = await self.broker.high_water(stream, self.group)
+            if mark is not None:
+                self.high_water[stream] = max(self.high_water.get(stream, (0, -1)), entry_id_key(mark))
+
+    async def reclaim(self, min_idle_ms: int) -> int:
+        """Process entries other (dead) consumers left unacked"""
+        total = 0
+        for stream in self.streams:
+            # Handled entries stay pending until committed: move past them, never claim them again
+            start_id = "0-0"
+            while True:
+                entries = await self.broker.claim_stale(stream, self.group, self.consumer,
+                                                        min_idle_ms, READ_COUNT, start_id)
+                if not entries:
+                    break
+                await self._handle(stream, entries)
+                total += len(entries)
+                ms, seq = max(entry_id_key(entry_id) for entry_id, _ in entries)
+                start_id = f"{ms}-{seq + 1}"
+        self.reclaimed += total
+        return total
+
+    async def poll(self, block_ms: int = READ_BLOCK_MS) -> int:
+        """One XREADGROUP round over every owned partition; returns entries handled"""
+        response = await self.broker.read_group(self.group, self.consumer, self.streams,
+                                                READ_COUNT, block_ms)
+        for stream, entries in response.items():
+            await self._handle(stream, entries)
+        return sum(len(entries) for entries in response.values())
+
+    async def publish_events(self) -> None:
+        if self._events:
+            events, self._events = self._events, []
+            await self.broker.publish(events)
+
+    async def flush_alerts(self) -> None:
+        for notification in self.alert_manager.tick():
+            self.dispatcher.dispatch(notification)
+        await self.publish_events()
+
+    # -------------------------------
+    # Loops
+    # -------------------------------
+    async def run(self) -> None:
+        await self.setup()
+        # Entries a previous owner of these partitions never acked come before new ones
+        reclaimed = await self.reclaim(0)
+        if reclaimed:
+            print(f"♻️ [{self.consumer}] Reclaimed {reclaimed} pending entries")
+        alert_task = asyncio.create_task(self._run_alert_loop())
+        last_claim = time.monotonic()
+        try:
+            while True:
+                await self.poll()
+                if time.monotonic() - last_claim >= CLAIM_INTERVAL_SECONDS:
+                    await self.reclaim(self.claim_idle_ms)
+                    last_claim = time.monotonic()
+        finally:
+            alert_task.cancel()
+
+    async def _run_alert_loop(self) -> None:
+        while True:
+            await self.flush_alerts()
+            # Entries whose readings were committed since they were handled
+            await self.ack_durable()
+            await asyncio.sleep(ALERT_TICK_SECONDS)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "consumer": self.consumer,
+            "streams": self.streams,
+            "entries": self.entries,
+            "readings": self.readings,
+            "rejected": self.rejected,
+            "rejected_readings": self.rejected_readings,
+            "duplicates": self.duplicates,
+            "reclaimed": self.reclaimed,
+            "unacked": sum(len(ids) for _, ids, _, _ in self._unacked),
+            "pending": {stream: await self.broker.pending(stream, self.group) for stream in self.streams},
+            "detector": self.detector.stats(),
+            "alerts": self.alert_manager.stats(),
+            "triage": self.triage.stats() if self.triage is not None else None,
+            "storage": self.writer.stats() if self.writer is not None else None,
+        }
+
+
+# -------------------------------
+# Run worker
+# -------------------------------
+def create_triage() -> Optional[TriageEngine]:
+    """The configured triage engine, or None when TRIAGE_ENABLED is off or there is no model"""
+    if not settings.TRIAGE_ENABLED:
+        return None
+    return load_triage_engine(settings.TRIAGE_MODEL_PATH,
+                              normal_below=settings.TRIAGE_NORMAL_BELOW,
+                              critical_above=settings.TRIAGE_CRITICAL_ABOVE,
+                              escalate_cooldown=settings.TRIAGE_ESCALATE_COOLDOWN_SECONDS)
+
+
+async def main() -> None:
+    partitions = owned_partitions(settings.STREAM_PARTITIONS, settings.WORKER_INDEX, settings.WORKER_COUNT)
+    broker = create_broker(settings.BROKER_BACKEND, settings.REDIS_URL, settings.STREAM_MAXLEN)
+    writer = None
+    if settings.PERSIST_READINGS:
+        init_db()
+        writer = HealthDataWriter(engine, settings.PERSIST_BATCH_ROWS, settings.PERSIST_FLUSH_SECONDS,
+                                  settings.PERSIST_MAX_PENDING_ROWS)
+        writer.start()
+    worker = DetectionWorker(broker, partitions, f"worker-{settings.WORKER_INDEX}",
+                             notify_contacts=settings.NOTIFY_CONTACTS, writer=writer,
+                             triage=create_triage(), escalate=settings.TRIAGE_ESCALATE)
+    print(f"✅ Detection worker {settings.WORKER_INDEX}/{settings.WORKER_COUNT} consuming partitions {partitions}")
+    try:
+        await worker.run()
+    finally:
+        if writer is not None:
+            await writer.close()
+        await worker.ack_durable()
+        await broker.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
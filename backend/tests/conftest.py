@@ -0,0 +1,9 @@
+# tests/conftest.py
+# Run from backend/: app is imported as a package, and the simulator
+# (ai_services) as top-level modules, the way its scripts run.
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(1, os.path.join(BACKEND_DIR, "ai_services"))
@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.alerting import AlertManager, AlertState, EscalationPolicy, TokenBucket
+from app.detector import Detection
+
+POLICIES = {
+    "critical": EscalationPolicy(onset_seconds=3, clear_seconds=30, cooldown_seconds=300,
+                                 levels=((0, "dashboard"), (0, "sms"), (30, "call"))),
+    "warning": EscalationPolicy(onset_seconds=10, clear_seconds=30, cooldown_seconds=600,
+                                levels=((0, "dashboard"), (120, "sms"))),
+}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def manager(clock):
+    return AlertManager(POLICIES, rate_limits={}, clock=clock)
+
+
+def _detection(event="onset", severity="critical", user_id="u1", rule="tachycardia"):
+    return Detection(user_id=user_id, rule=rule, metric="heart_rate", stat="ewma", value=170.0, score=170.0,
+                     threshold=150, severity=severity, timestamp=datetime(2025, 1, 1), event=event)
+
+
+def _state(manager, user_id="u1", rule="tachycardia"):
+    alert = manager.alerts.get((user_id, rule))
+    return alert.state if alert else None
+
+
+def _channels(notifications):
+    return [(n.channel, n.resolved) for n in notifications]
+
+
+# -------------------------------
+# Hysteresis
+# -------------------------------
+def test_pending_active_clearing_resolved(manager, clock):
+    manager.observe(_detection())
+    assert _state(manager) == AlertState.PENDING
+    clock.now = 2.9
+    assert manager.tick() == []
+
+    clock.now = 3.0
+    assert _channels(manager.tick()) == [("dashboard", False), ("sms", False)]
+    assert _state(manager) == AlertState.ACTIVE
+
+    clock.now = 10.0
+    manager.observe(_detection("clear"))
+    assert _state(manager) == AlertState.CLEARING
+    clock.now = 39.9
+    assert manager.tick() == []
+
+    clock.now = 40.0
+    assert _channels(manager.tick()) == [("dashboard", True)]
+    assert _state(manager) is None
+    assert manager.counters["state:resolved"] == 1
+    # The decision log is stamped in UTC, whatever the server's timezone
+    assert all(datetime.fromisoformat(d["timestamp"]).utcoffset() == timedelta(0) for d in manager.decision_log())
+
+
+def test_clear_while_pending_drops_the_alert(manager, clock):
+    manager.observe(_detection())
+    clock.now = 1.0
+    manager.observe(_detection("clear"))
+    assert _state(manager) is None
+    clock.now = 10.0
+    assert manager.tick() == []
+    assert manager.counters["suppress:cleared_before_onset"] == 1
+
+
+def test_flapping_signal_notifies_once(manager, clock):
+    manager.observe(_detection())
+    clock.now = 3.0
+    assert len(manager.tick()) == 2
+    for t in (5.0, 7.0, 9.0):
+        clock.now = t
+        manager.observe(_detection("clear"))
+        clock.now = t + 1
+        manager.observe(_detection())
+        assert manager.tick() == []
+    assert _state(manager) == AlertState.ACTIVE
+    assert manager.counters["suppress:flapping"] == 3
+
+
+def test_duplicate_onsets_are_suppressed(manager, clock):
+    manager.observe(_detection())
+    manager.observe(_detection())
+    assert manager.counters["suppress:duplicate"] == 1
+    clock.now = 3.0
+    assert len(manager.tick()) == 2
+
+
+# -------------------------------
+# Escalation and cooldown
+# -------------------------------
+def test_escalation_levels_fire_after_their_delays(manager, clock):
+    manager.observe(_detection())
+    clock.now = 3.0
+    manager.tick()
+    clock.now = 32.9
+    assert manager.tick() == []
+    clock.now = 33.0
+    [call] = manager.tick()
+    assert (call.channel, call.level) == ("call", 2)
+    clock.now = 100.0
+    assert manager.tick() == []
+
+
+def test_cooldown_after_resolution(manager, clock):
+    manager.observe(_detection())
+    clock.now = 3.0
+    manager.tick()
+    manager.observe(_detection("clear"))
+    clock.now = 33.0
+    manager.tick()
+
+    # Back within the 300 s cooldown: held until it expires
+    clock.now = 40.0
+    manager.observe(_detection())
+    assert manager.counters["suppress:cooldown"] == 1
+    clock.now = 332.9
+    assert manager.tick() == []
+    clock.now = 333.0
+    assert _channels(manager.tick()) == [("dashboard", False), ("sms", False)]
+
+
+def test_unknown_severity_uses_warning_policy(manager, clock):
+    manager.observe(_detection(severity="info"))
+    clock.now = 9.9
+    assert manager.tick() == []
+    clock.now = 10.0
+    assert _channels(manager.tick()) == [("dashboard", False)]
+
+
+# -------------------------------
+# Rate limits
+# -------------------------------
+def test_rate_limit_prefers_critical_and_retries(clock):
+    manager = AlertManager(POLICIES, rate_limits={"sms": (0.1, 1)}, clock=clock)
+    warning = POLICIES["warning"]
+    manager.observe(_detection(severity="warning", user_id="w"))
+    clock.now = warning.onset_seconds
+    manager.tick()
+    clock.now = warning.onset_seconds + 120 - 3
+    manager.observe(_detection(user_id="c"))
+    clock.now += 3
+    # One SMS token: the critical alert gets it, the warning's SMS waits
+    notifications = manager.tick()
+    assert [(n.user_id, n.channel) for n in notifications] == [("c", "dashboard"), ("c", "sms")]
+    assert manager.counters["suppress:rate_limited"] == 1
+    manager.tick()
+    assert manager.counters["suppress:rate_limited"] == 1   # logged once per level
+    clock.now += 10
+    assert [(n.user_id, n.channel) for n in manager.tick()] == [("w", "sms")]
+
+
+def test_token_bucket_refills(clock):
+    bucket = TokenBucket(rate=0.5, burst=2, clock=clock)
+    assert bucket.try_acquire() and bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now = 2.0
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
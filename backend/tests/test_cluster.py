@@ -0,0 +1,83 @@
+import asyncio
+
+from app.cluster import NODES_KEY, ClusterRouter, node_users_key
+from app.fanout import FanoutHub
+from app.frames import encode_live_reading
+from app.state import InMemoryStateBackend
+
+
+async def _noop(text):
+    pass
+
+
+def _node(state, node_id):
+    return ClusterRouter(state, FanoutHub(encode_live_reading), node_id, flush_interval=0.01,
+                         heartbeat_interval=0.01, node_ttl=15)
+
+
+def test_expired_node_is_pruned():
+    now = [0.0]
+    state = InMemoryStateBackend(clock=lambda: now[0])
+
+    async def run():
+        a, b = _node(state, "a"), _node(state, "b")
+        await a.start()
+        await b.start()
+        b.hub.subscribe(_noop, ["u1"])
+        await asyncio.sleep(0.05)
+        assert a.remote == {"u1": {"b"}}
+
+        # b crashes: no stop(), its heartbeat just ends
+        for task in b._tasks:
+            task.cancel()
+        now[0] = 20.0
+        await asyncio.sleep(0.05)
+        assert a.remote == {}
+        assert await state.members(NODES_KEY) == {"a"}
+        assert await state.members(node_users_key("b")) == set()
+        assert a.stats()["pruned_nodes"] == 1
+        await a.stop()
+
+    asyncio.run(run())
+
+
+def test_live_nodes_are_kept():
+    now = [0.0]
+    state = InMemoryStateBackend(clock=lambda: now[0])
+
+    async def run():
+        a, b = _node(state, "a"), _node(state, "b")
+        await a.start()
+        await b.start()
+        b.hub.subscribe(_noop, ["u1"])
+        for _ in range(5):
+            now[0] += 10.0      # within the TTL of the last heartbeat
+            await asyncio.sleep(0.03)
+        assert a.remote == {"u1": {"b"}}
+        assert a.pruned_nodes == 0
+        await a.stop()
+        await b.stop()
+
+    asyncio.run(run())
+
+
+def test_pruned_node_registers_again():
+    state = InMemoryStateBackend()
+
+    async def run():
+        a, b = _node(state, "a"), _node(state, "b")
+        await a.start()
+        await b.start()
+        b.hub.subscribe(_noop, ["u1"])
+        await asyncio.sleep(0.05)
+        # As if a had pruned b during a stall
+        await state.remove_members(NODES_KEY, ["b"])
+        await state.delete(node_users_key("b"))
+        a._apply_routes({"node": "b", "down": True})
+        await asyncio.sleep(0.05)
+        assert "b" in await state.members(NODES_KEY)
+        assert a.remote == {"u1": {"b"}}
+        await a.stop()
+        await b.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.cold_storage import COLD_COLUMNS, COLD_SCHEMA, compact, day_path, read_cold, user_dir
+from app.models import HealthData
+
+DAY = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'hot.db'}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def _row(user_id, seconds, heart_rate=72.0, spo2=98.6):
+    return HealthData(user_id=user_id, timestamp=DAY + timedelta(seconds=seconds), heart_rate=heart_rate,
+                      spo2=spo2, stress=31.0, activity="resting", respiratory_rate=14.2, hrv=48.3,
+                      temperature=36.7, systolic_bp=118.0, diastolic_bp=76.0)
+
+
+def test_compact_round_trips_values_exactly(engine, tmp_path):
+    root = str(tmp_path / "cold")
+    with Session(engine) as session:
+        session.add_all([_row("u1", i, heart_rate=70.0 + i / 10) for i in range(10)])
+        session.commit()
+
+    moved = compact(engine, root, DAY + timedelta(days=2))
+    assert moved == {"users": 1, "days": 1, "rows": 10}
+    with Session(engine) as session:
+        assert session.exec(select(HealthData)).all() == []
+
+    rows = read_cold(root, "u1", DAY, DAY + timedelta(days=1)).to_pylist()
+    assert [row["heart_rate"] for row in rows] == [70.0 + i / 10 for i in range(10)]
+    assert rows[0]["spo2"] == 98.6 and rows[0]["temperature"] == 36.7
+    assert rows[0]["activity"] == "resting"
+
+
+def test_legacy_float32_files_read_back_as_stored(tmp_path):
+    root = str(tmp_path)
+    path = day_path(root, "u1", DAY.date())
+    os.makedirs(os.path.dirname(path))
+    legacy = pa.schema([(field.name, pa.float32()) if field.name in COLD_COLUMNS else field
+                        for field in COLD_SCHEMA])
+    pq.write_table(pa.Table.from_pylist([{"timestamp": DAY, "heart_rate": 72.0, "spo2": 98.6, "stress": 31.0,
+                                          "respiratory_rate": 14.2, "hrv": 48.3, "temperature": 36.7,
+                                          "systolic_bp": None, "diastolic_bp": None, "activity": "resting"}],
+                                        schema=legacy), path)
+    [row] = read_cold(root, "u1", DAY, DAY + timedelta(days=1)).to_pylist()
+    assert row["spo2"] == 98.6 and row["hrv"] == 48.3 and row["systolic_bp"] is None
+
+
+@pytest.mark.parametrize("user_id", ["../../etc", "..", ".", "a/b", "a\\b", "x" * 200, "ünïcode"])
+def test_unsafe_user_ids_stay_inside_root(tmp_path, user_id):
+    root = str(tmp_path)
+    path = os.path.realpath(day_path(root, user_id, DAY.date()))
+    assert os.path.dirname(path) == os.path.join(os.path.realpath(root), user_dir(user_id))
+    assert user_dir(user_id).startswith("~")
+
+
+def test_safe_user_ids_are_kept():
+    assert user_dir("USER_001") == "USER_001"
+    assert user_dir("john.doe-2") == "john.doe-2"
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.detector import _RESYNC_SAMPLES, DEFAULT_RULES, Rule, StreamingDetector
+from app.frames import PhysiologicalMetrics, WearableReading
+
+START = datetime(2025, 1, 1)
+
+
+def _reading(i=0, heart_rate=60.0, blood_oxygen=98.0, respiratory_rate=14.0, hrv=50.0,
+             activity="resting", duration=1.0, user_id="u1"):
+    return (user_id, WearableReading(
+        timestamp=START + timedelta(seconds=i), user_id=user_id, current_activity=activity,
+        duration_seconds=duration,
+        physiological_metrics=PhysiologicalMetrics(heart_rate=heart_rate, stress_level=10,
+                                                   blood_oxygen=blood_oxygen,
+                                                   respiratory_rate=respiratory_rate, hrv=hrv)))
+
+
+def _feed(detector, heart_rates, **kwargs):
+    detections = []
+    for i, heart_rate in enumerate(heart_rates):
+        detections.extend(detector.process([_reading(i, heart_rate, **kwargs)]))
+    return detections
+
+
+def _heart_rate(detector, user_id="u1"):
+    return detector.user_stats(user_id)["metrics"]["heart_rate"]
+
+
+# -------------------------------
+# Rolling statistics
+# -------------------------------
+def test_ewma_seeded_with_first_reading():
+    detector = StreamingDetector(rules=(), alpha=0.2)
+    _feed(detector, [100.0])
+    assert _heart_rate(detector)["ewma"] == 100.0
+    _feed(detector, [50.0])
+    assert _heart_rate(detector)["ewma"] == 90.0
+    _feed(detector, [50.0])
+    assert _heart_rate(detector)["ewma"] == 82.0
+
+
+def test_learned_baseline_is_exponentially_weighted():
+    a = 0.1
+    detector = StreamingDetector(rules=(), baseline_alpha=a)
+    values = [60.0, 70.0, 65.0]
+    _feed(detector, values)
+    mean, var = values[0], 0.0
+    for x in values[1:]:
+        delta = x - mean
+        mean, var = mean + a * delta, (1 - a) * (var + a * delta * delta)
+    stats = _heart_rate(detector)
+    assert stats["baseline_mean"] == round(mean, 2)
+    assert stats["baseline_std"] == round(np.sqrt(var), 2)
+    assert not stats["baseline_pinned"]
+
+
+def test_z_score_against_pinned_baseline():
+    rule = Rule("hr_z", "heart_rate", "z", ">", 3)
+    detector = StreamingDetector(rules=(rule,))
+    detector.set_baseline("u1", "heart_rate", mean=60, std=5)
+    [onset] = _feed(detector, [80.0])
+    assert onset.event == "onset" and onset.score == pytest.approx(4.0) and onset.value == 80.0
+    [clear] = _feed(detector, [70.0])
+    assert clear.event == "clear" and clear.score == pytest.approx(2.0)
+    # A pinned baseline does not learn from the readings
+    assert _heart_rate(detector)["baseline_mean"] == 60.0
+
+
+def test_z_score_floor_for_steady_users():
+    rule = Rule("hr_z", "heart_rate", "z", ">", 3)
+    detector = StreamingDetector(rules=(rule,))
+    detector.set_baseline("u1", "heart_rate", mean=60, std=0)
+    # std floored at MIN_BASELINE_STD (2 bpm): 65 is z 2.5, not infinite
+    assert _feed(detector, [65.0]) == []
+    [onset] = _feed(detector, [67.0])
+    assert onset.score == pytest.approx(3.5)
+
+
+def test_slope_is_least_squares_over_window():
+    window = 10
+    detector = StreamingDetector(rules=(), window=window)
+    rng = np.random.default_rng(3)
+    values = 60 + np.cumsum(rng.normal(0, 1, 3 * window))
+    for i, x in enumerate(values):
+        detector.process([_reading(i, float(x))])
+        recent = values[max(0, i + 1 - window):i + 1]
+        expected = np.polyfit(np.arange(len(recent)), recent, 1)[0] if len(recent) > 1 else 0.0
+        assert _heart_rate(detector)["slope_per_sample"] == pytest.approx(expected, abs=1e-3)
+
+
+def test_slope_rule_is_per_minute():
+    rule = Rule("surge", "heart_rate", "slope", ">", 60, min_samples=5)
+    detector = StreamingDetector(rules=(rule,), window=10)
+    # +1 bpm per 1 s reading is 60 bpm/min: at, not above, the threshold
+    assert _feed(detector, [60.0 + i for i in range(10)]) == []
+    detector = StreamingDetector(rules=(rule,), window=10)
+    detections = _feed(detector, [60.0 + 2 * i for i in range(10)])
+    [onset] = detections
+    assert onset.score == pytest.approx(120.0)
+    # min_samples holds the rule back until the fifth reading
+    assert onset.timestamp == START + timedelta(seconds=4)
+
+
+def test_window_sums_stay_exact_past_resync():
+    detector = StreamingDetector(rules=(), window=8)
+    for i in range(_RESYNC_SAMPLES + 5):
+        detector.process([_reading(i, 60.0 + (i % 8))])
+    # Last 8 samples are 5, 6, 7, 0, 1, 2, 3, 4 (+60)
+    recent = 60.0 + (np.arange(_RESYNC_SAMPLES - 3, _RESYNC_SAMPLES + 5) % 8)
+    expected = np.polyfit(np.arange(8), recent, 1)[0]
+    assert _heart_rate(detector)["slope_per_sample"] == pytest.approx(expected, abs=1e-3)
+
+
+def test_same_user_twice_in_a_frame_matches_sequential():
+    batch = [_reading(i, hr) for i, hr in enumerate([60.0, 90.0, 75.0])]
+    together = StreamingDetector()
+    together.process(batch)
+    apart = StreamingDetector()
+    for reading in batch:
+        apart.process([reading])
+    assert together.user_stats("u1") == apart.user_stats("u1")
+
+
+def test_capacity_grows():
+    detector = StreamingDetector(rules=(), capacity=2)
+    detector.process([_reading(0, 60.0 + n, user_id=f"u{n}") for n in range(5)])
+    assert detector.capacity >= 5
+    assert [_heart_rate(detector, f"u{n}")["ewma"] for n in range(5)] == [60.0, 61.0, 62.0, 63.0, 64.0]
+
+
+# -------------------------------
+# Rules
+# -------------------------------
+def test_default_rules_onset_and_clear_edges():
+    detector = StreamingDetector()
+    assert _feed(detector, [70.0] * 3) == []
+    detections = _feed(detector, [200.0] * 10)
+    assert [(d.rule, d.event, d.severity) for d in detections] == [("tachycardia", "onset", "critical")]
+    detections = _feed(detector, [70.0] * 20)
+    assert [(d.rule, d.event) for d in detections] == [("tachycardia", "clear")]
+    assert detector.stats()["detections"] == 1 and detector.stats()["active"] == 0
+
+
+def test_exempt_activity_and_grace_period():
+    rule = next(rule for rule in DEFAULT_RULES if rule.name == "tachycardia")
+    detector = StreamingDetector(rules=(rule,), exempt_grace_samples=5)
+    assert _feed(detector, [170.0] * 3, activity="running") == []
+    # Still settling for 5 readings after the run
+    detections = _feed(detector, [170.0] * 8, activity="resting")
+    [onset] = detections
+    assert onset.event == "onset" and onset.timestamp == START + timedelta(seconds=5)
+
+
+def test_rule_validation():
+    with pytest.raises(ValueError):
+        Rule("bad", "glucose", "value", ">", 1)
+    with pytest.raises(ValueError):
+        Rule("bad", "heart_rate", "median", ">", 1)
+    with pytest.raises(ValueError):
+        Rule("bad", "heart_rate", "value", ">=", 1)
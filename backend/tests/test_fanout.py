@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+from app.fanout import FanoutHub
+
+
+def _render(user_id, reading, metrics):
+    if metrics is not None:
+        reading = {name: value for name, value in reading.items() if name in metrics}
+    return f"{user_id}:{sorted(reading.items())}"
+
+
+class SlowClient:
+    """send() that records messages and blocks until release()"""
+
+    def __init__(self):
+        self.messages = []
+        self.released = asyncio.Event()
+
+    def release(self):
+        self.released.set()
+
+    async def send(self, message):
+        await self.released.wait()
+        self.messages.append(message)
+
+
+async def _drain(subscriber):
+    while subscriber.pending():
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+# -------------------------------
+# Slow subscribers
+# -------------------------------
+def test_events_drop_the_oldest_when_full():
+    async def run():
+        hub = FanoutHub(_render, max_events=3)
+        client = SlowClient()
+        subscriber = hub.subscribe(client.send, ["u1"])
+        for i in range(6):
+            hub.publish_event("u1", f"alert {i}")
+        client.release()
+        await _drain(subscriber)
+        await hub.unsubscribe(subscriber)
+        return client.messages, subscriber.dropped
+
+    messages, dropped = asyncio.run(run())
+    assert messages == ["alert 3", "alert 4", "alert 5"]
+    assert dropped == 3
+
+
+def test_readings_are_coalesced_per_user():
+    async def run():
+        hub = FanoutHub(_render)
+        client = SlowClient()
+        subscriber = hub.subscribe(client.send, ["u1", "u2"])
+        await asyncio.sleep(0)
+        for heart_rate in (70, 71, 72):
+            hub.publish_reading("u1", {"heart_rate": heart_rate})
+        hub.publish_reading("u2", {"heart_rate": 90})
+        assert subscriber.pending() == 2
+        client.release()
+        await _drain(subscriber)
+        await hub.unsubscribe(subscriber)
+        return client.messages, subscriber.coalesced
+
+    messages, coalesced = asyncio.run(run())
+    assert messages == ["u1:[('heart_rate', 72)]", "u2:[('heart_rate', 90)]"]
+    assert coalesced == 2
+
+
+def test_slow_subscriber_does_not_hold_back_publishing():
+    async def run():
+        hub = FanoutHub(_render)
+        slow, fast = SlowClient(), SlowClient()
+        fast.release()
+        slow_subscriber = hub.subscribe(slow.send, ["u1"])
+        fast_subscriber = hub.subscribe(fast.send, ["u1"])
+        started = time.monotonic()
+        for heart_rate in range(1000):
+            assert hub.publish_reading("u1", {"heart_rate": heart_rate}) == 2
+            await asyncio.sleep(0)
+        elapsed = time.monotonic() - started
+        assert slow.messages == [] and slow_subscriber.pending() == 1
+        await hub.unsubscribe(slow_subscriber)
+        await hub.unsubscribe(fast_subscriber)
+        return elapsed, fast.messages
+
+    elapsed, fast_messages = asyncio.run(run())
+    assert elapsed < 1.0
+    assert fast_messages[-1] == "u1:[('heart_rate', 999)]"
+
+
+def test_metric_selection_is_rendered_per_subscriber():
+    async def run():
+        hub = FanoutHub(_render)
+        full, partial = SlowClient(), SlowClient()
+        full.release()
+        partial.release()
+        full_subscriber = hub.subscribe(full.send, ["u1"])
+        partial_subscriber = hub.subscribe(partial.send)
+        hub.follow(partial_subscriber, "u1", frozenset({"heart_rate"}))
+        hub.publish_reading("u1", {"heart_rate": 70, "spo2": 98})
+        await _drain(full_subscriber)
+        await _drain(partial_subscriber)
+        return full.messages, partial.messages
+
+    full_messages, partial_messages = asyncio.run(run())
+    assert full_messages == ["u1:[('heart_rate', 70), ('spo2', 98)]"]
+    assert partial_messages == ["u1:[('heart_rate', 70)]"]
+
+
+# -------------------------------
+# Subscriptions
+# -------------------------------
+def test_closed_subscriber_cannot_follow():
+    async def run():
+        hub = FanoutHub(_render)
+        routes = []
+        hub.route_listener = lambda user_id, followed: routes.append((user_id, followed))
+        subscriber = hub.subscribe(SlowClient().send, ["u1"])
+        await hub.unsubscribe(subscriber)
+        hub.follow(subscriber, "u2")
+        return hub, subscriber, routes
+
+    hub, subscriber, routes = asyncio.run(run())
+    assert not hub.has_followers("u1") and not hub.has_followers("u2")
+    assert subscriber.user_ids == {}
+    assert routes == [("u1", True), ("u1", False)]
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from app.frames import FrameError, decode_frame, encode_batch_frame
+
+
+def _data(user_id, heart_rate=72):
+    return {"timestamp": "2025-01-01T00:00:00+00:00", "user_id": user_id,
+            "physiological_metrics": {"heart_rate": heart_rate, "stress_level": 20, "blood_oxygen": 98.0,
+                                      "respiratory_rate": 14.0, "hrv": 50.0},
+            "current_activity": "resting"}
+
+
+def _batch(*envelopes):
+    return json.dumps({"type": "batch", "readings": list(envelopes)})
+
+
+def test_single_frame():
+    [(user_id, reading)] = decode_frame(json.dumps({"user_id": "a", "data": _data("a")}))
+    assert user_id == "a" and reading.physiological_metrics.heart_rate == 72
+
+
+def test_batch_round_trip():
+    batch = decode_frame(_batch(*({"user_id": u, "data": _data(u)} for u in "abc")))
+    assert [user_id for user_id, _ in decode_frame(encode_batch_frame(batch))] == ["a", "b", "c"]
+
+
+def test_bad_readings_are_dropped_alone():
+    rejected = []
+    batch = decode_frame(_batch(
+        {"user_id": "a", "data": _data("a")},
+        {"user_id": "b", "data": _data("b", heart_rate=900)},       # out of range
+        {"user_id": "c", "data": _data("c", heart_rate="fast")},    # mistyped
+        {"user_id": 4, "data": _data("d")},                         # bad envelope
+        {"user_id": "e", "data": _data("e")},
+    ), rejected)
+    assert [user_id for user_id, _ in batch] == ["a", "e"]
+    assert len(rejected) == 3
+    assert rejected[0].startswith("readings[1]")
+
+
+def test_bad_readings_without_a_rejected_list():
+    batch = decode_frame(_batch({"user_id": "a", "data": _data("a", heart_rate=-1)},
+                                {"user_id": "b", "data": _data("b")}))
+    assert [user_id for user_id, _ in batch] == ["b"]
+
+
+@pytest.mark.parametrize("raw", [
+    "not json",
+    json.dumps({"user_id": "a", "data": _data("a", heart_rate=900)}),   # invalid single reading
+    json.dumps({"type": "batch", "readings": {"user_id": "a"}}),         # readings not a list
+    json.dumps({"type": "reading"}),                                     # nothing to decode
+])
+def test_invalid_frames(raw):
+    with pytest.raises(FrameError):
+        decode_frame(raw)
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import mysql, postgresql
+from sqlmodel import SQLModel, create_engine
+
+from app.models import HealthData, VitalsRollup1h, VitalsRollup1m
+from app.persistence import HealthDataWriter
+from app.rollups import (HISTORY_MAX_POINTS, ROLLUPS, _upsert, aggregate, choose_source, merge, plan_history,
+                         query_history, write_rollups)
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _row(second, heart_rate=60.0, hrv=50.0, user_id="u1"):
+    return {"user_id": user_id, "timestamp": START + timedelta(seconds=second), "heart_rate": heart_rate,
+            "spo2": 98.0, "stress": 20.0, "respiratory_rate": 14.0, "hrv": hrv}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollups.db'}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+# -------------------------------
+# Aggregation
+# -------------------------------
+def test_aggregate_buckets_and_stats():
+    [first, second] = aggregate([_row(0, 60), _row(30, 80), _row(60, 70)], 60)
+    assert first["bucket"] == START and first["count"] == 2
+    assert (first["heart_rate_min"], first["heart_rate_max"], first["heart_rate_sum"]) == (60, 80, 140)
+    assert second["bucket"] == START + timedelta(minutes=1) and second["heart_rate_count"] == 1
+
+
+def test_aggregate_skips_null_vitals():
+    [bucket] = aggregate([_row(0, hrv=None), _row(1, hrv=40.0), _row(2, hrv=60.0)], 60)
+    assert bucket["count"] == 3
+    assert (bucket["hrv_min"], bucket["hrv_max"], bucket["hrv_sum"], bucket["hrv_count"]) == (40, 60, 100, 2)
+    [empty] = aggregate([_row(0, hrv=None)], 60)
+    assert empty["hrv_min"] is None and empty["hrv_max"] is None and empty["hrv_count"] == 0
+
+
+def test_merge_combines_counts_and_ignores_missing_min_max():
+    minutes = aggregate([_row(0, hrv=None), _row(60, hrv=30.0), _row(120, hrv=None)], 60)
+    [hour] = merge(minutes, 3600)
+    assert hour["bucket"] == START and hour["count"] == 3
+    assert (hour["hrv_min"], hour["hrv_max"], hour["hrv_count"]) == (30, 30, 1)
+    assert hour["heart_rate_count"] == 3
+
+
+def test_merge_legacy_rows_without_metric_counts():
+    legacy = aggregate([_row(0), _row(1)], 60)[0]
+    legacy["hrv_count"] = None
+    [hour] = merge([legacy, aggregate([_row(60, hrv=None)], 60)[0]], 3600)
+    assert hour["hrv_count"] == 2 and hour["count"] == 3
+
+
+# -------------------------------
+# Upserts
+# -------------------------------
+def _stored(engine, model):
+    with engine.connect() as conn:
+        return [dict(row) for row in conn.execute(select(model).order_by(model.bucket)).mappings()]
+
+
+def test_sqlite_upsert_accumulates(engine):
+    with engine.begin() as conn:
+        write_rollups(conn, [_row(0, 60, hrv=None), _row(1, 90, hrv=None)])
+        write_rollups(conn, [_row(2, 50, hrv=45.0)])
+    [minute] = _stored(engine, VitalsRollup1m)
+    assert minute["count"] == 3
+    assert (minute["heart_rate_min"], minute["heart_rate_max"], minute["heart_rate_sum"]) == (50, 90, 200)
+    # The first batch had no hrv: NULL min/max must not win the scalar min()/max()
+    assert (minute["hrv_min"], minute["hrv_max"], minute["hrv_count"]) == (45, 45, 1)
+    [hour] = _stored(engine, VitalsRollup1h)
+    assert hour["count"] == 3 and hour["hrv_count"] == 1
+
+
+def test_sqlite_upsert_onto_legacy_row(engine):
+    legacy = {**aggregate([_row(0, hrv=40.0), _row(1, hrv=60.0)], 60)[0], "hrv_count": None}
+    with engine.begin() as conn:
+        conn.execute(insert(VitalsRollup1m), [legacy])
+        _upsert(conn, VitalsRollup1m, aggregate([_row(2, hrv=None)], 60))
+    [minute] = _stored(engine, VitalsRollup1m)
+    assert minute["count"] == 3 and minute["hrv_count"] == 2
+
+
+class _Capture:
+    """Connection stand-in that records the statement it is given"""
+
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.statement = None
+
+    def execute(self, statement, rows):
+        self.statement = statement
+
+
+def test_postgresql_upsert_uses_least_and_greatest():
+    conn = _Capture(postgresql.dialect())
+    _upsert(conn, VitalsRollup1m, aggregate([_row(0)], 60))
+    sql = str(conn.statement.compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (user_id, bucket) DO UPDATE" in sql
+    assert "least(coalesce(vitals_rollup_1m.heart_rate_min" in sql
+    assert "greatest(coalesce(vitals_rollup_1m.heart_rate_max" in sql
+
+
+# -------------------------------
+# History
+# -------------------------------
+def test_choose_source():
+    assert choose_source(1) is None
+    assert choose_source(59) is None
+    assert choose_source(60)[1] == "1m"
+    assert choose_source(3599)[1] == "1m"
+    assert choose_source(3600)[1] == "1h"
+    assert choose_source(10 * 86400)[1] == "1d"
+
+
+def test_plan_history():
+    # 10 minutes at the default ~500 points: raw rows, 2 s apart
+    assert plan_history(START, START + timedelta(minutes=10)) == (2, None)
+    # 1 day: 173 s asked, whole minutes from the 1m rollup
+    resolution, source = plan_history(START, START + timedelta(days=1))
+    assert source == ROLLUPS[0] and resolution == 180
+    # An explicit resolution is raised to stay under HISTORY_MAX_POINTS
+    resolution, source = plan_history(START, START + timedelta(days=30), resolution=1)
+    assert resolution >= 30 * 86400 / HISTORY_MAX_POINTS and resolution % 60 == 0
+
+
+def test_raw_history_skips_null_vitals(engine):
+    with engine.begin() as conn:
+        conn.execute(insert(HealthData), [
+            {**_row(0, hrv=None), "activity": "resting"},
+            {**_row(1, hrv=50.0), "activity": "resting"},
+        ])
+    history = query_history(engine, "u1", START, START + timedelta(minutes=1), resolution=30)
+    assert history["source"] == "raw"
+    point = history["points"][0]
+    assert point["count"] == 2
+    assert point["hrv"] == {"min": 50.0, "max": 50.0, "avg": 50.0}
+
+
+
+def test_writer_rejects_dialects_without_on_conflict(engine):
+    HealthDataWriter(engine)
+    with pytest.raises(ValueError, match="mysql is not supported"):
+        HealthDataWriter(SimpleNamespace(dialect=mysql.dialect()))
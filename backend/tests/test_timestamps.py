@@ -0,0 +1,45 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.frames import decode_frame
+from app.models import as_utc
+from app.persistence import reading_row
+
+from agents.mimic_human import RealClock, RealTimeWearableData, UserProfile
+
+
+@pytest.fixture
+def india_time():
+    """Host timezone UTC+05:30 for the duration of a test"""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "Asia/Kolkata"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+def test_as_utc():
+    ist = timezone(timedelta(hours=5, minutes=30))
+    assert as_utc(datetime(2025, 1, 1, 5, 30, tzinfo=ist)) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert as_utc(datetime(2025, 1, 1, 5, 30, tzinfo=ist)).utcoffset() == timedelta(0)
+    # Naive values are SQLite read-backs of stored UTC
+    assert as_utc(datetime(2025, 1, 1)) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def test_mimic_readings_are_stored_in_utc(india_time):
+    data = RealTimeWearableData(UserProfile(), clock=RealClock()).generate_realtime_data("resting")
+    sent = datetime.fromisoformat(data["timestamp"])
+    assert sent.utcoffset() == timedelta(hours=5, minutes=30)
+
+    [(user_id, reading)] = decode_frame(json.dumps({"user_id": "USER001", "data": data}))
+    stored = reading_row(user_id, reading)["timestamp"]
+    assert stored.utcoffset() == timedelta(0)
+    assert abs(stored - datetime.now(timezone.utc)) < timedelta(minutes=1)
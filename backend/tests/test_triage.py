@@ -0,0 +1,112 @@
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.detector import Detection
+from app.frames import decode_frame
+from app.triage import (RISK_RULE, TRIAGE_MODEL_PATH, TRIAGE_RULE, TRIAGE_STREAM, TriageEngine, TriageModel,
+                        decode_risk_detections, escalation_entries)
+
+from agents.train_triage import feature_matrix, simulate_user
+
+
+def _readings(samples):
+    frame = {"type": "batch", "readings": [{"user_id": data["user_id"], "data": data} for data, _, _ in samples]}
+    return [reading for _, reading in decode_frame(json.dumps(frame, default=str))]
+
+
+@pytest.fixture(scope="module")
+def model():
+    return TriageModel.load()
+
+
+@pytest.fixture(scope="module")
+def samples():
+    # Long enough for episodes and several activity segments
+    return simulate_user("PARITY", 1800, seed=7)
+
+
+# -------------------------------
+# Model file vs trainer
+# -------------------------------
+def test_feature_matrix_matches_trainer(model, samples):
+    expected = feature_matrix([data for data, _, _ in samples], model.features)
+    actual = model.feature_matrix(_readings(samples))
+    np.testing.assert_allclose(actual, expected)
+    # Parity is only meaningful if the session exercised the hinge features
+    assert {label for _, label, _ in samples} >= {"normal", "episode"}
+    assert (expected > 0).any(axis=0).sum() > len(model.features) // 2
+
+
+def test_score_matches_trainer_standardization(model, samples):
+    with open(TRIAGE_MODEL_PATH) as f:
+        spec = json.load(f)
+    x = (feature_matrix([data for data, _, _ in samples], model.features) - spec["mean"]) / spec["scale"]
+    expected = 1.0 / (1.0 + np.exp(-(x @ np.asarray(spec["weights"]) + spec["bias"])))
+    np.testing.assert_allclose(model.score(_readings(samples)), expected, atol=1e-9)
+
+
+# -------------------------------
+# Engine
+# -------------------------------
+class _StubModel:
+    """Scores readings with their heart rate / 100"""
+    normal_below = 0.3
+    critical_above = 0.7
+    evaluation = {}
+
+    def score(self, readings):
+        return np.array([reading.physiological_metrics.heart_rate / 100 for reading in readings])
+
+
+def _batch(*heart_rates, user_id="u1"):
+    now = datetime(2025, 1, 1)
+    frame = {"type": "batch", "readings": [
+        {"user_id": user_id, "data": {
+            "timestamp": (now + timedelta(seconds=i)).isoformat(), "user_id": user_id,
+            "physiological_metrics": {"heart_rate": hr, "stress_level": 10, "blood_oxygen": 98,
+                                      "respiratory_rate": 14, "hrv": 50}}}
+        for i, hr in enumerate(heart_rates)
+    ]}
+    return decode_frame(json.dumps(frame))
+
+
+def test_tiers_onset_and_clear_within_one_frame():
+    engine = TriageEngine(_StubModel())
+    detections, escalations = engine.process(_batch(10, 80, 90, 20))
+    assert [(d.rule, d.event) for d in detections] == [(TRIAGE_RULE, "onset"), (TRIAGE_RULE, "clear")]
+    assert escalations == []
+    assert engine.stats()["normal"] == 2 and engine.stats()["critical"] == 2
+
+
+def test_escalation_cooldown():
+    now = [0.0]
+    engine = TriageEngine(_StubModel(), escalate_cooldown=30, clock=lambda: now[0])
+    assert len(engine.process(_batch(50))[1]) == 1
+    assert engine.process(_batch(50))[1] == []
+    now[0] = 31.0
+    assert len(engine.process(_batch(50))[1]) == 1
+    assert engine.cooled_down == 1
+
+
+def test_escalation_entries_carry_reply_route():
+    engine = TriageEngine(_StubModel())
+    _, escalations = engine.process(_batch(50))
+    [(stream, fields)] = escalation_entries(escalations, reply_to="vitals:raw:3", node="node-a")
+    assert stream == TRIAGE_STREAM
+    assert fields["reply_to"] == "vitals:raw:3" and fields["node"] == "node-a"
+    assert [user_id for user_id, _ in decode_frame(fields["frame"])] == ["u1"]
+    assert escalation_entries([], reply_to="vitals:raw:3") == []
+
+
+def test_decode_risk_detections():
+    payload = json.dumps([{
+        "user_id": "u1", "rule": RISK_RULE, "metric": "risk", "stat": "llm", "value": 0.9, "score": 0.9,
+        "threshold": 0.5, "severity": "critical", "timestamp": "2025-01-01T00:00:00",
+        "description": "SpO2 falling", "event": "onset",
+    }]).encode()
+    [detection] = decode_risk_detections(payload)
+    assert isinstance(detection, Detection)
+    assert detection.timestamp == datetime(2025, 1, 1) and detection.event == "onset"
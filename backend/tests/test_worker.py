@@ -0,0 +1,153 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+from sqlmodel import SQLModel, create_engine
+
+from app.broker import DETECTOR_GROUP, InMemoryStreamBroker, raw_stream
+from app.frames import PhysiologicalMetrics, WearableReading, encode_batch_frame
+from app.models import HealthData, VitalsRollup1m
+from app.persistence import HealthDataWriter
+from app.worker import DetectionWorker
+
+STREAM = raw_stream(0)
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _frame(*seconds, user_id="u1"):
+    return {"frame": encode_batch_frame([
+        (user_id, WearableReading(
+            timestamp=START + timedelta(seconds=i), user_id=user_id,
+            physiological_metrics=PhysiologicalMetrics(heart_rate=70, stress_level=10, blood_oxygen=98,
+                                                       respiratory_rate=14, hrv=50)))
+        for i in seconds
+    ])}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'worker.db'}")
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def _stored(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(HealthData)).scalar()
+
+
+def _rolled_up(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.sum(VitalsRollup1m.count))).scalar()
+
+
+async def _started(broker, consumer, writer=None):
+    worker = DetectionWorker(broker, [0], consumer, writer=writer)
+    await worker.setup()
+    return worker
+
+
+# -------------------------------
+# Acks
+# -------------------------------
+def test_ack_stores_high_water_mark():
+    async def run():
+        broker = InMemoryStreamBroker()
+        worker = await _started(broker, "a")
+        [_, second] = await broker.publish([(STREAM, _frame(0, 1)), (STREAM, _frame(2))])
+        assert await worker.poll(block_ms=0) == 2
+        assert await broker.pending(STREAM, DETECTOR_GROUP) == 0
+        assert await broker.high_water(STREAM, DETECTOR_GROUP) == second
+        assert worker.readings == 3
+
+    asyncio.run(run())
+
+
+def test_ack_waits_for_commit(engine):
+    async def run():
+        broker = InMemoryStreamBroker()
+        writer = HealthDataWriter(engine)
+        worker = await _started(broker, "a", writer)
+        await broker.publish([(STREAM, _frame(0, 1))])
+        await worker.poll(block_ms=0)
+        # Readings only buffered: the entry stays pending
+        assert await broker.pending(STREAM, DETECTOR_GROUP) == 1
+        assert (await worker.stats())["unacked"] == 1
+        await writer.flush()
+        await worker.ack_durable()
+        assert await broker.pending(STREAM, DETECTOR_GROUP) == 0
+        assert _stored(engine) == 2
+
+    asyncio.run(run())
+
+
+def test_poison_entry_is_acked():
+    async def run():
+        broker = InMemoryStreamBroker()
+        worker = await _started(broker, "a")
+        await broker.publish([(STREAM, {"frame": b"not json"})])
+        await worker.poll(block_ms=0)
+        assert worker.rejected == 1
+        assert await broker.pending(STREAM, DETECTOR_GROUP) == 0
+
+    asyncio.run(run())
+
+
+# -------------------------------
+# Crashes
+# -------------------------------
+def test_reclaim_after_crash_before_commit(engine):
+    async def run():
+        broker = InMemoryStreamBroker()
+        crashed = await _started(broker, "a", HealthDataWriter(engine))
+        await broker.publish([(STREAM, _frame(0, 1, 2))])
+        await crashed.poll(block_ms=0)   # buffered, never written
+
+        worker = await _started(broker, "b", HealthDataWriter(engine))
+        assert await worker.reclaim(0) == 1
+        await worker.writer.flush()
+        await worker.ack_durable()
+        assert worker.readings == 3
+        assert await broker.pending(STREAM, DETECTOR_GROUP) == 0
+        assert _stored(engine) == 3
+
+    asyncio.run(run())
+
+
+def test_redelivery_after_commit_is_not_stored_twice(engine):
+    async def run():
+        broker = InMemoryStreamBroker()
+        crashed = await _started(broker, "a", HealthDataWriter(engine))
+        await broker.publish([(STREAM, _frame(0, 1, 2))])
+        await crashed.poll(block_ms=0)
+        await crashed.writer.flush()     # committed, then crashed before the ack
+
+        worker = await _started(broker, "b", HealthDataWriter(engine))
+        assert await worker.reclaim(0) == 1
+        await worker.writer.flush()
+        await worker.ack_durable()
+        assert worker.writer.duplicates == 3 and worker.writer.rows_written == 0
+        assert _stored(engine) == 3
+        # Rollups count each reading once
+        assert _rolled_up(engine) == 3
+        assert await broker.pending(STREAM, DETECTOR_GROUP) == 0
+
+    asyncio.run(run())
+
+
+def test_high_water_mark_survives_restart():
+    async def run():
+        broker = InMemoryStreamBroker()
+        worker = await _started(broker, "a")
+        await broker.publish([(STREAM, _frame(0)), (STREAM, _frame(1))])
+        await worker.poll(block_ms=0)
+        entries = broker.streams[STREAM].entries
+
+        # A new worker process on the same partition: the lost-ack redelivery is skipped
+        restarted = await _started(broker, "b")
+        restarted.process_entries(STREAM, entries)
+        assert restarted.duplicates == 2 and restarted.readings == 0
+        assert restarted.detector.user_stats("u1") is None
+
+    asyncio.run(run())